@@ -1,13 +1,27 @@
 from importlib import metadata
 import streamlit as st
-from io import BytesIO
-import zipfile
 import os
-import pandas as pd 
-from data_generator import DataGenerator
+import tempfile
 from db_connection import DBConnection
 from table_schema import TableSchema
-from data_converter import DataConverter
+from catalog import CatalogIntrospector
+from data_generator import GENERATION_MODES
+from glue_catalog import GlueCatalog
+from response_cache import ResponseCache, DEFAULT_CACHE_DIR
+from referential_integrity import FANOUTS
+from job_runner import JobSpec, read_sample_file
+from job_service import JobService, FINISHED
+from metrics import report_rows
+from pg_sampler import SAMPLING_MODES
+
+GENERATION_MODE_LABELS = {
+    'rows': "Model writes every row",
+    'spec': "Model writes a column spec, rows are generated locally",
+    'synth': "Statistical model fitted on the sample, the model only writes free text values",
+}
+
+# Largest archive offered for download in the browser, see show_job_result
+MAX_DOWNLOAD_MB = int(os.environ.get('MAX_DOWNLOAD_MB', 500))
 
 
 def main():
@@ -35,19 +49,40 @@ def main():
 
         if st.button("Connect to Database"):
             dbobj = DBConnection()
-            conn = dbobj.create_connection(dbname, user, password, host, port)
-            if conn:
+            # Sessions connecting to the same database share one pool instead of one backend each
+            pool = dbobj.get_connection_pool(dbname, user, password, host, port)
+            if pool:
                 st.success("Connected to the database successfully!")
-                st.session_state.conn = conn
-                st.session_state.tables = dbobj.get_tables(conn)
-                st.session_state.relationships = dbobj.get_table_relationships(conn)
+                st.session_state.pool = pool
+                # Generation jobs connect on their own, through the same shared pool
+                st.session_state.db_params = {'dbname': dbname, 'user': user, 'password': password, 'host': host, 'port': port}
+                with pool.connection() as conn:
+                    # Connecting again reloads the catalog, the schema may have changed since
+                    TableSchema().refresh(conn)
+                    st.session_state.tables = dbobj.get_tables(conn)
+                    st.session_state.relationships = dbobj.get_table_relationships(conn)
+                if dbobj.error:
+                    st.error(dbobj.error)
             else:
+                st.error(dbobj.error)
                 st.error("Failed to connect to the database. Please check your credentials.")
         
-        if 'conn' in st.session_state and 'tables' in st.session_state:
-            selected_tables = st.multiselect("Select Tables", st.session_state.tables)
+        if 'pool' in st.session_state and 'tables' in st.session_state:
+            with st.session_state.pool.connection() as conn:
+                if st.button("Refresh Schema"):
+                    TableSchema().refresh(conn)
+                    dbobj = DBConnection()
+                    st.session_state.tables = dbobj.get_tables(conn)
+                    st.session_state.relationships = dbobj.get_table_relationships(conn)
+                    if dbobj.error:
+                        st.error(dbobj.error)
+                row_estimates = CatalogIntrospector().get_catalog(conn).row_estimates
+            selected_tables = st.multiselect(
+                "Select Tables", st.session_state.tables,
+                format_func=lambda table: f"{table} (~{row_estimates[table]:,} rows)" if row_estimates.get(table) is not None else table
+            )
             if selected_tables:
-                generate_data_flow(gen_type, selected_tables)
+                generate_data_flow(gen_type, selected_tables, {'type': 'postgres', **st.session_state.db_params})
 
     elif option == "AWS Glue Catalog" and api_key:
         gen_type = "glue"
@@ -63,19 +98,18 @@ def main():
             athena_client = dbobj.get_athena_client(access_key, secret_key, region)
 
             st.session_state.client = athena_client
-            response = athena_client.list_table_metadata(CatalogName='AwsDataCatalog',
-            DatabaseName=glue_database)
-        
-            metadata = response['TableMetadataList']
-
-            st.session_state.tables = [item['Name'] for item in metadata]
+            st.session_state.tables = GlueCatalog(athena_client).list_tables(glue_database, refresh=True)
             
             st.success("Connected to AWS Glue Catalog!")    
             
         if 'tables' in st.session_state and 'client' in st.session_state:
+            if st.button("Refresh Catalog"):
+                st.session_state.tables = GlueCatalog(st.session_state.client).list_tables(glue_database, refresh=True)
             selected_tables = st.multiselect("Select Tables", st.session_state.tables)
             if selected_tables:
-                generate_data_flow(gen_type, selected_tables, database=glue_database, client=st.session_state.client)
+                source = {'type': 'glue', 'database': glue_database, 'region': region,
+                          'aws_access_key_id': access_key, 'aws_secret_access_key': secret_key}
+                generate_data_flow(gen_type, selected_tables, source)
 
     elif option == "Upload a Sample File" and api_key:
         gen_type = "file"
@@ -86,98 +120,212 @@ def main():
         if uploaded_file:
             st.success(f"File {uploaded_file.name} uploaded successfully!")
             # Read the uploaded file and generate data based on its schema
-            if uploaded_file.name.endswith(".csv"):
-                data = pd.read_csv(uploaded_file)
-            elif uploaded_file.name.endswith(".json"):
-                data = pd.read_json(uploaded_file)
-            elif uploaded_file.name.endswith(".xlsx"):
-                data = pd.read_excel(uploaded_file)
-            elif uploaded_file.name.endswith(".parquet"):
-                data = pd.read_parquet(uploaded_file)
-            
+            data = read_sample_file(uploaded_file, uploaded_file.name)
+
             st.write("Sample of uploaded data:")
             st.dataframe(data.head())
 
-            generate_data_flow(gen_type, [uploaded_file.name], data=data)
+            # Jobs read the sample from disk, they may outlive this session
+            if 'upload_dir' not in st.session_state:
+                st.session_state.upload_dir = tempfile.mkdtemp(prefix='upload-')
+            path = os.path.join(st.session_state.upload_dir, os.path.basename(uploaded_file.name))
+            if not os.path.exists(path) or os.path.getsize(path) != uploaded_file.size:
+                with open(path, 'wb') as f:
+                    f.write(uploaded_file.getbuffer())
+            generate_data_flow(gen_type, [os.path.basename(uploaded_file.name)], {'type': 'file', 'path': path})
 
 
-def generate_data_flow(gen_type, selected_tables, database=None, client=None, data=None):
+@st.cache_resource
+def get_response_cache():
+    """One response cache shared by every session of this app."""
+    return ResponseCache(os.environ.get('RESPONSE_CACHE_DIR', DEFAULT_CACHE_DIR))
+
+
+@st.cache_resource
+def get_job_service():
+    """One job service shared by every session, jobs survive reruns and reconnects."""
+    return JobService(max_workers=int(os.environ.get('GENERATION_JOB_WORKERS', 2)), cache=get_response_cache())
+
+
+def generate_data_flow(gen_type, selected_tables, source):
     format_options = ['CSV', 'JSON', 'EXCEL', 'PARQUET']
     selected_format = st.selectbox("Select Export Format", format_options)
 
-    no_of_records_options = [5, 50, 500, 1000]
-    selected_no_of_records = st.selectbox("Enter number of records (max 1000):", no_of_records_options)
+    no_of_records_options = [5, 50, 500, 1000, 10000, 100000, 1000000, 10000000]
+    selected_no_of_records = st.selectbox("Enter number of records:", no_of_records_options)
+
+    max_workers = st.number_input("Parallel requests", min_value=1, max_value=32, value=4,
+                                  help="Maximum number of tables generated at the same time")
+
+    shard_size = st.number_input("Rows per request", min_value=50, max_value=1000, value=500,
+                                 help="Larger row counts are split into parallel requests of this size")
+    shard_workers = st.number_input("Parallel requests per table", min_value=1, max_value=64, value=8)
+
+    fanout = 'uniform'
+    # Spec mode needs a database schema
+    generation_mode = st.radio(
+        "Generation mode", GENERATION_MODES if gen_type == 'postgres' else [mode for mode in GENERATION_MODES if mode != 'spec'],
+        format_func=GENERATION_MODE_LABELS.get,
+    )
+    if gen_type == 'postgres':
+        fanout = st.selectbox("Children per parent row", FANOUTS,
+                              help="How foreign keys are spread over the parent rows: at random, evenly, or skewed to a few parents")
+
+    stream = st.checkbox("Stream responses", value=False,
+                         help="Convert rows while the model is still writing them and keep complete rows of cut-off responses")
+
+    load_into_db = False
+    if gen_type == 'postgres':
+        load_into_db = st.checkbox("Load into target database", value=False,
+                                   help="COPY the generated rows into the connected database, parents before children")
+        if load_into_db:
+            truncate_tables = st.checkbox("Truncate tables first", value=False)
+            rebuild_indexes = st.checkbox("Drop and rebuild indexes", value=False,
+                                          help="Faster for very large loads")
+            batch_rows = st.number_input("Rows per COPY batch", min_value=1000, max_value=1000000, value=50000, step=1000)
+
+    upload_to_s3 = st.checkbox("Upload to S3", value=False,
+                               help="Write the files straight to a bucket"
+                                    + (", into each table's location in the catalog" if gen_type == 'glue' else ""))
+    if upload_to_s3:
+        s3_location = st.text_input("S3 location", placeholder="s3://bucket/prefix/",
+                                    help="For tables without a location in the catalog" if gen_type == 'glue' else None)
+        s3_endpoint = st.text_input("S3 endpoint URL", help="For S3-compatible storage like MinIO, empty for AWS")
+
+    sampling = 'tablesample'
+    if gen_type == 'postgres':
+        sampling = st.radio(
+            "Sampling", SAMPLING_MODES,
+            format_func=lambda mode: "Random rows and table statistics" if mode == 'tablesample' else "First rows of every table",
+            help="Random rows are read with TABLESAMPLE and columns are profiled from pg_stats, on the server")
+
+    sample_tokens = st.number_input("Sample token budget", min_value=200, max_value=8000, value=1000, step=100,
+                                    help="Samples are sent to the model as a column profile of at most this many tokens")
+
+    use_cache = st.checkbox("Reuse cached responses", value=True,
+                            help="Identical requests are answered from a local cache instead of calling the model again")
+    refresh_cache = use_cache and st.checkbox("Refresh cache", value=False,
+                                              help="Call the model again and replace the cached responses")
 
     if st.button("Generate Data"):
-        all_data_files = []
-        dcobj = DataConverter()
-        dgobj = DataGenerator()
+        sinks = []
+        if load_into_db:
+            sinks.append({'type': 'postgres', 'truncate': truncate_tables, 'rebuild_indexes': rebuild_indexes,
+                          'batch_rows': batch_rows})
+        if upload_to_s3:
+            if not s3_location and gen_type != 'glue':
+                st.error("Enter the S3 location to upload to.")
+                return
+            sinks.append({'type': 's3', 'location': s3_location or None, 'endpoint_url': s3_endpoint or None})
+        spec = JobSpec(
+            source, tables={table: selected_no_of_records for table in selected_tables}, formats=[selected_format], sinks=sinks,
+            generation={'max_workers': max_workers, 'shard_size': shard_size, 'shard_workers': shard_workers,
+                        'mode': generation_mode, 'stream': stream, 'fanout': fanout, 'sample_tokens': sample_tokens, 'sampling': sampling,
+                        'cache': use_cache, 'refresh_cache': refresh_cache})
+        service = get_job_service()
+        # Drop the files of the previous run of this session
+        if st.session_state.get('job_id'):
+            service.remove(st.session_state.job_id)
+        # The job runs in the background, this script run only submits it
+        st.session_state.job_id = service.submit(spec, api_key=st.session_state.api_key)
 
-        if gen_type=='file' and data is not None:
-            # If data comes from file, use the data directly
-            st.write("Generating data based on the uploaded file...")
-            
-            generated_data = dgobj.generate_data_for_files(selected_tables[0], data, selected_no_of_records)
-            for table, data in generated_data.items():
-                if data:
-                    st.write(f"Generated Data for {table}:")
-                    st.code(data[:1000] + "..." if len(data) > 1000 else data, language='sql')
-                    file_name_without_ext = os.path.splitext(table)[0]
-                    converted_data, filename = dcobj.convert_data_to_format(data, selected_format, file_name_without_ext)
-                    all_data_files.append((converted_data, filename))
-                else:
-                    st.error(f"No data generated for {table}.")
-
-        elif gen_type=='postgres':
-            # If data comes from the database or AWS Glue
-            tsobj = TableSchema()
-            schemas = {table: tsobj.get_table_schema(table, st.session_state.conn) for table in selected_tables}
-            generated_data = dgobj.generate_data_for_tables(st.session_state.conn, selected_tables, schemas, st.session_state.relationships, selected_no_of_records)
-
-            for table, data in generated_data.items():
-                if data:
-                    st.write(f"Generated Data for {table}:")
-                    st.code(data[:1000] + "..." if len(data) > 1000 else data, language='sql')
-
-                    converted_data, filename = dcobj.convert_data_to_format(data, selected_format, table)
-                    all_data_files.append((converted_data, filename))
-                else:
-                    st.error(f"No data generated for {table}.")
-
-        elif gen_type=='glue':
-            # If data comes from the database or AWS Glue
-            response = client.list_table_metadata(CatalogName='AwsDataCatalog',
-            DatabaseName=database)
-        
-            metadata = response['TableMetadataList']
+    job_id = st.session_state.get('job_id')
+    if job_id:
+        job = get_job_service().status(job_id)
+        if job is None:
+            st.info("The last generation job is no longer available.")
+        elif job['status'] in FINISHED:
+            show_job_result(job, selected_format)
+        else:
+            show_job_progress(job_id)
 
-            schemas  = {item['Name']:item['Columns'] for item in metadata if item['Name'] in selected_tables}
 
-            generated_data = dgobj.generate_data_for_athena_tables(client, selected_tables, schemas, selected_no_of_records, database)
+@st.fragment(run_every=1)
+def show_job_progress(job_id):
+    """Poll a running job once a second without rerunning the whole page."""
+    service = get_job_service()
+    job = service.status(job_id)
+    if job is None or job['status'] in FINISHED:
+        st.rerun()
 
-            for table, data in generated_data.items():
-                if data:
-                    st.write(f"Generated Data for {table}:")
-                    st.code(data[:1000] + "..." if len(data) > 1000 else data, language='sql')
+    eta = f", about {job['eta']:.0f}s left" if job['eta'] is not None else ""
+    st.progress(min(job['progress'], 1.0), text=f"{job['status'].capitalize()}: {job['rows']:,} of {job['target']:,} rows{eta}")
+    for table, progress in job['tables'].items():
+        st.caption(f"{table}: {progress['rows']:,} of {progress['target']:,} rows")
+    usage = job['usage']
+    st.caption(f"{usage['prompt_tokens'] + usage['completion_tokens']:,} tokens in {usage['requests']} requests")
+    if st.button("Cancel Generation"):
+        service.cancel(job_id)
 
-                    converted_data, filename = dcobj.convert_data_to_format(data, selected_format, table)
-                    all_data_files.append((converted_data, filename))
-                else:
-                    st.error(f"No data generated for {table}.")
-        # Provide download link
-        if all_data_files:
-            zip_buffer = BytesIO()
-            with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
-                for file_content, file_name in all_data_files:
-                    zip_file.writestr(file_name, file_content)
 
+def show_resume_button(job):
+    """Offer to run a job again that didn't finish every table, reusing the tables it finished."""
+    if st.button("Resume Generation", help="Generate only the tables that didn't finish"):
+        st.session_state.job_id = get_job_service().resume(job['id'])
+        st.rerun()
+
+
+def show_job_result(job, selected_format):
+    if job['status'] == 'cancelled':
+        st.warning("Generation cancelled.")
+        show_resume_button(job)
+        return
+    if job['status'] == 'failed':
+        st.error(f"Generation failed: {job['error']}")
+        show_resume_button(job)
+        return
+
+    result = job['result']
+    for table, preview in result['previews'].items():
+        st.write(f"Generated Data for {table}:")
+        st.code(preview + "..." if len(preview) == 1000 else preview, language='sql')
+    for table, rows in result['loaded'].items():
+        st.success(f"Loaded {rows} rows into {table}.")
+    if result['uploaded']:
+        st.success(f"Uploaded {', '.join(result['uploaded'])}.")
+    if result['validation']:
+        st.dataframe([{'table': table, 'valid rows': summary['valid'], 'requested': summary['target'],
+                       **{f"rejected: {check.replace('_', ' ')}": count for check, count in summary['rejected'].items()}}
+                      for table, summary in result['validation'].items()], hide_index=True)
+    for message in result['warnings'].values():
+        st.warning(message)
+    for message in result['errors'].values():
+        st.error(message)
+    if result['errors']:
+        show_resume_button(job)
+
+    usage = job['usage']
+    st.caption(f"{usage['prompt_tokens'] + usage['completion_tokens']:,} tokens in {usage['requests']} requests, {job['elapsed']:.0f}s")
+    stats = get_response_cache().stats()
+    st.caption(f"Response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['size_bytes'] / 1e6:.1f} MB on disk")
+
+    if job['metrics']:
+        with st.expander("Timings and tokens per table"):
+            st.dataframe(report_rows(job['metrics']), hide_index=True)
+            st.download_button("Download metrics", data=get_job_service().prometheus(job['id']),
+                               file_name=f"job_{job['id'][:8]}_metrics.prom", mime="text/plain")
+
+    # Provide download link
+    if job['archive']:
+        size = os.path.getsize(job['archive'])
+        if size > MAX_DOWNLOAD_MB * 1024 * 1024:
+            # The browser download goes through the server's memory, large archives stay on disk
+            st.info(f"The archive is {size / 1e6:,.0f} MB, too large to download here. It is at {job['archive']}; "
+                    "use the Upload to S3 option or the headless runner (app/cli.py) for large jobs.")
+        else:
+            # Read only when the button is clicked, not on every rerun of the page
             st.download_button(
                 label=f"Download All Generated Data as {selected_format}",
-                data=zip_buffer.getvalue(),
+                data=lambda: read_file(job['archive']),
                 file_name=f"generated_data_{selected_format.lower()}.zip",
                 mime="application/zip"
             )
 
 
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
 if __name__ == "__main__":
     main()
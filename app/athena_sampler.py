@@ -0,0 +1,110 @@
+import time
+from io import BytesIO
+from typing import Dict, List
+from urllib.parse import urlparse
+
+import pandas as pd
+
+DEFAULT_OUTPUT_LOCATION = 's3://test-data-gen-sample-athena/'
+# batch_get_query_execution accepts at most 50 ids per call
+BATCH_SIZE = 50
+
+
+class AthenaSampler:
+    """Sample many Athena tables at once.
+
+    All sample queries are submitted up front and polled together with adaptive backoff, so
+    sampling takes about as long as the slowest query. Results are read with the
+    get_query_results paginator, or straight from the CSV result file when an S3 client is
+    given, and returned as DataFrames.
+    """
+
+    def __init__(self, client, output_location: str = DEFAULT_OUTPUT_LOCATION, s3_client=None,
+                 initial_delay: float = 0.2, max_delay: float = 5, timeout: float = 300):
+        self.client = client
+        self.output_location = output_location
+        self.s3_client = s3_client
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+    def sample_tables(self, database: str, tables: List[str], limit: int = 10):
+        """Return ``(samples, errors)``: a DataFrame per sampled table and the error of every failed one."""
+        samples: Dict[str, pd.DataFrame] = {}
+        errors: Dict[str, str] = {}
+        pending = {}
+        for table in tables:
+            try:
+                pending[self.start_query(database, table, limit)] = table
+            except Exception as e:
+                errors[table] = str(e)
+
+        for execution_id, execution in self.wait(list(pending)).items():
+            table = pending[execution_id]
+            status = execution['Status']
+            if status['State'] != 'SUCCEEDED':
+                errors[table] = f"Query {status['State']}: {status.get('StateChangeReason', '')}"
+                continue
+            try:
+                samples[table] = self.read_results(execution)
+            except Exception as e:
+                errors[table] = str(e)
+        return samples, errors
+
+    def start_query(self, database, table, limit):
+        table_name = table.replace('"', '""')
+        response = self.client.start_query_execution(
+            QueryString=f'SELECT * FROM "{table_name}" LIMIT {int(limit)}',
+            QueryExecutionContext={'Database': database},
+            ResultConfiguration={'OutputLocation': self.output_location}
+        )
+        return response['QueryExecutionId']
+
+    def wait(self, execution_ids: List[str]):
+        """Poll all queries in one loop until each has finished; returns their QueryExecution dicts."""
+        finished = {}
+        running = list(execution_ids)
+        delay = self.initial_delay
+        deadline = time.monotonic() + self.timeout
+        while running:
+            for start in range(0, len(running), BATCH_SIZE):
+                response = self.client.batch_get_query_execution(QueryExecutionIds=running[start:start + BATCH_SIZE])
+                for execution in response['QueryExecutions']:
+                    if execution['Status']['State'] in ('SUCCEEDED', 'FAILED', 'CANCELLED'):
+                        finished[execution['QueryExecutionId']] = execution
+                for unprocessed in response.get('UnprocessedQueryExecutionIds', []):
+                    finished[unprocessed['QueryExecutionId']] = {
+                        'QueryExecutionId': unprocessed['QueryExecutionId'],
+                        'Status': {'State': 'FAILED', 'StateChangeReason': unprocessed.get('ErrorMessage', '')}
+                    }
+            running = [execution_id for execution_id in running if execution_id not in finished]
+            if not running:
+                break
+            if time.monotonic() >= deadline:
+                for execution_id in running:
+                    self.client.stop_query_execution(QueryExecutionId=execution_id)
+                    finished[execution_id] = {
+                        'QueryExecutionId': execution_id,
+                        'Status': {'State': 'CANCELLED', 'StateChangeReason': f"Timed out after {self.timeout}s"}
+                    }
+                break
+            time.sleep(delay)
+            delay = min(delay * 1.5, self.max_delay)
+        return finished
+
+    def read_results(self, execution) -> pd.DataFrame:
+        output_location = execution.get('ResultConfiguration', {}).get('OutputLocation')
+        if self.s3_client is not None and output_location:
+            location = urlparse(output_location)
+            body = self.s3_client.get_object(Bucket=location.netloc, Key=location.path.lstrip('/'))['Body'].read()
+            return pd.read_csv(BytesIO(body), dtype=str, keep_default_na=False)
+
+        rows = []
+        paginator = self.client.get_paginator('get_query_results')
+        for page in paginator.paginate(QueryExecutionId=execution['QueryExecutionId']):
+            for row in page['ResultSet']['Rows']:
+                rows.append([field.get('VarCharValue') for field in row['Data']])
+        if not rows:
+            return pd.DataFrame()
+        # The first row of a SELECT result holds the column names
+        return pd.DataFrame(rows[1:], columns=rows[0])
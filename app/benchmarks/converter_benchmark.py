@@ -0,0 +1,71 @@
+"""Compare peak memory and throughput of the DataConverter engines.
+
+Every case runs in a fresh process, so the peak RSS of one case doesn't hide the next one.
+
+    python benchmarks/converter_benchmark.py --rows 1000000 --formats CSV JSON PARQUET
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_csv(rows):
+    """Build a CSV resembling generated test data: ids, names, emails, amounts and dates."""
+    lines = ["id,name,email,amount,created_at,status"]
+    statuses = ["new", "paid", "shipped", "cancelled"]
+    for i in range(1, rows + 1):
+        lines.append(f"{i},Customer {i},customer{i}@example.com,{i % 997 * 1.37:.2f},2024-{i % 12 + 1:02d}-{i % 28 + 1:02d},{statuses[i % 4]}")
+    return "\n".join(lines) + "\n"
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(engine, format, rows, queue):
+    from data_converter import DataConverter
+
+    data = make_csv(rows)
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    converted, _ = DataConverter(engine=engine).convert_data_to_format(data, format, "bench")
+    elapsed = time.perf_counter() - started
+    queue.put({
+        'engine': engine,
+        'format': format,
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed else float('inf'),
+        'peak_mb': peak_rss_mb() - baseline,
+        'output_mb': len(converted) / 1e6,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--formats", nargs="+", default=["CSV", "JSON", "EXCEL", "PARQUET"])
+    parser.add_argument("--engines", nargs="+", default=["records", "columnar"])
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'format':<8} {'engine':<9} {'seconds':>8} {'rows/s':>12} {'peak MB':>9} {'out MB':>8}")
+    for format in args.formats:
+        for engine in args.engines:
+            queue = context.Queue()
+            process = context.Process(target=run_case, args=(engine, format, args.rows, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            print(f"{format:<8} {engine:<9} {result['seconds']:>8.2f} {result['rows_per_sec']:>12,.0f} "
+                  f"{result['peak_mb']:>9.1f} {result['output_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Database fixtures for the benchmarks: synthetic schemas on a real Postgres, or an in-memory stand-in.
+
+Set ``BENCH_DSN`` (e.g. ``postgresql://postgres@localhost/bench``) to benchmark against a real
+database; the fixture creates its tables there and drops them afterwards. Without it the
+stand-in serves the sample queries of DataGenerator from memory, so the suite runs anywhere.
+"""
+import os
+import random
+from datetime import date, timedelta
+
+COLUMNS = [
+    # (column_name, data_type, is_nullable, column_default, constraint_type), like TableSchema returns
+    ('id', 'integer', 'NO', None, 'PRIMARY KEY'),
+    ('name', 'text', 'NO', None, None),
+    ('email', 'text', 'YES', None, None),
+    ('amount', 'numeric', 'YES', None, None),
+    ('created_at', 'date', 'NO', None, None),
+    ('active', 'boolean', 'NO', None, None),
+]
+
+
+def synthetic_graph(tables, max_parents=2, seed=0):
+    """Return table names and relationships of a random DAG: every table references up to
+    ``max_parents`` earlier tables."""
+    rng = random.Random(seed)
+    names = [f"bench_t{index}" for index in range(tables)]
+    relationships = []
+    for index, child in enumerate(names[1:], start=1):
+        for parent in rng.sample(names[:index], min(index, rng.randint(1, max_parents))):
+            relationships.append({'child_table': child, 'child_column': f"{parent}_id", 'parent_table': parent,
+                                  'parent_column': 'id', 'constraint_name': f"{child}_{parent}_fkey"})
+    return names, relationships
+
+
+def sample_rows(rows, foreign_columns, seed=0):
+    rng = random.Random(seed)
+    return [
+        (i, f"Name {i}", f"user{i}@example.com", round(rng.lognormvariate(4, 1), 2),
+         date(2023, 1, 1) + timedelta(days=rng.randint(0, 700)), rng.random() < 0.5)
+        + tuple(rng.randint(1, rows) for _ in foreign_columns)
+        for i in range(1, rows + 1)
+    ]
+
+
+class StandInCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        # DataGenerator.understand_data: SELECT * FROM <table> LIMIT <n>
+        words = query.split()
+        table, limit = words[words.index('FROM') + 1], int(words[words.index('LIMIT') + 1])
+        columns, rows = self.connection.tables[table]
+        self.description = [(column,) for column in columns]
+        self.rows = rows[:limit]
+
+    def fetchall(self):
+        return self.rows
+
+
+class StandInConnection:
+    """Answers the sample queries of DataGenerator from in-memory tables."""
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def close(self):
+        pass
+
+
+class DatabaseFixture:
+    """Tables, schemas and relationships of a synthetic database, with a connection to sample them."""
+
+    def __init__(self, tables=5, sample_size=100, dsn=None, seed=0):
+        self.dsn = dsn if dsn is not None else os.environ.get('BENCH_DSN')
+        self.names, self.relationships = synthetic_graph(tables, seed=seed)
+        self.sample_size = sample_size
+        self.seed = seed
+        self.connection = None
+
+    @property
+    def is_postgres(self):
+        return bool(self.dsn)
+
+    def foreign_columns(self, table):
+        return [rel['child_column'] for rel in self.relationships if rel['child_table'] == table]
+
+    def schemas(self):
+        return {table: COLUMNS + [(column, 'integer', 'YES', None, None) for column in self.foreign_columns(table)]
+                for table in self.names}
+
+    def setup(self):
+        data = {table: sample_rows(self.sample_size, self.foreign_columns(table), self.seed + index)
+                for index, table in enumerate(self.names)}
+        if not self.is_postgres:
+            self.connection = StandInConnection({table: ([column[0] for column in schema], data[table])
+                                                 for table, schema in self.schemas().items()})
+            return self.connection
+
+        import psycopg2
+
+        self.connection = psycopg2.connect(self.dsn)
+        self.connection.autocommit = True
+        with self.connection.cursor() as cur:
+            self._drop(cur)
+            for table in self.names:
+                foreign = "".join(f", {column} integer" for column in self.foreign_columns(table))
+                cur.execute(f"CREATE TABLE {table} (id integer PRIMARY KEY, name text NOT NULL, email text, amount numeric, "
+                            f"created_at date NOT NULL, active boolean NOT NULL{foreign})")
+                placeholders = ", ".join(["%s"] * (len(COLUMNS) + len(self.foreign_columns(table))))
+                cur.executemany(f"INSERT INTO {table} VALUES ({placeholders})", data[table])
+            for rel in self.relationships:
+                cur.execute(f"ALTER TABLE {rel['child_table']} ADD CONSTRAINT {rel['constraint_name']} "
+                            f"FOREIGN KEY ({rel['child_column']}) REFERENCES {rel['parent_table']} (id)")
+        return self.connection
+
+    def teardown(self):
+        if self.connection is None:
+            return
+        if self.is_postgres:
+            with self.connection.cursor() as cur:
+                self._drop(cur)
+        self.connection.close()
+        self.connection = None
+
+    def _drop(self, cur):
+        cur.execute(f"DROP TABLE IF EXISTS {', '.join(self.names)} CASCADE")
@@ -0,0 +1,276 @@
+"""OpenAI-compatible chat completions server answering generation prompts with synthetic data.
+
+Row prompts get realistic CSV with the columns and row count the prompt asks for, spec prompts
+get a column spec and text value prompts of synth mode value pools. Responses take ``latency`` seconds to start and then arrive at
+``tokens_per_sec``; streamed responses are sent as server-sent events like the real API.
+With ``requests_per_minute`` or ``tokens_per_minute`` the server enforces a sliding one-minute
+window and answers 429 with a ``retry-after-ms`` header beyond it, like the real API.
+
+    python benchmarks/mock_llm_server.py --port 8000 --latency 0.5 --tokens-per-sec 200
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock python cli.py job.json
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+WORDS = ["alpha", "bravo", "cedar", "delta", "ember", "falcon", "granite", "harbor", "indigo", "juniper",
+         "kestrel", "lumen", "maple", "nectar", "onyx", "pine", "quartz", "river", "sable", "tundra"]
+FIRST_NAMES = ["Ava", "Ben", "Chloe", "Dev", "Elena", "Farid", "Grace", "Hiro", "Ines", "Jonas", "Kira", "Liam"]
+LAST_NAMES = ["Adams", "Brown", "Chen", "Diaz", "Evans", "Fischer", "Garcia", "Haddad", "Ito", "Jensen"]
+
+# "- name (type) ..." schema lines of table and Athena prompts
+SCHEMA_LINE = re.compile(r"^- ([^\s:(]+) \(([^)]*)\)", re.MULTILINE)
+# "- name: type, ..." lines of sample profiles, the only column list of file prompts
+PROFILE_LINE = re.compile(r"^- ([^\s:(]+): (\w+),", re.MULTILINE)
+
+
+def parse_prompt(prompt):
+    """Return the columns, row count, key offset and columns to leave empty that a prompt asks for."""
+    columns = SCHEMA_LINE.findall(prompt) or PROFILE_LINE.findall(prompt)
+    count = re.search(r"GENERATE '(\d+)'", prompt)
+    offset = re.search(r"START NUMERIC PRIMARY KEY VALUES AT (\d+)", prompt) or re.search(r"THESE ARE RECORDS (\d+) TO", prompt)
+    empty = re.search(r"LEAVE THE COLUMNS (.+?) EMPTY", prompt)
+    primary_keys = set(re.findall(r"^- ([^\s:(]+) \([^)]*\) PRIMARY KEY", prompt, re.MULTILINE))
+    return {
+        'columns': columns or [('id', 'integer'), ('name', 'text')],
+        'count': int(count.group(1)) if count else 10,
+        'offset': int(offset.group(1)) - 1 if offset else 0,
+        'empty': set(empty.group(1).split(', ')) if empty else set(),
+        'primary_keys': primary_keys,
+    }
+
+
+def value(name, data_type, row_number, rng):
+    kind = data_type.lower()
+    lower = name.lower()
+    if 'int' in kind or kind == 'serial' or lower == 'id' or lower.endswith('_id'):
+        return str(row_number if lower == 'id' or lower.endswith('_id') else rng.randint(0, 10000))
+    if any(word in kind for word in ('numeric', 'decimal', 'double', 'real', 'float')):
+        return f"{rng.lognormvariate(4, 1):.2f}"
+    if 'bool' in kind:
+        return rng.choice(['true', 'false'])
+    if 'timestamp' in kind:
+        moment = date(2023, 1, 1) + timedelta(days=rng.randint(0, 700))
+        return f"{moment.isoformat()} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+    if 'date' in kind:
+        return (date(2023, 1, 1) + timedelta(days=rng.randint(0, 700))).isoformat()
+    if 'uuid' in kind:
+        return '%08x-%04x-%04x-%04x-%012x' % (rng.getrandbits(32), rng.getrandbits(16), rng.getrandbits(16),
+                                             rng.getrandbits(16), rng.getrandbits(48))
+    if 'email' in lower:
+        return f"{rng.choice(FIRST_NAMES).lower()}.{rng.choice(LAST_NAMES).lower()}{row_number}@example.com"
+    if 'name' in lower:
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+    # Quote now and then, like the model does for text with commas
+    return f'"{text}, {rng.choice(WORDS)}"' if rng.random() < 0.1 else text
+
+
+def csv_response(prompt, seed=0):
+    request = parse_prompt(prompt)
+    rng = random.Random(seed)
+    names = [name for name, _ in request['columns']]
+    lines = [",".join(names)]
+    for position in range(request['count']):
+        row_number = request['offset'] + position + 1
+        lines.append(",".join('' if name in request['empty'] else value(name, data_type, row_number, rng)
+                              for name, data_type in request['columns']))
+    return "\n".join(lines) + "\n"
+
+
+def spec_response(prompt):
+    request = parse_prompt(prompt)
+    foreign = re.search(r"USE kind foreign_key FOR THE COLUMNS (.+?)\.\n", prompt)
+    foreign = set(foreign.group(1).split(', ')) if foreign else set()
+    columns = []
+    for name, data_type in request['columns']:
+        kind = data_type.lower()
+        if name in foreign:
+            column = {'kind': 'foreign_key'}
+        elif name in request['primary_keys']:
+            column = {'kind': 'sequence', 'start': 1, 'step': 1} if 'int' in kind else {'kind': 'uuid'}
+        elif 'int' in kind:
+            column = {'kind': 'integer', 'distribution': 'uniform', 'min': 0, 'max': 10000}
+        elif any(word in kind for word in ('numeric', 'decimal', 'double', 'real', 'float')):
+            column = {'kind': 'float', 'distribution': 'lognormal', 'mean': 4, 'std': 1, 'decimals': 2}
+        elif 'bool' in kind:
+            column = {'kind': 'boolean', 'true_rate': 0.5}
+        elif 'timestamp' in kind:
+            column = {'kind': 'timestamp', 'start': '2023-01-01', 'end': '2024-12-31'}
+        elif 'date' in kind:
+            column = {'kind': 'date', 'start': '2023-01-01', 'end': '2024-12-31'}
+        else:
+            column = {'kind': 'categorical', 'values': WORDS, 'weights': None}
+        columns.append({'name': name, 'null_rate': 0, **column})
+    return json.dumps({'columns': columns})
+
+
+def pool_response(prompt):
+    columns = re.search(r"free text columns (.+?) of the table", prompt).group(1).split(', ')
+    count = int(re.search(r"WRITE (\d+) DIFFERENT VALUES", prompt).group(1))
+    return json.dumps({name: [f"{WORDS[position % len(WORDS)]} {position}" for position in range(count)] for name in columns})
+
+
+def respond(prompt, seed):
+    if prompt.startswith("Describe how to generate"):
+        return spec_response(prompt)
+    if prompt.startswith("Write realistic values"):
+        return pool_response(prompt)
+    return csv_response(prompt, seed)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        prompt = body['messages'][-1]['content']
+        content = respond(prompt, self.server.next_seed())
+
+        finish_reason = 'stop'
+        limit = self.server.max_output_tokens
+        if limit and len(content) > limit * CHARS_PER_TOKEN:
+            content, finish_reason = content[:limit * CHARS_PER_TOKEN], 'length'
+        usage = {'prompt_tokens': math.ceil(sum(len(message['content']) for message in body['messages']) / CHARS_PER_TOKEN),
+                 'completion_tokens': math.ceil(len(content) / CHARS_PER_TOKEN)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+        retry_after = self.server.admit(usage['total_tokens'])
+        if retry_after is not None:
+            self.server.rejected += 1
+            error = json.dumps({'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}}).encode('utf-8')
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(error)))
+            self.send_header('retry-after-ms', str(int(retry_after * 1000)))
+            self.end_headers()
+            self.wfile.write(error)
+            return
+
+        time.sleep(self.server.latency)
+        if body.get('stream'):
+            self._stream(body, content, finish_reason, usage)
+        else:
+            time.sleep(usage['completion_tokens'] / self.server.tokens_per_sec)
+            response = json.dumps({
+                'id': 'chatcmpl-mock', 'object': 'chat.completion', 'created': int(time.time()), 'model': body['model'],
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': finish_reason}],
+                'usage': usage,
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+    def _stream(self, body, content, finish_reason, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        step = self.server.chunk_tokens * CHARS_PER_TOKEN
+        delay = self.server.chunk_tokens / self.server.tokens_per_sec
+
+        def send(choices, **extra):
+            chunk = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': body['model'], 'choices': choices, **extra}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+
+        try:
+            for start in range(0, len(content), step):
+                send([{'index': 0, 'delta': {'content': content[start:start + step]}, 'finish_reason': None}])
+                self.wfile.flush()
+                time.sleep(delay)
+            send([{'index': 0, 'delta': {}, 'finish_reason': finish_reason}])
+            if body.get('stream_options', {}).get('include_usage'):
+                send([], usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream
+            pass
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.2, tokens_per_sec=500, chunk_tokens=16, max_output_tokens=None,
+                 requests_per_minute=None, tokens_per_minute=None):
+        super().__init__((host, port), MockLLMHandler)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # (time, tokens) of the requests admitted in the last minute, and the requests turned away
+        self.window = deque()
+        self.rejected = 0
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.chunk_tokens = chunk_tokens
+        self.max_output_tokens = max_output_tokens
+        self.seed = 0
+        self.seed_lock = threading.Lock()
+
+    def admit(self, tokens):
+        """Count a request against the limits; returns None if admitted, else seconds to retry after."""
+        with self.seed_lock:
+            now = time.monotonic()
+            while self.window and now - self.window[0][0] >= 60:
+                self.window.popleft()
+            used = sum(count for _, count in self.window)
+            over_requests = self.requests_per_minute and len(self.window) + 1 > self.requests_per_minute
+            over_tokens = self.tokens_per_minute and used + tokens > self.tokens_per_minute
+            if not (over_requests or over_tokens):
+                self.window.append((now, tokens))
+                return None
+            # Until enough of the window has expired; the oldest request at least
+            return max(0.001, 60 - (now - self.window[0][0])) if self.window else 1.0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def next_seed(self):
+        with self.seed_lock:
+            self.seed += 1
+            return self.seed
+
+    def start(self):
+        """Serve on a daemon thread; returns the base URL for DataGenerator(base_url=...)."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=500, help="output speed of a single response")
+    parser.add_argument("--chunk-tokens", type=int, default=16, help="tokens per streamed chunk")
+    parser.add_argument("--max-output-tokens", type=int, help="cut longer responses off with finish_reason length")
+    parser.add_argument("--requests-per-minute", type=int, help="answer 429 beyond this many requests per minute")
+    parser.add_argument("--tokens-per-minute", type=int, help="answer 429 beyond this many tokens per minute")
+    args = parser.parse_args()
+    server = MockLLMServer(args.host, args.port, args.latency, args.tokens_per_sec, args.chunk_tokens, args.max_output_tokens,
+                           args.requests_per_minute, args.tokens_per_minute)
+    print(f"Serving mock chat completions at {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
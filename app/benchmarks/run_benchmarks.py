@@ -0,0 +1,286 @@
+"""Offline benchmarks of dependency sorting, generation, conversion, parallel export and ZIP export.
+
+Generation runs against the mock OpenAI-compatible server of mock_llm_server.py, and against
+the database of ``BENCH_DSN`` or an in-memory stand-in (see fixtures.py), so nothing is paid
+for. Every case runs in a fresh process and reports throughput, peak RSS and the latency of
+its stages. Results can be saved as a baseline and later runs compared against it.
+
+    python benchmarks/run_benchmarks.py --save benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baseline.json --threshold 0.2
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from io import BytesIO
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+FORMATS = ['CSV', 'JSON', 'EXCEL', 'PARQUET']
+CASES = {}
+
+
+def case(name, stage):
+    """Register a benchmark; its throughput and baseline comparison use the time of ``stage``."""
+    def register(function):
+        CASES[name] = (function, stage)
+        return function
+    return register
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Stages:
+    """Wall-clock time of the named stages of a case; repeated stages get percentiles."""
+
+    def __init__(self):
+        self.samples = {}
+
+    @contextmanager
+    def time(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def timed(self, name, function):
+        """Wrap ``function`` so that every call is recorded as the stage ``name``."""
+        def wrapper(*args, **kwargs):
+            with self.time(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def summary(self):
+        result = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[name] = {'count': len(ordered), 'total': sum(ordered),
+                            'p50': ordered[len(ordered) // 2], 'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]}
+        return result
+
+
+@case('dependency_sort', 'sort')
+def dependency_sort(args, stages):
+    from data_generator import DataGenerator
+    from fixtures import synthetic_graph
+
+    names, relationships = synthetic_graph(args.graph_tables, max_parents=3)
+    generator = DataGenerator(api_key='mock')
+    with stages.time('sort'):
+        ordered = generator.sort_tables_by_dependency(names, relationships)
+    assert len(ordered) == len(names)
+    return len(names)
+
+
+def generate_tables(args, stages, mode='rows', stream=False):
+    from data_generator import DataGenerator
+    from fixtures import DatabaseFixture
+
+    fixture = DatabaseFixture(tables=args.tables)
+    with stages.time('setup'):
+        conn = fixture.setup()
+    try:
+        # The stand-in connection only answers the LIMIT sample query, a real database is sampled on the server
+        generator = DataGenerator(shard_size=args.shard_size, shard_workers=args.shard_workers, generation_mode=mode,
+                                  stream=stream, api_key='mock', base_url=args.base_url,
+                                  sampling='tablesample' if fixture.dsn else 'limit')
+        generator.describe_table = stages.timed('sample', generator.describe_table)
+        generator.sample_table = stages.timed('sample', generator.sample_table)
+        generator._complete = stages.timed('request', generator._complete)
+        generator._complete_streamed = stages.timed('request', generator._complete_streamed)
+        with stages.time('generate'):
+            data = generator.generate_data_for_tables(conn, fixture.names, fixture.schemas(), fixture.relationships,
+                                                      args.rows, max_workers=args.max_workers)
+        if generator.errors:
+            raise RuntimeError("; ".join(generator.errors.values()))
+        return sum(content.count('\n') - 1 for content in data.values() if content)
+    finally:
+        fixture.teardown()
+
+
+@case('generate_tables', 'generate')
+def generate_rows(args, stages):
+    return generate_tables(args, stages)
+
+
+@case('generate_tables_stream', 'generate')
+def generate_rows_streamed(args, stages):
+    return generate_tables(args, stages, stream=True)
+
+
+@case('generate_tables_spec', 'generate')
+def generate_from_spec(args, stages):
+    return generate_tables(args, stages, mode='spec')
+
+
+@case('generate_tables_synth', 'generate')
+def generate_synthesized(args, stages):
+    return generate_tables(args, stages, mode='synth')
+
+
+def convert(format):
+    def run(args, stages):
+        from converter_benchmark import make_csv
+        from data_converter import DataConverter
+
+        data = make_csv(args.convert_rows)
+        output = BytesIO()
+        with stages.time('convert'):
+            DataConverter().convert_to_file(data, format, 'bench', output)
+        return args.convert_rows
+    return run
+
+
+for _format in FORMATS:
+    case(f'convert_{_format.lower()}', 'convert')(convert(_format))
+
+
+@case('zip_export', 'export')
+def zip_export(args, stages):
+    from converter_benchmark import make_csv
+    from zip_exporter import ZipExporter
+
+    data = make_csv(args.convert_rows).encode('utf-8')
+    with tempfile.TemporaryDirectory() as directory:
+        exporter = ZipExporter(max_workers=args.max_workers, directory=directory)
+        with stages.time('export'):
+            with stages.time('write'):
+                for member in range(args.zip_members):
+                    exporter.add(f"table_{member}.csv", data)
+            with stages.time('finish'):
+                exporter.finish()
+    return args.convert_rows * args.zip_members
+
+
+@case('parallel_export', 'export')
+def parallel_export(args, stages):
+    from converter_benchmark import make_csv
+    from parallel_export import ParallelExporter
+
+    data = make_csv(args.convert_rows)
+    tables = {f"table_{member}": data for member in range(args.zip_members)}
+    with tempfile.TemporaryDirectory() as directory:
+        # Always on worker processes, however small the tables
+        exporter = ParallelExporter(max_workers=args.max_workers, min_bytes=0)
+        with stages.time('export'):
+            results = exporter.export(tables, list(FORMATS), lambda table, format: os.path.join(directory, f"{table}.{format.lower()}"))
+    errors = [str(error) for _, _, _, error in results if error is not None]
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return args.convert_rows * args.zip_members
+
+
+def run_case(name, args, queue):
+    function, stage = CASES[name]
+    stages = Stages()
+    try:
+        # Imported up front, so import time doesn't count as work of the case
+        for module in ('data_converter', 'data_generator', 'fixtures', 'parallel_export', 'zip_exporter'):
+            importlib.import_module(module)
+        baseline = peak_rss_mb()
+        items = function(args, stages)
+        seconds = stages.summary()[stage]['total']
+        queue.put({'case': name, 'stage': stage, 'items': items, 'seconds': seconds,
+                   'rows_per_sec': items / seconds if seconds else None,
+                   'peak_mb': peak_rss_mb() - baseline, 'stages': stages.summary()})
+    except Exception as e:
+        queue.put({'case': name, 'error': f"{type(e).__name__}: {e}"})
+
+
+def compare(results, baseline, threshold):
+    """Print the change against the baseline; returns the cases slower by more than ``threshold``."""
+    previous = {result['case']: result for result in baseline['results'] if 'error' not in result}
+    regressions = []
+    print(f"\n{'case':<24} {'baseline s':>10} {'now s':>10} {'change':>8}")
+    for result in results:
+        before = previous.get(result['case'])
+        if before is None or 'error' in result:
+            continue
+        change = result['seconds'] / before['seconds'] - 1 if before['seconds'] else 0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{result['case']:<24} {before['seconds']:>10.3f} {result['seconds']:>10.3f} {change:>+8.0%}{flag}")
+        if change > threshold:
+            regressions.append(result['case'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=sorted(CASES))
+    parser.add_argument("--tables", type=int, default=5, help="tables of the generation benchmarks")
+    parser.add_argument("--rows", type=int, default=2000, help="rows per generated table")
+    parser.add_argument("--graph-tables", type=int, default=5000, help="tables of the dependency sort benchmark")
+    parser.add_argument("--convert-rows", type=int, default=200000, help="rows of the conversion and ZIP benchmarks")
+    parser.add_argument("--zip-members", type=int, default=8)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--shard-size", type=int, default=500)
+    parser.add_argument("--shard-workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="mock server seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=2000, help="mock server output speed per response")
+    parser.add_argument("--base-url", help="benchmark another OpenAI-compatible server instead of the mock")
+    parser.add_argument("--save", metavar="PATH", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if args.base_url is None and any(name.startswith('generate') for name in args.cases):
+        from mock_llm_server import MockLLMServer
+
+        server = MockLLMServer(latency=args.latency, tokens_per_sec=args.tokens_per_sec)
+        args.base_url = server.start()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    print(f"{'case':<24} {'items':>10} {'seconds':>8} {'items/s':>12} {'peak MB':>9}  stages")
+    for name in args.cases:
+        queue = context.Queue()
+        process = context.Process(target=run_case, args=(name, args, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        results.append(result)
+        if 'error' in result:
+            print(f"{name:<24} failed: {result['error']}")
+            continue
+        stages = ", ".join(f"{stage} {summary['total']:.3f}s" if summary['count'] == 1
+                           else f"{stage} p50 {summary['p50']:.3f}s p95 {summary['p95']:.3f}s x{summary['count']}"
+                           for stage, summary in result['stages'].items())
+        print(f"{name:<24} {result['items']:>10,} {result['seconds']:>8.2f} {result['rows_per_sec']:>12,.0f} "
+              f"{result['peak_mb']:>9.1f}  {stages}")
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(), 'platform': platform.platform(),
+        'database': 'postgres' if os.environ.get('BENCH_DSN') else 'stand-in',
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('save', 'compare', 'cases')},
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
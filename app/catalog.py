@@ -0,0 +1,150 @@
+import threading
+import time
+from typing import Dict, List
+
+# Relation kinds listed as tables: ordinary, partitioned, foreign tables, views and materialized views
+TABLE_KINDS = ('r', 'p', 'f', 'v', 'm')
+
+
+class Catalog:
+    """Snapshot of the tables, columns and keys of one database schema."""
+
+    def __init__(self, schema_name, tables, row_estimates, schemas, primary_keys, relationships):
+        self.schema_name = schema_name
+        self.tables = tables
+        # Planner estimate of the row count; None when the table was never analyzed
+        self.row_estimates = row_estimates
+        # Columns as (column_name, data_type, is_nullable, column_default, constraint_type),
+        # the same shape TableSchema.get_table_schema returns
+        self.schemas = schemas
+        self.primary_keys = primary_keys
+        # One dict per column pair; columns of a composite key share the constraint_name
+        self.relationships = relationships
+        self.loaded_at = time.time()
+
+    def get_table_schema(self, table_name):
+        return self.schemas.get(table_name)
+
+
+class CatalogIntrospector:
+    """Load the catalog of a whole schema from pg_catalog in three queries and cache it per connection."""
+
+    _cache: Dict[tuple, Catalog] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, schema_name: str = 'public', max_age: float = None):
+        self.schema_name = schema_name
+        # Cached catalogs older than max_age seconds are reloaded; None keeps them until invalidated
+        self.max_age = max_age
+
+    def get_catalog(self, conn, refresh: bool = False) -> Catalog:
+        """Return the cached catalog of the connection's database, loading it when needed."""
+        key = self._cache_key(conn)
+        with self._lock:
+            catalog = self._cache.get(key)
+        if catalog is not None and not refresh and (self.max_age is None or time.time() - catalog.loaded_at <= self.max_age):
+            return catalog
+
+        catalog = self.load(conn)
+        with self._lock:
+            self._cache[key] = catalog
+        return catalog
+
+    def invalidate(self, conn=None):
+        """Drop the cached catalog of ``conn``, or of every connection."""
+        with self._lock:
+            if conn is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(self._cache_key(conn), None)
+
+    def load(self, conn) -> Catalog:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname, c.reltuples::bigint
+                FROM pg_catalog.pg_class c
+                JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s
+                AND c.relkind = ANY(%s)
+                ORDER BY c.relname
+            """, (self.schema_name, list(TABLE_KINDS)))
+            table_rows = cur.fetchall()
+
+            cur.execute("""
+                SELECT
+                    c.relname,
+                    a.attname,
+                    pg_catalog.format_type(a.atttypid, a.atttypmod),
+                    a.attnotnull,
+                    pg_catalog.pg_get_expr(d.adbin, d.adrelid)
+                FROM pg_catalog.pg_attribute a
+                JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+                JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+                LEFT JOIN pg_catalog.pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+                WHERE n.nspname = %s
+                AND c.relkind = ANY(%s)
+                AND a.attnum > 0
+                AND NOT a.attisdropped
+                ORDER BY c.relname, a.attnum
+            """, (self.schema_name, list(TABLE_KINDS)))
+            column_rows = cur.fetchall()
+
+            cur.execute("""
+                SELECT
+                    con.conname,
+                    con.contype,
+                    child.relname,
+                    ARRAY(
+                        SELECT a.attname::text
+                        FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+                        JOIN pg_catalog.pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+                        ORDER BY k.ord
+                    ),
+                    parent.relname,
+                    parent_ns.nspname,
+                    ARRAY(
+                        SELECT a.attname::text
+                        FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+                        JOIN pg_catalog.pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+                        ORDER BY k.ord
+                    )
+                FROM pg_catalog.pg_constraint con
+                JOIN pg_catalog.pg_class child ON child.oid = con.conrelid
+                JOIN pg_catalog.pg_namespace n ON n.oid = child.relnamespace
+                LEFT JOIN pg_catalog.pg_class parent ON parent.oid = con.confrelid
+                LEFT JOIN pg_catalog.pg_namespace parent_ns ON parent_ns.oid = parent.relnamespace
+                WHERE n.nspname = %s
+                AND con.contype IN ('p', 'f')
+                ORDER BY child.relname, con.conname
+            """, (self.schema_name,))
+            constraint_rows = cur.fetchall()
+
+        tables = [name for name, _ in table_rows]
+        row_estimates = {name: (estimate if estimate is not None and estimate >= 0 else None) for name, estimate in table_rows}
+
+        primary_keys: Dict[str, List[str]] = {}
+        relationships = []
+        for name, contype, child_table, child_columns, parent_table, parent_schema, parent_columns in constraint_rows:
+            if contype == 'p':
+                primary_keys[child_table] = list(child_columns)
+            elif parent_schema == self.schema_name:
+                # Keys referencing other schemas can't be resolved within the selected tables
+                for child_column, parent_column in zip(child_columns, parent_columns):
+                    relationships.append({
+                        'child_table': child_table,
+                        'child_column': child_column,
+                        'parent_table': parent_table,
+                        'parent_column': parent_column,
+                        'constraint_name': name
+                    })
+
+        schemas = {name: [] for name in tables}
+        for table, column, data_type, not_null, default in column_rows:
+            constraint_type = 'PRIMARY KEY' if column in primary_keys.get(table, ()) else None
+            schemas[table].append((column, data_type, 'NO' if not_null else 'YES', default, constraint_type))
+
+        return Catalog(self.schema_name, tables, row_estimates, schemas, primary_keys, relationships)
+
+    def _cache_key(self, conn):
+        # The DSN identifies the database; psycopg2 masks the password in it
+        return (getattr(conn, 'dsn', None) or id(conn), self.schema_name)
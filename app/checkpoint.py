@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Dict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+
+
+class Checkpoint:
+    """Finished tables, finished shards and parent keys of a generation job, kept in ``directory``.
+
+    A table is saved with its CSV, its validity summary and the arrays of its keys referenced by
+    child tables, so a resumed job can skip it and still fill the foreign keys of its children.
+    Shards of a table still running are saved as their responses arrive and dropped once the
+    table is saved. ``manifest.json`` lists what is finished; every file is written to a temporary
+    name and renamed, so an interrupted write never leaves a unit that looks finished.
+
+    ``start(fingerprint)`` clears a checkpoint written for other inputs, e.g. other tables, row
+    counts or schemas, and ``reset`` clears it unconditionally for a fresh run.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.manifest = self._read_manifest()
+
+    @staticmethod
+    def fingerprint(*inputs) -> str:
+        """Hash the JSON of the inputs that determine what a job generates."""
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def start(self, fingerprint: str):
+        with self.lock:
+            if self.manifest.get('fingerprint') != fingerprint:
+                if self.manifest.get('tables') or self.manifest.get('shards'):
+                    logger.info("Checkpoint in %s belongs to other inputs, starting over", self.directory)
+                self._clear()
+                self.manifest['fingerprint'] = fingerprint
+                self._write_manifest()
+
+    def reset(self):
+        with self.lock:
+            self._clear()
+
+    def remove(self):
+        """Delete the checkpoint, e.g. after the job finished."""
+        with self.lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.manifest = {'tables': {}, 'shards': {}}
+
+    def has_table(self, table) -> bool:
+        return table in self.manifest['tables']
+
+    def load_table(self, table):
+        """Return the CSV text, key arrays and validity summary of a finished table."""
+        entry = self.manifest['tables'][table]
+        with open(self._path(entry['file']), encoding='utf-8') as f:
+            data = f.read()
+        keys = {}
+        if entry.get('keys'):
+            with np.load(self._path(entry['keys'])) as arrays:
+                keys = {column: arrays[column] for column in arrays.files}
+        return data, keys, entry.get('validation')
+
+    def save_table(self, table, data: str, keys: Dict[str, np.ndarray] = None, validation: Dict = None):
+        name = self._name(table)
+        entry = {'file': f"tables/{name}.csv", 'validation': validation}
+        self._write(entry['file'], data.encode('utf-8'))
+        if keys:
+            entry['keys'] = f"keys/{name}.npz"
+            self._write(entry['keys'], None, lambda f: np.savez(f, **keys))
+        with self.lock:
+            self.manifest['tables'][table] = entry
+            # The table's shards aren't needed anymore
+            shards = self.manifest['shards'].pop(table, {})
+            self._write_manifest()
+        for file in shards.values():
+            try:
+                os.remove(self._path(file))
+            except OSError:
+                pass
+
+    def shards(self, table):
+        """Return the shard store of a table for ShardedGenerator."""
+        return _ShardStore(self, table)
+
+    def load_shard(self, table, offset, count):
+        file = self.manifest['shards'].get(table, {}).get(f"{offset}:{count}")
+        if file is None:
+            return None
+        with open(self._path(file), encoding='utf-8') as f:
+            return f.read()
+
+    def save_shard(self, table, offset, count, text):
+        file = f"shards/{self._name(table)}-{offset}-{count}.csv"
+        self._write(file, text.encode('utf-8'))
+        with self.lock:
+            self.manifest['shards'].setdefault(table, {})[f"{offset}:{count}"] = file
+            self._write_manifest()
+
+    def _name(self, table):
+        # Table names may contain characters that aren't safe in file names
+        return hashlib.sha1(table.encode('utf-8')).hexdigest()[:16]
+
+    def _path(self, file):
+        return os.path.join(self.directory, file)
+
+    def _write(self, file, content: bytes, writer=None):
+        path = self._path(file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, 'wb') as f:
+            if writer is not None:
+                writer(f)
+            else:
+                f.write(content)
+        os.replace(temporary, path)
+
+    def _read_manifest(self):
+        try:
+            with open(self._path(MANIFEST), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {'tables': {}, 'shards': {}}
+        manifest.setdefault('tables', {})
+        manifest.setdefault('shards', {})
+        return manifest
+
+    def _write_manifest(self):
+        self._write(MANIFEST, json.dumps(self.manifest, indent=1).encode('utf-8'))
+
+    def _clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.manifest = {'tables': {}, 'shards': {}}
+
+
+class _ShardStore:
+    """Saved shard responses of one table, looked up by shard offset and row count."""
+
+    def __init__(self, checkpoint: Checkpoint, table: str):
+        self.checkpoint = checkpoint
+        self.table = table
+
+    def load(self, offset, count):
+        return self.checkpoint.load_shard(self.table, offset, count)
+
+    def save(self, offset, count, text):
+        self.checkpoint.save_shard(self.table, offset, count, text)
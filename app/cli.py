@@ -0,0 +1,89 @@
+"""Run a generation job from a JSON or YAML job spec without the Streamlit UI.
+
+    cd app
+    python cli.py job.yaml --output ./generated --max-workers 8
+
+The OpenAI key is read from OPENAI_API_KEY. The exit status is 1 when any table failed; run
+the same command with --resume to generate only the tables that didn't finish.
+"""
+import argparse
+import logging
+import sys
+
+from job_runner import JobRunner, JobSpec
+from metrics import STAGES, report_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate test data from a job spec.")
+    parser.add_argument("spec", help="path of the .json, .yaml or .yml job spec")
+    parser.add_argument("--output", help="output directory, overrides the spec's output")
+    parser.add_argument("--max-workers", type=int, help="tables generated and converted at the same time")
+    parser.add_argument("--stream", action="store_true", help="convert rows while they are generated")
+    parser.add_argument("--no-cache", action="store_true", help="don't reuse or store cached responses")
+    parser.add_argument("--refresh-cache", action="store_true", help="call the model again and replace cached responses")
+    parser.add_argument("--resume", action="store_true", help="continue a failed or interrupted job from its checkpoint")
+    parser.add_argument("--checkpoint-dir", help="where finished tables are checkpointed, default .checkpoint in the output")
+    parser.add_argument("--metrics", action="store_true", help="print the time, tokens and rows per table and stage")
+    parser.add_argument("--metrics-file", help="write the job's metrics in the Prometheus text format to this file")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG, INFO, WARNING or ERROR")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    spec = JobSpec.load(args.spec)
+    if args.output:
+        spec.output = args.output
+    if args.max_workers:
+        spec.generation['max_workers'] = args.max_workers
+    if args.stream:
+        spec.generation['stream'] = True
+    if args.no_cache:
+        spec.generation['cache'] = False
+    if args.refresh_cache:
+        spec.generation['refresh_cache'] = True
+    if args.resume:
+        spec.generation['resume'] = True
+    if args.checkpoint_dir:
+        spec.generation['checkpoint'] = args.checkpoint_dir
+
+    runner = JobRunner(spec)
+    result = runner.run()
+
+    for path in result['files']:
+        print(f"wrote {path}")
+    for table, rows in result['loaded'].items():
+        print(f"loaded {rows} rows into {table}")
+    for url in result['uploaded']:
+        print(f"uploaded {url}")
+    for table, summary in result['validation'].items():
+        rejected = ", ".join(f"{count} {check.replace('_', ' ')}" for check, count in summary['rejected'].items())
+        print(f"validated {table}: {summary['valid']} of {summary['target']} rows valid"
+              + (f", rejected {rejected}" if rejected else ""))
+    for message in result['warnings'].values():
+        print(f"warning: {message}", file=sys.stderr)
+    for message in result['errors'].values():
+        print(f"error: {message}", file=sys.stderr)
+    if args.metrics and result['metrics']:
+        print_metrics(result['metrics'])
+    if args.metrics_file:
+        with open(args.metrics_file, 'w') as f:
+            f.write(runner.metrics.prometheus())
+    return 1 if result['errors'] else 0
+
+
+def print_metrics(report):
+    """Print seconds per stage and the token and row counts of every table as a table."""
+    rows = report_rows(report)
+    stages = [stage for stage in STAGES if any(f'{stage}_s' in row for row in rows)]
+    counters = ['rows', 'requests', 'cache_hits', 'prompt_tokens', 'completion_tokens']
+    print(f"\n{'table':<24}" + "".join(f"{stage + ' s':>10}" for stage in stages)
+          + "".join(f"{counter:>18}" for counter in counters))
+    for row in rows:
+        print(f"{row['table']:<24}" + "".join(f"{row.get(f'{stage}_s', 0):>10.3f}" for stage in stages)
+              + "".join(f"{row.get(counter, 0):>18,}" for counter in counters))
+    print(f"elapsed {report['total']['elapsed']:.1f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import csv
+import heapq
+import itertools
+import logging
+import os
+from io import BytesIO, StringIO
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - the records engine of DataConverter is used instead
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+class NoRecordsError(ValueError):
+    """Raised when the CSV holds no rows besides its header."""
+
+
+EXTENSIONS = {'CSV': 'csv', 'JSON': 'json', 'EXCEL': 'xlsx', 'PARQUET': 'parquet'}
+
+
+class ColumnarConverter:
+    """Convert CSV to the export formats through Arrow record batches.
+
+    The CSV is parsed in blocks of ``block_size`` bytes straight into columnar buffers; all
+    columns are read as strings, like the records engine does. Rows with every field empty are
+    dropped with a vectorized mask. Rows with the wrong number of fields are padded with nulls or
+    cut to the header's width, as the records engine does, and kept in their place. CSV,
+    JSON and Parquet are written batch by batch without building a dict per row; Excel needs
+    the whole table in memory.
+    """
+
+    def __init__(self, block_size: int = 1 << 20):
+        if pa is None:
+            raise ImportError("pyarrow is required for the columnar conversion engine")
+        self.block_size = block_size
+
+    def convert(self, source, format, table_name, output):
+        """Convert ``source`` into the binary file ``output``; returns the file name.
+
+        ``source`` is CSV text or bytes, a ``pathlib.Path`` or a seekable binary file.
+        """
+        if format not in EXTENSIONS:
+            raise ValueError(f"Unsupported format: {format}")
+        filename = f"{table_name}.{EXTENSIONS[format]}"
+
+        with self._open(source) as stream:
+            fieldnames = self._header(stream)
+            if not fieldnames or any(not field for field in fieldnames):
+                raise ValueError("Fieldnames cannot be None")
+            # Arrow can only skip ragged rows, they are kept aside in row order and put back in place
+            # by _align; rows without a number go first, at the position reached when they come up
+            ragged = []
+            sequence = itertools.count()
+
+            def keep_ragged(row):
+                heapq.heappush(ragged, (-1 if row.number is None else row.number - 2, next(sequence), row))
+                return 'skip'
+
+            reader = pa_csv.open_csv(
+                stream,
+                # The stripped names replace the header, Arrow would key the columns by the raw ones
+                read_options=pa_csv.ReadOptions(block_size=self.block_size, use_threads=True, column_names=fieldnames,
+                                                skip_rows=1),
+                parse_options=pa_csv.ParseOptions(newlines_in_values=True, invalid_row_handler=keep_ragged),
+                convert_options=pa_csv.ConvertOptions(column_types={field: pa.string() for field in fieldnames},
+                                                      strings_can_be_null=False, quoted_strings_can_be_null=False),
+            )
+            batches = (self._drop_empty_rows(batch) for batch in self._align(reader, ragged))
+
+            if format == 'CSV':
+                rows = self._write_csv(batches, reader.schema, output)
+            elif format == 'JSON':
+                rows = self._write_json(batches, output)
+            elif format == 'PARQUET':
+                rows = self._write_parquet(batches, reader.schema, output)
+            else:
+                table = pa.Table.from_batches(list(batches), schema=reader.schema)
+                rows = table.num_rows
+                if rows:
+                    try:
+                        table.to_pandas().to_excel(output, index=False, engine='openpyxl')
+                    except Exception as e:
+                        raise ValueError(f"Failed to convert data to Excel format: {e}")
+
+        if rows == 0:
+            raise NoRecordsError("No records found in the provided data")
+        return filename
+
+    def _open(self, source):
+        if isinstance(source, os.PathLike):
+            return open(source, 'rb')
+        if isinstance(source, str):
+            return BytesIO(source.encode('utf-8'))
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return BytesIO(source)
+        return _Borrowed(source)
+
+    def _header(self, stream):
+        """Read the column names without consuming the stream."""
+        if not stream.seekable():
+            raise ValueError("CSV source must be seekable")
+        position = stream.tell()
+        first_line = stream.readline()
+        stream.seek(position)
+        rows = list(csv.reader(StringIO(first_line.decode('utf-8-sig'))))
+        return [field.strip() for field in rows[0]] if rows else []
+
+    def _align(self, reader, ragged):
+        """Yield the reader's batches with the skipped ragged rows padded or cut and put back in place.
+
+        ``ragged`` is a heap of ``(position, sequence, row)``. A skipped row's number counts the
+        header and every non-empty row before it, so it is the row's position among the data rows
+        plus two. Its handler runs while the block holding it is parsed, before any batch after it
+        is yielded.
+        """
+        schema = reader.schema
+        emitted = aligned = 0
+        for batch in reader:
+            offset = 0
+            while offset < batch.num_rows:
+                rows = self._take_ragged(ragged, emitted, schema)
+                if rows is not None:
+                    emitted += rows.num_rows
+                    aligned += rows.num_rows
+                    yield rows
+                    continue
+                length = batch.num_rows - offset
+                if ragged:
+                    length = min(length, ragged[0][0] - emitted)
+                yield batch.slice(offset, length)
+                offset += length
+                emitted += length
+            rows = self._take_ragged(ragged, emitted, schema)
+            if rows is not None:
+                emitted += rows.num_rows
+                aligned += rows.num_rows
+                yield rows
+        if ragged:
+            rows = [heapq.heappop(ragged)[2] for _ in range(len(ragged))]
+            aligned += len(rows)
+            yield self._ragged_batch(rows, schema)
+        if aligned:
+            logger.warning("Padded or cut %s rows with the wrong number of fields to %s columns", aligned, len(schema))
+
+    def _take_ragged(self, ragged, position, schema):
+        """Remove and return, as one batch, the ragged rows that come next at ``position``."""
+        taken = []
+        while ragged and ragged[0][0] <= position + len(taken):
+            taken.append(heapq.heappop(ragged)[2])
+        return self._ragged_batch(taken, schema) if taken else None
+
+    def _ragged_batch(self, rows, schema):
+        width = len(schema)
+        records = []
+        for row in rows:
+            fields = next(csv.reader(StringIO(row.text)), [])
+            records.append(fields[:width] + [None] * (width - len(fields)))
+        return pa.RecordBatch.from_arrays([pa.array([record[i] for record in records], pa.string()) for i in range(width)],
+                                          schema=schema)
+
+    def _drop_empty_rows(self, batch):
+        if batch.num_columns == 0 or batch.num_rows == 0:
+            return batch
+        keep = None
+        for column in batch.columns:
+            # Nulls only come from padded ragged rows
+            has_value = pc.fill_null(pc.not_equal(pc.utf8_length(pc.utf8_trim_whitespace(column)), 0), False)
+            keep = has_value if keep is None else pc.or_(keep, has_value)
+        return batch.filter(keep)
+
+    def _write_csv(self, batches, schema, output):
+        rows = 0
+        with pa_csv.CSVWriter(output, schema, write_options=pa_csv.WriteOptions(quoting_style='needed')) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        return rows
+
+    def _write_json(self, batches, output):
+        rows = 0
+        output.write(b"[")
+        for batch in batches:
+            if batch.num_rows == 0:
+                continue
+            # pandas encodes a whole batch of records in C, the surrounding brackets are stripped
+            records = batch.to_pandas().to_json(orient='records', force_ascii=False)
+            output.write((b"," if rows else b"") + records[1:-1].encode('utf-8'))
+            rows += batch.num_rows
+        output.write(b"]")
+        return rows
+
+    def _write_parquet(self, batches, schema, output):
+        rows = 0
+        with pq.ParquetWriter(output, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        return rows
+
+
+class _Borrowed:
+    """Context manager around a caller-owned file that leaves it open."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __enter__(self):
+        return self.stream
+
+    def __exit__(self, *exc):
+        return False
@@ -0,0 +1,190 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the acquire timeout."""
+
+
+class ConnectionPool:
+    """Thread-safe pool of Postgres connections with borrow/return semantics.
+
+    Borrowed connections are health checked when they sat idle for longer than
+    ``health_check_interval`` seconds, idle connections above ``min_size`` are closed after
+    ``idle_timeout`` seconds, and at most ``max_size`` connections are open at any time.
+    """
+
+    def __init__(self, connect: Callable, min_size: int = 1, max_size: int = 10, idle_timeout: float = 300,
+                 health_check_interval: float = 30, acquire_timeout: float = 30):
+        if min_size < 0 or max_size < max(1, min_size):
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.condition = threading.Condition()
+        # Idle connections with the time they were returned, most recently returned last
+        self.idle = []
+        self.in_use = set()
+        self.closed = False
+        for _ in range(min_size):
+            self.idle.append((self.connect(), time.monotonic()))
+
+    def getconn(self, timeout: float = None):
+        """Borrow a connection, waiting up to ``timeout`` seconds when the pool is exhausted."""
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            with self.condition:
+                if self.closed:
+                    raise PoolTimeout("Connection pool is closed")
+                self._prune_idle()
+                if self.idle:
+                    conn, returned_at = self.idle.pop()
+                    self.in_use.add(conn)
+                elif len(self.in_use) < self.max_size:
+                    conn, returned_at = None, None
+                    # Reserve the slot while connecting outside the lock
+                    placeholder = object()
+                    self.in_use.add(placeholder)
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No connection available within {self.acquire_timeout}s (max_size={self.max_size})")
+                    self.condition.wait(remaining)
+                    continue
+
+            if conn is None:
+                try:
+                    conn = self.connect()
+                finally:
+                    with self.condition:
+                        self.in_use.discard(placeholder)
+                        if conn is not None:
+                            self.in_use.add(conn)
+                        else:
+                            self.condition.notify()
+                return conn
+
+            if self._is_healthy(conn, returned_at):
+                return conn
+            self._discard(conn)
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a borrowed connection; broken connections or ``discard=True`` close it instead."""
+        if not discard and not conn.closed:
+            try:
+                # Leave no transaction open for the next borrower
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            self._discard(conn)
+            return
+        with self.condition:
+            self.in_use.discard(conn)
+            if self.closed:
+                conn.close()
+            else:
+                self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Borrow a connection for the duration of a ``with`` block."""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def close(self):
+        """Close idle connections now and borrowed ones when they are returned."""
+        with self.condition:
+            self.closed = True
+            for conn, _ in self.idle:
+                conn.close()
+            self.idle = []
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {'idle': len(self.idle), 'in_use': len(self.in_use), 'max_size': self.max_size}
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self.condition:
+            self.in_use.discard(conn)
+            self.condition.notify()
+
+    def _prune_idle(self):
+        """Close connections idle for longer than idle_timeout, keeping at least min_size open."""
+        now = time.monotonic()
+        while self.idle and len(self.idle) + len(self.in_use) > self.min_size and now - self.idle[0][1] > self.idle_timeout:
+            conn, _ = self.idle.pop(0)
+            conn.close()
+
+
+class PoolManager:
+    """Process-wide registry of connection pools, one per DSN, shared by every session."""
+
+    def __init__(self):
+        self.pools: Dict[str, ConnectionPool] = {}
+        self.lock = threading.Lock()
+
+    def get_pool(self, min_size: int = 1, max_size: int = 10, **connect_params) -> ConnectionPool:
+        dsn = extensions.make_dsn(**{key: value for key, value in connect_params.items() if value not in (None, '')})
+        with self.lock:
+            pool = self.pools.get(dsn)
+            if pool is None or pool.closed:
+                pool = ConnectionPool(lambda: psycopg2.connect(dsn), min_size=min_size, max_size=max_size)
+                self.pools[dsn] = pool
+            return pool
+
+    def close_all(self):
+        with self.lock:
+            for pool in self.pools.values():
+                pool.close()
+            self.pools.clear()
+
+
+pool_manager = PoolManager()
+
+
+@contextmanager
+def borrow(conn_or_pool):
+    """Yield a connection from a pool, or the given connection itself when it isn't a pool."""
+    if isinstance(conn_or_pool, ConnectionPool):
+        with conn_or_pool.connection() as conn:
+            yield conn
+    else:
+        yield conn_or_pool
@@ -0,0 +1,56 @@
+import csv
+import re
+from io import StringIO
+from typing import List
+
+# Characters that can end a record or change the quoting state
+RECORD_BOUNDARY = re.compile(r'["\n]')
+
+
+class CsvRowStream:
+    """Split CSV text arriving in arbitrary chunks into complete rows.
+
+    A row is complete once its newline is seen outside of a quoted field, so rows are emitted
+    as soon as the model has finished writing them. ``close`` flushes the last row, unless the
+    response was cut off and that row may be incomplete.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.scanned = 0
+        self.in_quotes = False
+
+    def feed(self, chunk: str) -> List[List[str]]:
+        """Add a chunk of text and return the rows it completed."""
+        if not chunk:
+            return []
+        self.buffer += chunk
+        record_end = None
+        for match in RECORD_BOUNDARY.finditer(self.buffer, self.scanned):
+            if match.group() == '"':
+                self.in_quotes = not self.in_quotes
+            elif not self.in_quotes:
+                record_end = match.end()
+        self.scanned = len(self.buffer)
+        if record_end is None:
+            return []
+
+        complete, self.buffer = self.buffer[:record_end], self.buffer[record_end:]
+        self.scanned = len(self.buffer)
+        return self._parse(complete)
+
+    def close(self, truncated: bool = False) -> List[List[str]]:
+        """Return the final row; it is dropped when the response was truncated or a quote is open."""
+        remainder, self.buffer, self.scanned = self.buffer, '', 0
+        if truncated or self.in_quotes:
+            return []
+        return self._parse(remainder)
+
+    def _parse(self, text):
+        rows = []
+        for row in csv.reader(StringIO(text)):
+            # Skip blank lines and markdown fences the model may wrap the CSV in
+            if not any(value.strip() for value in row) or row[0].lstrip().startswith('```'):
+                continue
+            rows.append(row)
+        return rows
@@ -1,13 +1,49 @@
 from io import StringIO, BytesIO
 import csv
 import json
+import os
 import pandas as pd
-import streamlit as st
+
+from columnar_converter import ColumnarConverter, pa
 
 class DataConverter:
+    def __init__(self, engine='auto'):
+        # 'columnar' converts through Arrow record batches, 'records' through a dict per row;
+        # 'auto' picks columnar whenever pyarrow is installed
+        if engine not in ('auto', 'columnar', 'records'):
+            raise ValueError(f"Unsupported conversion engine: {engine}")
+        if engine == 'auto':
+            engine = 'columnar' if pa is not None else 'records'
+        self.engine = engine
+
     def convert_data_to_format(self, data, format, table_name):
         if not data:
             raise ValueError("No data provided for conversion")
+
+        if self.engine == 'columnar':
+            output = BytesIO()
+            filename = ColumnarConverter().convert(data, format, table_name, output)
+            return output.getvalue(), filename
+        return self.convert_records_to_format(data, format, table_name)
+
+    def convert_to_file(self, source, format, table_name, output):
+        """Convert CSV text, a path or a binary file straight into the binary file ``output``; returns the file name."""
+        if self.engine == 'columnar':
+            return ColumnarConverter().convert(source, format, table_name, output)
+        if hasattr(source, 'read'):
+            source = source.read()
+        elif isinstance(source, os.PathLike):
+            with open(source, 'rb') as f:
+                source = f.read()
+        if isinstance(source, bytes):
+            source = source.decode('utf-8')
+        converted_data, filename = self.convert_records_to_format(source, format, table_name)
+        output.write(converted_data)
+        return filename
+
+    def convert_records_to_format(self, data, format, table_name):
+        if not data:
+            raise ValueError("No data provided for conversion")
         
         # Read data from StringIO
         reader = csv.DictReader(StringIO(data))
@@ -57,4 +93,66 @@ class DataConverter:
             return output.getvalue(), f"{table_name}.parquet"
         
         else:
-            raise ValueError(f"Unsupported format: {format}")
\ No newline at end of file
+            raise ValueError(f"Unsupported format: {format}")
+
+class StreamingConverter:
+    """Convert rows to one of the export formats while they are still being generated.
+
+    CSV and JSON are written to ``output`` row by row. Excel and Parquet need the whole table,
+    so their rows are collected and encoded on ``close``.
+    """
+
+    def __init__(self, format, table_name, output):
+        extensions = {'CSV': 'csv', 'JSON': 'json', 'EXCEL': 'xlsx', 'PARQUET': 'parquet'}
+        if format not in extensions:
+            raise ValueError(f"Unsupported format: {format}")
+        self.format = format
+        self.filename = f"{table_name}.{extensions[format]}"
+        self.output = output
+        self.fieldnames = None
+        self.rows_written = 0
+        self.buffered_rows = []
+
+    def write_rows(self, header, rows):
+        if self.fieldnames is None:
+            self.fieldnames = list(header)
+            if self.format == 'CSV':
+                self._write(self._csv_line(self.fieldnames))
+        width = len(self.fieldnames)
+        for row in rows:
+            # Missing fields become None and extra fields are dropped, as in convert_data_to_format
+            record = list(row[:width]) + [None] * (width - len(row))
+            if self.format == 'CSV':
+                self._write(self._csv_line(record))
+            elif self.format == 'JSON':
+                entry = json.dumps(dict(zip(self.fieldnames, record)), indent=2).replace('\n', '\n  ')
+                self._write(("[\n  " if self.rows_written == 0 else ",\n  ") + entry)
+            else:
+                self.buffered_rows.append(record)
+            self.rows_written += 1
+
+    def close(self):
+        """Finish the output and return its file name."""
+        if self.rows_written == 0:
+            raise ValueError("No records found in the provided data")
+        if self.format == 'JSON':
+            self._write("\n]")
+        elif self.format in ('EXCEL', 'PARQUET'):
+            df = pd.DataFrame(self.buffered_rows, columns=self.fieldnames)
+            self.buffered_rows = []
+            try:
+                if self.format == 'EXCEL':
+                    df.to_excel(self.output, index=False, engine='openpyxl')
+                else:
+                    df.to_parquet(self.output, index=False)
+            except Exception as e:
+                raise ValueError(f"Failed to convert data to {self.format.title()} format: {e}")
+        return self.filename
+
+    def _csv_line(self, values):
+        line = StringIO()
+        csv.writer(line).writerow(values)
+        return line.getvalue()
+
+    def _write(self, text):
+        self.output.write(text.encode('utf-8'))
@@ -1,22 +1,350 @@
 from ast import Str
 from openai import OpenAI
-import streamlit as st
 import pandas as pd
 import time
+import csv
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import nullcontext
 from typing import List, Dict, Tuple
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import sql
+
+from athena_sampler import AthenaSampler
+from checkpoint import Checkpoint
+from connection_pool import borrow
+from csv_stream import CsvRowStream
+from llm_scheduler import LLMScheduler
+from metrics import Metrics
+from pg_sampler import PostgresSampler, SAMPLING_MODES
+from referential_integrity import ForeignKeyAssigner, KeyRegistry
+from response_cache import ResponseCache
+from sample_profiler import SampleProfiler
+from shard_generator import ShardedGenerator
+from spec_engine import SpecEngine, SPEC_KINDS
+from synthesizer import CopulaSynthesizer
+from validator import LENGTH_TYPE, TableValidator, align_rows
 
 from openai import OpenAI
-import streamlit as st
 import pandas as pd
 from typing import List, Dict
 
+logger = logging.getLogger(__name__)
+
+# Streamed rows are handed on in batches of this many rows, so they are checked and converted vectorized
+STREAM_BATCH_ROWS = 100
+# 'rows' lets the model write every row, 'spec' asks it for a column spec run by SpecEngine, 'synth'
+# fits a CopulaSynthesizer on the sample and only asks the model for values of free text columns
+GENERATION_MODES = ('rows', 'spec', 'synth')
+# Rows sampled from database tables to fit synthesizers on
+SYNTH_SAMPLE_ROWS = 2000
+# Values written by the model per free text column of a synthesized table
+POOL_SIZE = 100
+
+
+class GenerationCancelled(Exception):
+    """Raised by requests of a DataGenerator that was cancelled."""
+
+
 class DataGenerator:
-    def __init__(self):
-        self.client = OpenAI(api_key=st.session_state.api_key)
+    def __init__(self, shard_size: int = None, shard_workers: int = 8, generation_mode: str = 'rows', stream: bool = False,
+                 cache: ResponseCache = None, refresh_cache: bool = False, fanout: str = 'uniform',
+                 sample_tokens: int = 1000, api_key: str = None, cancel_event: threading.Event = None,
+                 base_url: str = None, metrics: Metrics = None, scheduler: LLMScheduler = None, priority: int = 0,
+                 max_topups: int = 2, checkpoint: Checkpoint = None, sampling: str = 'tablesample', sample_seed: int = 0,
+                 synth_dir: str = None, schema_name: str = 'public'):
+        # base_url points the client at any OpenAI-compatible server, like the benchmark's mock server.
+        # Retries are left to the scheduler, which also knows about the other requests in flight
+        self.client = OpenAI(api_key=api_key or os.environ.get('OPENAI_API_KEY'), base_url=base_url, max_retries=0)
+        self.model = "gpt-4o-mini"
+        # Failures per table of the last run; they are logged too, callers decide how to show them
+        self.errors: Dict[str, str] = {}
+        self.warnings: Dict[str, str] = {}
+        # Validity summary per database table; invalid and missing rows are requested again up
+        # to max_topups times, the rest of the table is kept
+        self.validation: Dict[str, Dict] = {}
+        self.max_topups = max_topups
+        # Responses are looked up in the cache first; refresh_cache skips the lookup but still stores
+        self.cache = cache
+        self.refresh_cache = refresh_cache
+        # Stream completions and hand rows downstream as soon as they are complete
+        self.stream = stream
+        # Row counts above shard_size are generated as parallel shards of that size
+        self.shard_size = shard_size
+        self.shard_workers = shard_workers
+        if generation_mode not in GENERATION_MODES:
+            raise ValueError(f"Unsupported generation mode: {generation_mode}")
+        self.generation_mode = generation_mode
+        # How child rows spread over parent keys when foreign keys are filled locally
+        self.fanout = fanout
+        # Samples are sent as a compact profile of at most sample_tokens tokens, not as raw rows
+        self.profiler = SampleProfiler(max_tokens=sample_tokens)
+        # 'tablesample' samples database tables at random on the server and profiles them from
+        # pg_stats, 'limit' reads their first rows with understand_data
+        if sampling not in SAMPLING_MODES:
+            raise ValueError(f"Unsupported sampling mode: {sampling}")
+        # Schema the database tables are sampled from
+        self.schema_name = schema_name
+        self.sampler = PostgresSampler(seed=sample_seed, schema_name=schema_name) if sampling == 'tablesample' else None
+        # Synthesizers are fitted on a larger sample than the model gets to see
+        self.synth_sampler = (PostgresSampler(rows=SYNTH_SAMPLE_ROWS, seed=sample_seed, schema_name=schema_name)
+                              if sampling == 'tablesample' else None)
+        # Fitted synthesizers are saved here as <table>.json, to generate more rows offline
+        self.synth_dir = synth_dir
+        # Set by cancel(); checked before every request and on every streamed chunk
+        self.cancel_event = cancel_event or threading.Event()
+        # Tokens reported by the API, cached responses use none
+        self.usage = {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        self.usage_lock = threading.Lock()
+        # Stage timings, tokens and rows per table; disabled by default, then spans cost nothing
+        self.metrics = metrics or Metrics(enabled=False)
+        # Every request waits for the rate limits and is retried by the scheduler; share one
+        # scheduler between generators calling the same account. Higher priorities go first
+        self.scheduler = scheduler or LLMScheduler()
+        self.priority = priority
+        # Completion requests in flight, of level workers and shards together; set per run
+        self.request_slots = None
+        # Finished tables, their keys and finished shards are saved here; a run with the same
+        # inputs reuses them instead of generating them again
+        self.checkpoint = checkpoint
 
-    def sort_tables_by_dependency(self, selected_tables: List[str], relationships: List[Dict]):
-        """Sort tables based on foreign key dependencies."""
+    def cancel(self):
+        """Stop generating: pending requests aren't sent and in-flight ones are aborted."""
+        self.cancel_event.set()
+        # Closing the HTTP client makes requests waiting for a response fail right away
+        self.client.close()
+
+    def _check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise GenerationCancelled("Generation cancelled")
+
+    def _create(self, prompt, table=None, **options):
+        """Send a chat completion request through the scheduler.
+
+        Returns the response, or the stream, and the tokens reserved for it, which are settled
+        with the reported usage by ``_record_usage``.
+        """
+        messages = self._messages(prompt)
+        estimated = self.scheduler.estimate(messages)
+
+        def request():
+            with self.metrics.span('llm', table):
+                return self.client.chat.completions.create(model=self.model, messages=messages, **options)
+
+        response = self.scheduler.call(
+            request, estimated, self.priority, self._check_cancelled,
+            on_wait=lambda seconds: self.metrics.observe('queue', table or '', seconds),
+            on_retry=lambda error, delay: self.metrics.add('retries', 1, table))
+        return response, estimated
+
+    def _request_slot(self):
+        """Hold one of the run's request slots, if it has any, for the duration of a ``with`` block."""
+        return self.request_slots if self.request_slots is not None else nullcontext()
+
+    def _record_usage(self, usage, estimated, table=None):
+        with self.usage_lock:
+            self.usage['requests'] += 1
+            if usage is not None:
+                self.usage['prompt_tokens'] += usage.prompt_tokens or 0
+                self.usage['completion_tokens'] += usage.completion_tokens or 0
+        self.metrics.add('requests', 1, table)
+        if usage is not None:
+            # Without usage the reservation stands as the estimate
+            self.scheduler.settle(estimated, usage.prompt_tokens or 0, usage.completion_tokens or 0)
+            self.metrics.add('prompt_tokens', usage.prompt_tokens or 0, table)
+            self.metrics.add('completion_tokens', usage.completion_tokens or 0, table)
+
+    def _fail(self, table, error):
+        logger.error("Failed to generate data for %s: %s", table, error)
+        self.errors[table] = f"Failed to generate data for {table}: {error}"
+
+    def _record_count(self, no_of_records, table):
+        """``no_of_records`` is one count for every table or a dict of counts per table."""
+        return no_of_records[table] if isinstance(no_of_records, dict) else no_of_records
+
+    def _messages(self, prompt):
+        return [
+            {"role": "system", "content": "You are an AI test data generator."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _cached(self, prompt, table=None):
+        """Return the cache key and the cached response of a prompt (None on a miss or without cache)."""
+        if self.cache is None:
+            return None, None
+        key = self.cache.key(self.model, self._messages(prompt))
+        if self.refresh_cache:
+            return key, None
+        content = self.cache.get(key)
+        if content is not None:
+            self.metrics.add('cache_hits', 1, table)
+        return key, content
+
+    def _complete(self, prompt, table=None):
+        """Send a single generation prompt to the model and return the text.
+
+        ``table`` only attributes the request's time and tokens in the metrics.
+        """
+        key, content = self._cached(prompt, table)
+        if content is not None:
+            return content
+
+        self._check_cancelled()
+        with self._request_slot():
+            response, estimated = self._create(prompt, table)
+        self._record_usage(getattr(response, 'usage', None), estimated, table)
+        content = response.choices[0].message.content
+        # Truncated responses are not cached, a rerun should get a chance at a complete one
+        if key and content and response.choices[0].finish_reason != 'length':
+            self.cache.put(key, content)
+        return content
+
+    def stream_rows(self, prompt, table=None):
+        """Stream a completion and yield every complete CSV row as soon as it arrives.
+
+        The header is the first row yielded. When the response is cut off, by the output limit or
+        a dropped connection, every complete row received so far is still yielded.
+        """
+        key, content = self._cached(prompt, table)
+        if content is not None:
+            parser = CsvRowStream()
+            yield from parser.feed(content)
+            yield from parser.close()
+            return
+
+        self._check_cancelled()
+        # The slot is held until the stream ends, rows are yielded to the consumer meanwhile
+        with self._request_slot():
+            # The last chunk carries the token usage of the request
+            stream, estimated = self._create(prompt, table, stream=True, stream_options={"include_usage": True})
+            # Only the time spent waiting for and parsing chunks counts as streaming, not the
+            # time the consumer takes with the yielded rows
+            started = time.perf_counter()
+            waited = 0.0
+            parser = CsvRowStream()
+            finish_reason = None
+            usage = None
+            received = 0
+            chunks = []
+            try:
+                for chunk in stream:
+                    if self.cancel_event.is_set():
+                        stream.close()
+                        raise GenerationCancelled("Generation cancelled")
+                    usage = getattr(chunk, 'usage', None) or usage
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    finish_reason = choice.finish_reason or finish_reason
+                    if key:
+                        chunks.append(choice.delta.content or '')
+                    rows = parser.feed(choice.delta.content or '')
+                    waited += time.perf_counter() - started
+                    for row in rows:
+                        received += 1
+                        yield row
+                    started = time.perf_counter()
+            except GenerationCancelled:
+                raise
+            except Exception:
+                # Keep the rows received before the stream broke, fail only if there are none
+                if received == 0:
+                    raise
+                finish_reason = 'length'
+            self.metrics.observe('stream', table or '', waited + time.perf_counter() - started)
+            self._record_usage(usage, estimated, table)
+        yield from parser.close(truncated=finish_reason == 'length')
+        # Only complete responses are cached
+        if key and finish_reason == 'stop':
+            self.cache.put(key, ''.join(chunks))
+
+    def _complete_streamed(self, prompt, table=None):
+        """Stream a completion and return the CSV text of its complete rows."""
+        out = StringIO()
+        csv.writer(out, lineterminator='\n').writerows(self.stream_rows(prompt, table))
+        return out.getvalue()
+
+    def _generate_rows(self, build_prompt, no_of_records, primary_keys=None, on_rows=None, table=None, offset=0,
+                       collect=True):
+        """Run ``build_prompt(count, offset)`` as one completion, or as shards for large row counts.
+
+        ``on_rows(header, rows)`` receives the rows as they become available: per few rows of the
+        stream in streaming mode, per shard for sharded tables and once per table otherwise.
+        ``table`` names the table in the metrics and the checkpoint. ``offset`` is the number of
+        rows requested before, when more rows are added to a table. With a checkpoint every
+        response is saved, and responses saved by an interrupted run are reused. With ``collect``
+        false, sharded rows only go to ``on_rows`` and None is returned instead of the CSV text.
+        """
+        def timed_prompt(count, offset):
+            with self.metrics.span('prompt', table):
+                return build_prompt(count, offset)
+
+        if self.metrics.enabled:
+            on_rows = self._counting(table, on_rows)
+        store = self.checkpoint.shards(table) if self.checkpoint is not None and table else None
+
+        if self.shard_size and no_of_records > self.shard_size:
+            if self.stream:
+                complete = lambda prompt: self._complete_streamed(prompt, table)
+            else:
+                complete = lambda prompt: self._complete(prompt, table)
+            sharded = ShardedGenerator(complete, self.shard_size, self.shard_workers, store, abort_on=(GenerationCancelled,))
+            out = StringIO() if collect else None
+            sharded.generate(timed_prompt, no_of_records, out, primary_keys, on_rows, offset)
+            if sharded.failed_shards:
+                logger.warning("%s shards of %s failed, their rows are missing", sharded.failed_shards, table)
+                self.metrics.add('failed_shards', sharded.failed_shards, table)
+            return out.getvalue() if collect else None
+
+        saved = store.load(offset, no_of_records) if store is not None else None
+        if saved is not None or not self.stream:
+            if saved is not None:
+                generated_data = saved
+            else:
+                generated_data = self._complete(timed_prompt(no_of_records, offset), table)
+                if store is not None:
+                    store.save(offset, no_of_records, generated_data)
+            if on_rows:
+                with self.metrics.span('parse', table):
+                    rows = CsvRowStream()
+                    parsed = rows.feed(generated_data) + rows.close()
+                if parsed:
+                    on_rows(parsed[0], parsed[1:])
+            return generated_data
+
+        out = StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        header = None
+        batch = []
+        for row in self.stream_rows(timed_prompt(no_of_records, offset), table):
+            writer.writerow(row)
+            if header is None:
+                header = row
+            elif on_rows:
+                batch.append(row)
+                if len(batch) >= STREAM_BATCH_ROWS:
+                    on_rows(header, batch)
+                    batch = []
+        if batch:
+            on_rows(header, batch)
+        if store is not None:
+            store.save(offset, no_of_records, out.getvalue())
+        return out.getvalue()
+
+    def _counting(self, table, on_rows):
+        """Wrap an ``on_rows`` callback, which may be None, to count the rows of ``table``."""
+        def count_rows(header, rows):
+            self.metrics.add('rows', len(rows), table)
+            if on_rows:
+                on_rows(header, rows)
+        return count_rows
+
+    def sort_tables_into_levels(self, selected_tables: List[str], relationships: List[Dict]):
+        """Group tables into dependency levels; tables in the same level don't depend on each other."""
         dependency_graph = {table: set() for table in selected_tables}
         
         for rel in relationships:
@@ -26,7 +354,7 @@ class DataGenerator:
             if child_table in selected_tables and parent_table in selected_tables:
                 dependency_graph[child_table].add(parent_table)
 
-        sorted_tables = []
+        levels = []
         while dependency_graph:
             independent_tables = [t for t, deps in dependency_graph.items() if not deps]
             
@@ -34,13 +362,17 @@ class DataGenerator:
                 raise ValueError("Circular dependency detected!")
             
             for table in independent_tables:
-                sorted_tables.append(table)
                 del dependency_graph[table]
+            levels.append(independent_tables)
             
             for deps in dependency_graph.values():
                 deps.difference_update(independent_tables)
 
-        return sorted_tables
+        return levels
+
+    def sort_tables_by_dependency(self, selected_tables: List[str], relationships: List[Dict]):
+        """Sort tables based on foreign key dependencies."""
+        return [table for level in self.sort_tables_into_levels(selected_tables, relationships) for table in level]
 
     def understand_data(self, conn, table_name):
         """Retrieve sample data from the specified table."""
@@ -48,156 +380,445 @@ class DataGenerator:
             raise ValueError("Invalid table name")
         
         with conn.cursor() as cur:
-            query = f"SELECT * FROM {table_name} LIMIT 100"
+            query = sql.SQL("SELECT * FROM {} LIMIT 100").format(sql.Identifier(self.schema_name, table_name))
             cur.execute(query)
             data = cur.fetchall()
             column_names = [desc[0] for desc in cur.description]
 
         df = pd.DataFrame(data, columns=column_names)
         return df
-    
-    def generate_data_for_files(self, file_name, data_content, no_of_records):
-        data = {}
-        sample_data = data_content
+
+    def describe_table(self, conn, table, schema):
+        """Return the profile text of a database table for its prompts."""
+        if self.sampler is None:
+            return self.profiler.describe(self.understand_data(conn, table))
+        relation = self.sampler.relation(conn, table)
+        sample = self.sampler.sample(conn, table, schema, relation)
+        return self.profiler.describe(sample, self.sampler.profile(conn, table, schema, relation))
+
+    def sample_table(self, conn, table, schema):
+        """Return the sample of a database table a synthesizer is fitted on."""
+        if self.synth_sampler is None:
+            return self.understand_data(conn, table)
+        return self.synth_sampler.sample(conn, table, schema)
+
+    def build_file_prompt(self, file_name, sample_data, no_of_records, offset=0):
+        """Build the generation prompt for an uploaded file; ``offset`` is set for shards of a larger file."""
         prompt = f"Generate sample data for the table '{file_name}' with the following schema:\n"
-        prompt += f"Here are sample records retrieved from the table '{file_name}':\n {sample_data}\n"
+        prompt += f"Here is a profile of sample records retrieved from the table '{file_name}':\n {sample_data}\n"
         prompt += "And here are the rules:\n"
         prompt += "1. STRICTLY UNDERSTAND THE PATTERN AND GENERATE BUT DON'T USE THE SAME DATA DURING GENERATION PRODUCE NEW\n"
         prompt += f"2. STRICTLY GENERATE '{no_of_records}' of records in the output\n"
         prompt += "3. ONLY PROVIDE DATA, NOT INSERT QUERY\n"
         prompt += "4. STRICTLY PRODUCE ONLY CSV CONTENT WHICH CAN BE WRITTEN TO A FILE, NOT PYTHON OBJECTS\n"
         prompt += "5. DON'T USE ``` in OUTPUT\n"
+        if offset:
+            prompt += f"6. THESE ARE RECORDS {offset + 1} TO {offset + no_of_records} OF THE DATASET, DON'T REPEAT EARLIER RECORDS\n"
+        return prompt
+
+    def generate_data_for_files(self, file_name, data_content, no_of_records, on_rows=None):
+        data = {}
+        if self.checkpoint is not None:
+            self.checkpoint.start(Checkpoint.fingerprint(
+                'file', file_name, no_of_records, list(data_content.columns), len(data_content), self.generation_mode))
+            if self.checkpoint.has_table(file_name):
+                data[file_name] = self._restore_table(file_name, on_rows=on_rows)
+                return data
+        file_rows = on_rows and (lambda header, rows: on_rows(file_name, header, rows))
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are an AI test data generator."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            data[file_name] = response.choices[0].message.content
-           
+            if self.generation_mode == 'synth':
+                # The whole upload is the sample
+                data[file_name] = self._synthesize_rows(file_name, data_content, None, no_of_records, file_rows)
+            else:
+                with self.metrics.span('sample', file_name):
+                    sample_data = self.profiler.describe(data_content)
+                data[file_name] = self._generate_rows(
+                    lambda count, offset: self.build_file_prompt(file_name, sample_data, count, offset), no_of_records,
+                    on_rows=file_rows, table=file_name)
+            if self.checkpoint is not None:
+                self.checkpoint.save_table(file_name, data[file_name])
         except Exception as e:
-            st.error(f"Failed to generate data for {file_name}: {e}")
+            self._fail(file_name, e)
             data[file_name] = None
         return data
 
-    def generate_data_for_tables(self, conn, selected_tables: List[str], schemas, relationships, no_of_records):
-        data = {}
-        foreign_key_values = {table: {} for table in selected_tables}
+    def build_table_prompt(self, table, schema, sample_data, no_of_records, relationships, key_registry, key_offset=0):
+        """Build the generation prompt for a database table.
+
+        Foreign keys to generated parent tables are filled in locally from ``key_registry``, so the
+        model is told to leave them empty and the prompt size doesn't depend on the parent tables.
+        ``key_offset`` is set for shards of a larger table so each shard starts its keys elsewhere.
+        """
+        prompt = f"Generate sample data for the table '{table}' with the following schema:\n"
+
+        for column in schema:
+            column_name, data_type, is_nullable, column_default, constraint_type = column
+            constraints = []
+            if constraint_type == 'PRIMARY KEY':
+                constraints.append("PRIMARY KEY")
+            if is_nullable == 'NO':
+                constraints.append("NOT NULL")
+            else:
+                constraints.append("NULLABLE")
+            if column_default:
+                constraints.append(f"DEFAULT {column_default}")
+            prompt += f"- {column_name} ({data_type}) {' '.join(constraints)}\n"
+
+        prompt += f"\nHere is a profile of sample records retrieved from the table '{table}':\n ```{sample_data}``` \n"
+        prompt += "\nAnd here are the rules:\n"
+        prompt += f"1. STRICTLY UNDERSTAND THE PATTERN AND GENERATE BUT DON'T USE THE SAME DATA DURING GENERATION. PRODUCE NEW.\n"
+        prompt += f"2. STRICTLY GENERATE '{no_of_records}' records in the output.\n"
+        prompt += "3. ONLY PROVIDE DATA, NOT INSERT QUERIES.\n"
+        prompt += "4. STRICTLY PRODUCE ONLY CSV CONTENT WHICH CAN BE WRITTEN TO A FILE, NOT PYTHON OBJECTS.\n"
+        prompt += "5. DON'T USE ``` IN OUTPUT.\n"
+
+        # Foreign keys are assigned after generation
+        foreign_columns = [rel['child_column'] for rel in relationships
+                           if rel['child_table'] == table and key_registry.has_keys(rel['parent_table'], rel['parent_column'])]
+        if foreign_columns:
+            prompt += f"6. LEAVE THE COLUMNS {', '.join(foreign_columns)} EMPTY, THEY ARE FILLED IN AFTERWARDS.\n"
+
+        if key_offset:
+            prompt += f"7. START NUMERIC PRIMARY KEY VALUES AT {key_offset + 1}.\n"
+
+        return prompt
+
+    def build_spec_prompt(self, table, schema, sample_data, relationships):
+        """Build the prompt asking for a per-column generator spec instead of rows."""
+        prompt = f"Describe how to generate realistic data for the table '{table}' with the following schema:\n"
+        for column in schema:
+            column_name, data_type, is_nullable, column_default, constraint_type = column
+            constraints = ["PRIMARY KEY"] if constraint_type == 'PRIMARY KEY' else []
+            constraints.append("NOT NULL" if is_nullable == 'NO' else "NULLABLE")
+            prompt += f"- {column_name} ({data_type}) {' '.join(constraints)}\n"
+
+        foreign_columns = [rel['child_column'] for rel in relationships if rel['child_table'] == table]
+        prompt += f"\nHere is a profile of sample records retrieved from the table '{table}':\n ```{sample_data}``` \n"
+        prompt += "\nAnd here are the rules:\n"
+        prompt += "1. STRICTLY RETURN ONLY A JSON OBJECT OF THE FORM {\"columns\": [...]}, ONE ENTRY PER COLUMN IN TABLE ORDER.\n"
+        prompt += f"2. EVERY ENTRY HAS \"name\", \"kind\" (ONE OF {', '.join(SPEC_KINDS)}) AND \"null_rate\" (0 TO 1).\n"
+        prompt += "3. sequence: start, step. integer/float: distribution (uniform, normal, lognormal, exponential, poisson), min, max, mean, std, decimals.\n"
+        prompt += "4. categorical: values, weights. boolean: true_rate. date/timestamp: start, end as ISO dates. constant: value.\n"
+        prompt += "5. pattern: a simple regex of literals, \\d, \\w, [a-z] classes and {m,n}, ?, *, + quantifiers.\n"
+        prompt += "6. USE sequence FOR INTEGER PRIMARY KEYS AND uuid OR pattern FOR OTHER PRIMARY KEYS.\n"
+        prompt += "7. DERIVE DISTRIBUTIONS, RANGES, VOCABULARIES AND NULL RATES FROM THE SAMPLE, DON'T COPY THE SAMPLE ROWS.\n"
+        if foreign_columns:
+            prompt += f"8. USE kind foreign_key FOR THE COLUMNS {', '.join(foreign_columns)}.\n"
+        return prompt
+
+    def _request_spec(self, table, schema, sample_data, relationships):
+        """Ask the model for the generator spec of a table, once for any number of rows."""
+        with self.metrics.span('prompt', table):
+            prompt = self.build_spec_prompt(table, schema, sample_data, relationships)
+        return SpecEngine.parse_spec(self._complete(prompt, table))
+
+    def _run_spec(self, table, spec, no_of_records, offset=0):
+        """Generate rows from a spec locally; ``offset`` continues sequences after rows generated before."""
+        if offset:
+            spec = {**spec, 'columns': [
+                {**column, 'start': int(column.get('start', 1)) + offset * int(column.get('step', 1))}
+                if column['kind'] == 'sequence' else column for column in spec['columns']]}
+        with self.metrics.span('spec', table):
+            df = SpecEngine().generate(spec, no_of_records)
+            return df.to_csv(index=False)
+
+    def build_pool_prompt(self, table, columns, sample_data):
+        """Build the prompt asking for realistic values of the free text columns of a synthesized table."""
+        prompt = f"Write realistic values for the free text columns {', '.join(columns)} of the table '{table}'.\n"
+        prompt += f"\nHere is a profile of sample records retrieved from the table '{table}':\n ```{sample_data}``` \n"
+        prompt += "\nAnd here are the rules:\n"
+        prompt += "1. STRICTLY RETURN ONLY A JSON OBJECT MAPPING EVERY COLUMN NAME TO A LIST OF STRINGS.\n"
+        prompt += f"2. WRITE {POOL_SIZE} DIFFERENT VALUES PER COLUMN.\n"
+        prompt += "3. FOLLOW THE PATTERN, LENGTH AND LANGUAGE OF THE SAMPLE BUT DON'T COPY THE SAMPLE VALUES.\n"
+        return prompt
+
+    def _request_pools(self, table, synthesizer, sample, schema=None):
+        """Ask the model for value pools of the synthesizer's free text columns, once per table.
+
+        Values longer than the column's type allows are dropped. Columns the model gives no valid
+        values for keep the synthesizer's random strings in the sampled shapes.
+        """
+        columns = synthesizer.text_columns
+        if not columns:
+            return
+        with self.metrics.span('prompt', table):
+            prompt = self.build_pool_prompt(table, columns, self.profiler.describe(sample[columns]))
+        text = self._complete(prompt, table)
+        try:
+            pools = json.loads(re.sub(r'^```(?:json)?\s*|\s*```$', '', text.strip()))
+            if not isinstance(pools, dict):
+                raise ValueError("Expected a JSON object of value lists")
+        except ValueError as e:
+            logger.warning("Ignoring the text values written for %s: %s", table, e)
+            return
+        lengths = {}
+        for column in schema or []:
+            length = LENGTH_TYPE.match((column[1] or '').lower())
+            if length:
+                lengths[column[0]] = int(length.group(1))
+        for name in columns:
+            if isinstance(pools.get(name), list):
+                synthesizer.set_pool(name, [value for value in pools[name]
+                                            if name not in lengths or len(str(value)) <= lengths[name]])
+
+    def _fit_synthesizer(self, table, sample, schema=None):
+        """Fit a synthesizer on a table's sample, with value pools for its free text columns."""
+        if sample is None or sample.empty:
+            raise ValueError(f"No sample rows of {table} to fit the synthesizer on")
+        with self.metrics.span('synth', table):
+            synthesizer = CopulaSynthesizer()
+            synthesizer.fit(sample, schema)
+        self._request_pools(table, synthesizer, sample, schema)
+        if self.synth_dir:
+            os.makedirs(self.synth_dir, exist_ok=True)
+            synthesizer.save(os.path.join(self.synth_dir, f"{table}.json"))
+        return synthesizer
+
+    def _run_synth(self, table, synthesizer, no_of_records, offset=0):
+        """Generate rows with a fitted synthesizer; ``offset`` continues sequences after rows generated before."""
+        with self.metrics.span('synth', table):
+            return synthesizer.sample(no_of_records, offset).to_csv(index=False)
+
+    def _synthesize_rows(self, table, sample, schema, no_of_records, on_rows=None):
+        """Generate a table from a synthesizer fitted on its sample, for sources without a schema check."""
+        data = self._run_synth(table, self._fit_synthesizer(table, sample, schema), no_of_records)
+        parser = CsvRowStream()
+        rows = parser.feed(data) + parser.close()
+        if rows:
+            self.metrics.add('rows', len(rows) - 1, table)
+            if on_rows:
+                on_rows(rows[0], rows[1:])
+        return data
+
+    def _generate_table(self, conn, table, schemas, relationships, no_of_records, key_registry, assigner, on_rows=None):
+        """Generate one table and return its CSV text with the foreign keys filled in.
+
+        Every batch of rows is validated against the table's schema before its keys are kept
+        for child tables and it is passed on. Rows that are invalid, or missing because the model
+        returned too few, are requested again in top-up calls for just that many rows.
+        """
+        out = StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        header = []
+        validator = TableValidator(table, schemas[table], no_of_records, relationships, key_registry)
 
-        sorted_tables = self.sort_tables_by_dependency(selected_tables, relationships)
+        # Fill foreign keys, drop invalid rows and keep referenced keys for child tables as rows arrive
+        def collect_rows(row_header, rows):
+            if not header:
+                header.extend(row_header)
+                writer.writerow(header)
+            elif row_header != header:
+                # Top-up responses may order the columns differently
+                rows = align_rows(header, row_header, rows)
+            with self.metrics.span('fk', table):
+                assigner.fill(table, header, rows)
+            with self.metrics.span('validate', table):
+                rows = validator.check(header, rows)
+            with self.metrics.span('fk', table):
+                key_registry.collect(table, header, rows)
+            writer.writerows(rows)
+            if on_rows and rows:
+                on_rows(table, header, rows)
 
-        for table in sorted_tables:
-            sample_data = self.understand_data(conn, table)
-            prompt = f"Generate sample data for the table '{table}' with the following schema:\n"
+        with self.metrics.span('sample', table), borrow(conn) as table_conn:
+            if self.generation_mode == 'synth':
+                sample = self.sample_table(table_conn, table, schemas[table])
+            else:
+                sample_data = self.describe_table(table_conn, table, schemas[table])
+        spec = synthesizer = None
+        if self.generation_mode == 'spec':
+            spec = self._request_spec(table, schemas[table], sample_data, relationships)
+        elif self.generation_mode == 'synth':
+            synthesizer = self._fit_synthesizer(table, sample, schemas[table])
+        primary_keys = {column[0]: column[1] for column in schemas[table] if column[4] == 'PRIMARY KEY'}
 
-            for column in schemas[table]:
-                column_name, data_type, is_nullable, column_default, constraint_type = column
-                constraints = []
-                if constraint_type == 'PRIMARY KEY':
-                    constraints.append("PRIMARY KEY")
-                if is_nullable == 'NO':
-                    constraints.append("NOT NULL")
+        # Rows requested so far; top-ups continue the keys after them
+        requested = 0
+        for attempt in range(self.max_topups + 1):
+            count = validator.missing
+            if count == 0:
+                break
+            if attempt:
+                logger.info("Requesting %s more rows for %s", count, table)
+                self.metrics.add('topup_rows', count, table)
+            if spec is not None or synthesizer is not None:
+                if spec is not None:
+                    generated_data = self._run_spec(table, spec, count, requested)
                 else:
-                    constraints.append("NULLABLE")
-                if column_default:
-                    constraints.append(f"DEFAULT {column_default}")
-                prompt += f"- {column_name} ({data_type}) {' '.join(constraints)}\n"
-
-            prompt += f"\nHere are sample records retrieved from the table '{table}':\n ```{sample_data}``` \n"
-            prompt += "\nAnd here are the rules:\n"
-            prompt += f"1. STRICTLY UNDERSTAND THE PATTERN AND GENERATE BUT DON'T USE THE SAME DATA DURING GENERATION. PRODUCE NEW.\n"
-            prompt += f"2. STRICTLY GENERATE '{no_of_records}' records in the output.\n"
-            prompt += "3. ONLY PROVIDE DATA, NOT INSERT QUERIES.\n"
-            prompt += "4. STRICTLY PRODUCE ONLY CSV CONTENT WHICH CAN BE WRITTEN TO A FILE, NOT PYTHON OBJECTS.\n"
-            prompt += "5. DON'T USE ``` IN OUTPUT.\n"
-
-            # Add foreign key constraints
-            for rel in relationships:
-                if rel['child_table'] == table:
-                    foreign_column = rel['child_column']
-                    referenced_table = rel['parent_table']
-                    referenced_column = rel['parent_column']
-                    if referenced_table in foreign_key_values and referenced_column in foreign_key_values[referenced_table]:
-                        prompt += f"6. For column {foreign_column}, use values from this list to ensure referential integrity: {foreign_key_values[referenced_table][referenced_column]}\n"
+                    generated_data = self._run_synth(table, synthesizer, count, requested)
+                with self.metrics.span('parse', table):
+                    parser = CsvRowStream()
+                    rows = parser.feed(generated_data) + parser.close()
+                if rows:
+                    self.metrics.add('rows', len(rows) - 1, table)
+                    collect_rows(rows[0], rows[1:])
+            else:
+                self._generate_rows(
+                    lambda count, offset: self.build_table_prompt(table, schemas[table], sample_data, count, relationships, key_registry, offset),
+                    count, primary_keys, collect_rows, table, requested, collect=False)
+            requested += count
 
-            try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": "You are an AI test data generator."},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-
-                generated_data = response.choices[0].message.content
-                data[table] = generated_data
-
-                # Extract generated values for potential foreign key references
-                df = pd.read_csv(StringIO(generated_data))  # Use StringIO from io module
-                for column in df.columns:
-                    foreign_key_values[table][column] = df[column].tolist()
-
-            except Exception as e:
-                st.error(f"Failed to generate data for {table}: {e}")
-                data[table] = None
+        self.validation[table] = summary = validator.summary()
+        invalid = sum(count for check, count in summary['rejected'].items() if check != 'excess')
+        if invalid:
+            self.metrics.add('invalid_rows', invalid, table)
+        if validator.missing:
+            logger.warning("Only %s of %s valid rows generated for %s", validator.valid, no_of_records, table)
+            self.warnings[table] = f"Only {validator.valid} of {no_of_records} valid rows generated for {table}."
+        with self.metrics.span('fk', table):
+            key_registry.finalize(table)
+        if self.checkpoint is not None:
+            self.checkpoint.save_table(table, out.getvalue(), key_registry.keys.get(table), summary)
+        return out.getvalue()
+
+    def _restore_table(self, table, key_registry: KeyRegistry = None, on_rows=None):
+        """Return the CSV text of a table finished by an earlier run, restoring its keys and validity summary.
+
+        The table's rows are passed to ``on_rows`` at once, so writers and progress see them as
+        if they had been generated.
+        """
+        data, keys, validation = self.checkpoint.load_table(table)
+        logger.info("Reusing %s from the checkpoint", table)
+        if keys and key_registry is not None:
+            key_registry.restore(table, keys)
+        if validation:
+            self.validation[table] = validation
+            if validation['valid'] < validation['target']:
+                self.warnings[table] = f"Only {validation['valid']} of {validation['target']} valid rows generated for {table}."
+        parser = CsvRowStream()
+        rows = parser.feed(data) + parser.close()
+        if rows:
+            self.metrics.add('restored_rows', len(rows) - 1, table)
+            if on_rows:
+                on_rows(table, rows[0], rows[1:])
+        return data
+
+    def generate_data_for_tables(self, conn, selected_tables: List[str], schemas, relationships, no_of_records, max_workers: int = 1, on_rows=None):
+        """Generate data level by level, running the tables of one dependency level in parallel.
+
+        A level only starts once every table of the previous level has finished, so the keys of
+        parent tables are always available to their children. Up to ``max_workers`` tables are
+        generated at once; their requests, shards included, share ``max(max_workers, shard_workers)``
+        request slots, so sharded tables don't multiply the requests in flight. ``conn`` may be a ``ConnectionPool``, every table then samples
+        over its own pooled connection. ``on_rows(table, header, rows)`` is called with rows as they
+        are generated, from the worker thread generating the table. ``no_of_records`` is one count
+        for every table or a dict of counts per table.
+
+        With a checkpoint, tables finished by an earlier run of the same inputs are reused along
+        with the keys their children need, and only the remaining tables are generated.
+        """
+        data = {}
+        # Only keys referenced by selected child tables are kept, as compact arrays
+        key_registry = KeyRegistry(relationships, selected_tables)
+        assigner = ForeignKeyAssigner(key_registry, relationships, self.fanout)
+
+        levels = self.sort_tables_into_levels(selected_tables, relationships)
+        if self.checkpoint is not None:
+            self.checkpoint.start(Checkpoint.fingerprint(
+                'tables', selected_tables, {table: schemas[table] for table in selected_tables}, relationships,
+                {table: self._record_count(no_of_records, table) for table in selected_tables},
+                self.generation_mode))
+        self.request_slots = threading.BoundedSemaphore(max(1, max_workers, self.shard_workers))
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            for level in levels:
+                restored = [table for table in level if self.checkpoint is not None and self.checkpoint.has_table(table)]
+                for table in restored:
+                    data[table] = self._restore_table(table, key_registry, on_rows)
+                futures = {
+                    table: executor.submit(self._generate_table, conn, table, schemas, relationships, self._record_count(no_of_records, table),
+                                           key_registry, assigner, on_rows)
+                    for table in level if table not in restored
+                }
+                # Results are collected on the calling thread, so errors are recorded in table order
+                for table, future in futures.items():
+                    try:
+                        data[table] = future.result()
+                    except Exception as e:
+                        self._fail(table, e)
+                        data[table] = None
 
         return data
 
 
     def run_athena_query(self, client, database, table):
-        """Run a query on Athena to retrieve data."""
-        query = f"SELECT * FROM {table} LIMIT 10"
-        response = client.start_query_execution(
-            QueryString=query,
-            QueryExecutionContext={'Database': database},
-            ResultConfiguration={'OutputLocation': 's3://test-data-gen-sample-athena/'}
-        )
-        query_execution_id = response['QueryExecutionId']
-
-        # Wait for query to finish
-        while True:
-            status = client.get_query_execution(QueryExecutionId=query_execution_id)
-            state = status['QueryExecution']['Status']['State']
-            if state == 'SUCCEEDED':
-                print("Query succeeded")
-                break
-            elif state in ['FAILED', 'CANCELLED']:
-                print(f"Query {state}: {status['QueryExecution']['Status']['StateChangeReason']}")
-                return None
-            time.sleep(2)
+        """Run a query on Athena to retrieve sample data as a DataFrame."""
+        samples, errors = AthenaSampler(client).sample_tables(database, [table])
+        if table in errors:
+            print(f"Failed to sample {table}: {errors[table]}")
+        return samples.get(table)
 
-        results = client.get_query_results(QueryExecutionId=query_execution_id)
-        return results
+    def build_athena_prompt(self, table, columns, sample_data, no_of_records, offset=0):
+        """Build the generation prompt for an Athena table; ``offset`` is set for shards of a larger table."""
+        prompt = f"Generate sample data for the table '{table}' with the following schema:\n"
+        for column in columns or []:
+            prompt += f"- {column['Name']} ({column.get('Type', 'string')})\n"
+        prompt += f"Here is a profile of sample records retrieved from the table '{table}':\n {sample_data}\n"
+        prompt += "And here are the rules:\n"
+        prompt += "1. STRICTLY UNDERSTAND THE PATTERN AND GENERATE BUT DON'T USE THE SAME DATA DURING GENERATION PRODUCE NEW\n"
+        prompt += f"2. STRICTLY GENERATE '{no_of_records}' of records in the output\n"
+        prompt += "3. ONLY PROVIDE DATA, NOT INSERT QUERY\n"
+        prompt += "4. STRICTLY PRODUCE ONLY CSV CONTENT WHICH CAN BE WRITTEN TO A FILE, NOT PYTHON OBJECTS\n"
+        prompt += "5. DON'T USE ``` in OUTPUT\n"
+        if offset:
+            prompt += f"6. THESE ARE RECORDS {offset + 1} TO {offset + no_of_records} OF THE DATASET, DON'T REPEAT EARLIER RECORDS\n"
+        return prompt
+
+    def _generate_athena_table(self, table, schemas, sample_data, no_of_records, on_rows=None):
+        """Generate data for one sampled Athena table."""
+        table_rows = on_rows and (lambda header, rows: on_rows(table, header, rows))
+        if self.generation_mode == 'synth':
+            schema = [(column['Name'], column.get('Type'), None, None, None) for column in schemas.get(table) or []]
+            data = self._synthesize_rows(table, sample_data, schema, no_of_records, table_rows)
+        else:
+            with self.metrics.span('sample', table):
+                sample_data = self.profiler.describe(sample_data)
+            data = self._generate_rows(
+                lambda count, offset: self.build_athena_prompt(table, schemas.get(table), sample_data, count, offset), no_of_records,
+                on_rows=table_rows, table=table)
+        if self.checkpoint is not None:
+            self.checkpoint.save_table(table, data)
+        return data
 
-    def generate_data_for_athena_tables(self, client, selected_tables: List[str], schemas: Dict, no_of_records: int, database: str):
-        """Generate data for Athena tables."""
+    def generate_data_for_athena_tables(self, client, selected_tables: List[str], schemas: Dict, no_of_records, database: str, max_workers: int = 1, on_rows=None,
+                                        s3_client=None):
+        """Generate data for Athena tables.
+
+        The sample queries of all tables run at once, then every table is generated concurrently,
+        up to ``max_workers`` at a time, since Athena tables have no dependencies between them.
+        Their requests, shards included, share ``max(max_workers, shard_workers)`` request slots.
+        With ``s3_client`` the samples are read straight from the query result files.
+        ``no_of_records`` is one count for every table or a dict of counts per table. With a
+        checkpoint, tables finished by an earlier run of the same inputs are reused.
+        """
         data = {}
-        for table in selected_tables:
-            sample_data = self.run_athena_query(client, database, table)
-            prompt = f"Generate sample data for the table '{table}' with the following schema:\n"
-            prompt += f"{schemas}"
-            prompt += f"Here are sample records retrieved from the table '{table}':\n {sample_data}\n"
-            prompt += "And here are the rules:\n"
-            prompt += "1. STRICTLY UNDERSTAND THE PATTERN AND GENERATE BUT DON'T USE THE SAME DATA DURING GENERATION PRODUCE NEW\n"
-            prompt += f"2. STRICTLY GENERATE '{no_of_records}' of records in the output\n"
-            prompt += "3. ONLY PROVIDE DATA, NOT INSERT QUERY\n"
-            prompt += "4. STRICTLY PRODUCE ONLY CSV CONTENT WHICH CAN BE WRITTEN TO A FILE, NOT PYTHON OBJECTS\n"
-            prompt += "5. DON'T USE ``` in OUTPUT\n"
+        if self.checkpoint is not None:
+            self.checkpoint.start(Checkpoint.fingerprint(
+                'athena', database, selected_tables, {table: schemas.get(table) for table in selected_tables},
+                {table: self._record_count(no_of_records, table) for table in selected_tables}, self.generation_mode))
+            for table in selected_tables:
+                if self.checkpoint.has_table(table):
+                    data[table] = self._restore_table(table, on_rows=on_rows)
+            selected_tables = [table for table in selected_tables if table not in data]
+        # The sample queries run as one batch, so their time isn't attributed to single tables
+        with self.metrics.span('sample'):
+            samples, errors = AthenaSampler(client, s3_client=s3_client).sample_tables(database, selected_tables)
+        for table, error in errors.items():
+            logger.warning("Failed to sample %s, generating without sample data: %s", table, error)
+            self.warnings[table] = f"Failed to sample {table}, generating without sample data: {error}"
+        self.request_slots = threading.BoundedSemaphore(max(1, max_workers, self.shard_workers))
 
-            try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": "You are an AI test data generator."},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                data[table] = response.choices[0].message.content
-            except Exception as e:
-                st.error(f"Failed to generate data for {table}: {e}")
-                data[table] = None
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                table: executor.submit(self._generate_athena_table, table, schemas, samples.get(table),
+                                           self._record_count(no_of_records, table), on_rows)
+                for table in selected_tables
+            }
+            for table, future in futures.items():
+                try:
+                    data[table] = future.result()
+                except Exception as e:
+                    self._fail(table, e)
+                    data[table] = None
 
         return data
@@ -1,9 +1,24 @@
+import logging
+
 import psycopg2
-import streamlit as st
 import boto3
 
+from catalog import CatalogIntrospector
+from connection_pool import pool_manager
+
+logger = logging.getLogger(__name__)
+
 class DBConnection:
 
+    def __init__(self):
+        # Error of the last failed call, for callers that show it
+        self.error = None
+
+    # Function to record and log an error
+    def _fail(self, message):
+        self.error = message
+        logger.error(message)
+
     # Function to create a database connection
     def create_connection(self, dbname, user, password, host, port):
         try:
@@ -16,70 +31,63 @@ class DBConnection:
             )
             return conn
         except psycopg2.Error as e:
-            st.error(f"Failed to connect to the database: {e}")
+            self._fail(f"Failed to connect to the database: {e}")
             return None
         
+    # Function to get the shared connection pool of a database, one pool per DSN for all sessions
+    def get_connection_pool(self, dbname, user, password, host, port, min_size=1, max_size=10):
+        try:
+            pool = pool_manager.get_pool(min_size=min_size, max_size=max_size, dbname=dbname, user=user,
+                                         password=password, host=host, port=port)
+            # Borrow once so bad credentials fail here rather than in the first query
+            with pool.connection():
+                pass
+            return pool
+        except psycopg2.Error as e:
+            self._fail(f"Failed to connect to the database: {e}")
+            return None
+
     # Function to get the list of tables
-    def get_tables(self, conn):
+    def get_tables(self, conn, schema_name='public'):
         if conn is None:
-            st.error("No connection available")
+            self._fail("No connection available")
             return []
 
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT table_name
-                    FROM information_schema.tables
-                    WHERE table_schema = 'public'
-                """)
-                tables = cur.fetchall()
-            return [table[0] for table in tables]
+            return CatalogIntrospector(schema_name).get_catalog(conn).tables
         except psycopg2.Error as e:
-            st.error(f"Failed to retrieve tables: {e}")
+            self._fail(f"Failed to retrieve tables: {e}")
             return []
 
     # Function to get the relationships between tables
-    def get_table_relationships(self, conn):
+    def get_table_relationships(self, conn, schema_name='public'):
         if conn is None:
-            st.error("No connection available")
+            self._fail("No connection available")
             return []
 
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                        SELECT 
-                            tc.table_name AS foreign_table, 
-                            kcu.column_name AS foreign_column, 
-                            ccu.table_name AS referenced_table, 
-                            ccu.column_name AS referenced_column
-                        FROM 
-                            information_schema.table_constraints AS tc 
-                            JOIN information_schema.key_column_usage AS kcu
-                            ON tc.constraint_name = kcu.constraint_name
-                            JOIN information_schema.constraint_column_usage AS ccu
-                            ON ccu.constraint_name = tc.constraint_name
-                        WHERE tc.constraint_type = 'FOREIGN KEY';
-                """)
-                relationships = cur.fetchall()
-
-            # Convert to list of dictionaries
-            relationship_dicts = []
-            for rel in relationships:
-                relationship_dicts.append({
-                    'child_table': rel[0],
-                    'child_column': rel[1],
-                    'parent_table': rel[2],
-                    'parent_column': rel[3]
-                })
-            return relationship_dicts
-
+            return CatalogIntrospector(schema_name).get_catalog(conn).relationships
         except psycopg2.Error as e:
-            st.error(f"Failed to retrieve table relationships: {e}")
+            self._fail(f"Failed to retrieve table relationships: {e}")
             return []
 
 
 
     def assume_role(self, aws_access_key_id, aws_secret_access_key, region):
+        credentials = self._role_credentials(aws_access_key_id, aws_secret_access_key)
+
+        # Use temporary credentials to create a new Boto3 client for Glue
+        athena_client = boto3.client(
+            'athena',
+            aws_access_key_id=credentials['AccessKeyId'],
+            aws_secret_access_key=credentials['SecretAccessKey'],
+            aws_session_token=credentials['SessionToken'],
+            region_name=region
+        )
+        
+        return athena_client
+
+    def _role_credentials(self, aws_access_key_id, aws_secret_access_key):
         # Provide your user's AWS Access Key and Secret Key
         sts_client = boto3.client(
             'sts',
@@ -94,21 +102,22 @@ class DBConnection:
         )
 
         # Get temporary credentials
-        credentials = assumed_role_object['Credentials']
-
-        # Use temporary credentials to create a new Boto3 client for Glue
-        athena_client = boto3.client(
-            'athena',
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken'],
-            region_name=region
-        )
-        
-        return athena_client
+        return assumed_role_object['Credentials']
 
     def get_athena_client(self, aws_access_key_id, aws_secret_access_key, region):
 
         athena_client = self.assume_role(aws_access_key_id, aws_secret_access_key, region)
         
         return athena_client
+
+    def get_s3_client(self, aws_access_key_id, aws_secret_access_key, region, endpoint_url=None):
+        """S3 client with the same assumed role as the Athena client, e.g. to upload generated data."""
+        credentials = self._role_credentials(aws_access_key_id, aws_secret_access_key)
+        return boto3.client(
+            's3',
+            aws_access_key_id=credentials['AccessKeyId'],
+            aws_secret_access_key=credentials['SecretAccessKey'],
+            aws_session_token=credentials['SessionToken'],
+            region_name=region,
+            endpoint_url=endpoint_url
+        )
@@ -0,0 +1,131 @@
+import csv
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from typing import Dict, List
+
+import psycopg2
+from psycopg2 import sql
+
+from connection_pool import ConnectionPool
+
+
+class DBLoader:
+    """Load generated tables into Postgres with COPY FROM STDIN.
+
+    Tables are loaded level by level in dependency order, so parent rows exist before the rows
+    referencing them. Tables of the same level are loaded in parallel, each over its own
+    connection borrowed from ``pool``.
+    """
+
+    def __init__(self, pool: ConnectionPool, max_workers: int = 4, batch_rows: int = 50000, truncate: bool = False,
+                 rebuild_indexes: bool = False, schema_name: str = 'public'):
+        self.pool = pool
+        self.max_workers = max(1, max_workers)
+        self.batch_rows = batch_rows
+        # Empty the tables before loading them
+        self.truncate = truncate
+        # Drop secondary indexes before the load and recreate them afterwards, much faster for large loads
+        self.rebuild_indexes = rebuild_indexes
+        self.schema_name = schema_name
+
+    def load_tables(self, data: Dict[str, str], levels: List[List[str]]):
+        """Load the CSV text of every table; returns the rows loaded and the errors per table."""
+        loaded, errors = {}, {}
+        if self.truncate:
+            try:
+                self.truncate_tables([table for level in levels for table in level])
+            except psycopg2.Error as e:
+                # E.g. a table referenced by one that isn't loaded, or missing privileges. The pool
+                # rolls the transaction back; loading on top of the old rows isn't what was asked for
+                return loaded, {table: f"Failed to truncate: {str(e).strip()}" for level in levels for table in level if data.get(table)}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for level in levels:
+                futures = {table: executor.submit(self.load_table, table, data[table])
+                           for table in level if data.get(table)}
+                for table, future in futures.items():
+                    try:
+                        loaded[table] = future.result()
+                    except Exception as e:
+                        errors[table] = str(e)
+        return loaded, errors
+
+    def truncate_tables(self, tables: List[str]):
+        """Truncate all tables in one statement so foreign keys between them don't block it."""
+        if not tables:
+            return
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("TRUNCATE {}").format(sql.SQL(', ').join(self._table(table) for table in tables)))
+            conn.commit()
+
+    def load_table(self, table: str, data) -> int:
+        """COPY one table in batches of ``batch_rows`` rows inside a single transaction."""
+        reader = csv.reader(StringIO(data) if isinstance(data, str) else data)
+        header = next(reader, None)
+        if not header:
+            return 0
+
+        copy = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+            self._table(table), sql.SQL(', ').join(sql.Identifier(column.strip()) for column in header))
+        rows_loaded = 0
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                statement = copy.as_string(conn)
+                indexes = self._drop_indexes(cur, table) if self.rebuild_indexes else []
+
+                batch = StringIO()
+                writer = csv.writer(batch, lineterminator='\n')
+                batch_size = 0
+                for row in reader:
+                    if not any(value.strip() for value in row):
+                        continue
+                    writer.writerow(row[:len(header)] + [''] * (len(header) - len(row)))
+                    batch_size += 1
+                    if batch_size >= self.batch_rows:
+                        rows_loaded += self._copy(cur, statement, batch)
+                        batch, batch_size = StringIO(), 0
+                        writer = csv.writer(batch, lineterminator='\n')
+                if batch_size:
+                    rows_loaded += self._copy(cur, statement, batch)
+
+                for index_definition in indexes:
+                    cur.execute(index_definition)
+                self._sync_sequences(cur, table, header)
+            conn.commit()
+        return rows_loaded
+
+    def _copy(self, cur, statement, batch):
+        batch.seek(0)
+        cur.copy_expert(statement, batch)
+        return cur.rowcount
+
+    def _sync_sequences(self, cur, table, columns):
+        """Move serial sequences past the loaded keys so later inserts don't collide with them."""
+        qualified = sql.Identifier(self.schema_name, table).as_string(cur)
+        for column in columns:
+            cur.execute("SELECT pg_catalog.pg_get_serial_sequence(%s, %s)", (qualified, column.strip()))
+            sequence = cur.fetchone()[0]
+            if sequence:
+                cur.execute(sql.SQL("SELECT pg_catalog.setval(%s, COALESCE(MAX({column}), 0) + 1, false) FROM {table}").format(
+                    column=sql.Identifier(column.strip()), table=self._table(table)), (sequence,))
+
+    def _drop_indexes(self, cur, table):
+        """Drop the indexes that don't back a constraint and return their definitions."""
+        cur.execute("""
+            SELECT i.relname, pg_catalog.pg_get_indexdef(i.oid)
+            FROM pg_catalog.pg_index x
+            JOIN pg_catalog.pg_class i ON i.oid = x.indexrelid
+            JOIN pg_catalog.pg_class t ON t.oid = x.indrelid
+            JOIN pg_catalog.pg_namespace n ON n.oid = t.relnamespace
+            WHERE n.nspname = %s
+            AND t.relname = %s
+            AND NOT EXISTS (SELECT 1 FROM pg_catalog.pg_constraint c WHERE c.conindid = x.indexrelid)
+        """, (self.schema_name, table))
+        indexes = cur.fetchall()
+        for name, _ in indexes:
+            cur.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(self.schema_name, name)))
+        return [definition for _, definition in indexes]
+
+    def _table(self, table):
+        return sql.Identifier(self.schema_name, table)
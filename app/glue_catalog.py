@@ -0,0 +1,107 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+
+class GlueCatalog:
+    """Paginated, cached view of the tables of a Glue database, read through Athena.
+
+    Table listings are paginated to the end, so large databases don't lose tables. The metadata
+    of every listed table is cached per database for ``ttl`` seconds; tables missing from the
+    cache are looked up individually and in parallel, so only the selected tables are fetched.
+
+    The cache is shared by the instances of one caller: ``identity`` defaults to the access key id
+    of the client's credentials, so sessions of other accounts or roles never see each other's
+    tables. Clients without readable credentials get a cache of their own instance.
+    """
+
+    _cache: Dict[tuple, dict] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, client, catalog_name: str = 'AwsDataCatalog', ttl: float = 300, max_workers: int = 8,
+                 identity: str = None):
+        self.client = client
+        self.catalog_name = catalog_name
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.identity = identity or self._client_identity(client)
+
+    def list_tables(self, database: str, refresh: bool = False) -> List[str]:
+        """Return the names of all tables of the database."""
+        entry = self._entry(database)
+        if refresh or entry is None or time.time() - entry['listed_at'] > self.ttl:
+            entry = self._load(database)
+        return list(entry['tables'])
+
+    def get_table_metadata(self, database: str, tables: List[str], refresh: bool = False) -> Dict[str, dict]:
+        """Return the Athena TableMetadata of the given tables, fetching only the uncached ones."""
+        entry = self._entry(database)
+        now = time.time()
+        cached = {}
+        if entry is not None and not refresh:
+            cached = {table: metadata for table, (metadata, fetched_at) in entry['metadata'].items()
+                      if table in tables and now - fetched_at <= self.ttl}
+        missing = [table for table in tables if table not in cached]
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(missing)))) as executor:
+                fetched = dict(zip(missing, executor.map(lambda table: self._fetch(database, table), missing)))
+            with self._lock:
+                entry = self._cache.setdefault(self._key(database), {'tables': [], 'metadata': {}, 'listed_at': 0})
+                for table, metadata in fetched.items():
+                    entry['metadata'][table] = (metadata, now)
+            cached.update(fetched)
+        return {table: cached[table] for table in tables}
+
+    def get_schemas(self, database: str, tables: List[str], refresh: bool = False) -> Dict[str, List[dict]]:
+        """Return the columns, partition keys included, of the given tables."""
+        metadata = self.get_table_metadata(database, tables, refresh)
+        return {table: item.get('Columns', []) + item.get('PartitionKeys', []) for table, item in metadata.items()}
+
+    def get_locations(self, database: str, tables: List[str], refresh: bool = False) -> Dict[str, str]:
+        """Return the S3 location of the data of the given tables, None where the catalog has none."""
+        metadata = self.get_table_metadata(database, tables, refresh)
+        # Athena returns the storage descriptor's location among the table parameters
+        return {table: item.get('Parameters', {}).get('location') for table, item in metadata.items()}
+
+    def invalidate(self, database: str = None):
+        with self._lock:
+            if database is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(self._key(database), None)
+
+    def _load(self, database):
+        tables, metadata = [], {}
+        now = time.time()
+        paginator = self.client.get_paginator('list_table_metadata')
+        for page in paginator.paginate(CatalogName=self.catalog_name, DatabaseName=database):
+            for item in page['TableMetadataList']:
+                tables.append(item['Name'])
+                metadata[item['Name']] = (item, now)
+        entry = {'tables': tables, 'metadata': metadata, 'listed_at': now}
+        with self._lock:
+            self._cache[self._key(database)] = entry
+        return entry
+
+    def _fetch(self, database, table):
+        response = self.client.get_table_metadata(CatalogName=self.catalog_name, DatabaseName=database, TableName=table)
+        return response['TableMetadata']
+
+    def _entry(self, database):
+        with self._lock:
+            return self._cache.get(self._key(database))
+
+    def _key(self, database):
+        meta = getattr(self.client, 'meta', None)
+        return (self.identity, getattr(meta, 'region_name', None), getattr(meta, 'endpoint_url', None), self.catalog_name,
+                database)
+
+    @staticmethod
+    def _client_identity(client):
+        try:
+            # botocore keeps the credentials on the request signer, so no call to STS is needed
+            return client._request_signer._credentials.get_frozen_credentials().access_key
+        except Exception:
+            return uuid.uuid4().hex
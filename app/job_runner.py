@@ -0,0 +1,500 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Dict, List
+
+import boto3
+import pandas as pd
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover - JSON job specs work without PyYAML
+    yaml = None
+
+from checkpoint import Checkpoint
+from columnar_converter import EXTENSIONS
+from data_converter import StreamingConverter
+from data_generator import DataGenerator, GenerationCancelled
+from db_connection import DBConnection
+from db_loader import DBLoader
+from glue_catalog import GlueCatalog
+from llm_scheduler import LLMScheduler
+from metrics import Metrics
+from parallel_export import ParallelExporter
+from response_cache import DEFAULT_CACHE_DIR, ResponseCache
+from s3_sink import S3Sink, split_location
+from table_schema import TableSchema
+from zip_exporter import ZipExporter
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ('postgres', 'glue', 'file')
+SINKS = ('directory', 'zip', 'postgres', 's3')
+# Directory in the output keeping finished tables until the job succeeded
+CHECKPOINT_DIR = '.checkpoint'
+
+
+def read_sample_file(source, name):
+    """Read an uploaded or local sample file into a DataFrame, by its extension."""
+    if name.endswith(".csv"):
+        return pd.read_csv(source)
+    elif name.endswith(".json"):
+        return pd.read_json(source)
+    elif name.endswith(".xlsx"):
+        return pd.read_excel(source)
+    elif name.endswith(".parquet"):
+        return pd.read_parquet(source)
+    raise ValueError(f"Unsupported sample file: {name}")
+
+
+class JobSpec:
+    """A generation job read from a JSON or YAML file.
+
+    ``source`` says where samples and schemas come from (postgres, glue or file), ``tables`` is
+    a list of table names or a dict of row counts per table, ``rows`` the default row count.
+    Every table is written in each of ``formats`` to ``output``; ``sinks`` can add a ZIP archive
+    of the output, an upload to S3 and, for postgres sources, a load into the database. ``generation`` holds the
+    DataGenerator options and the parallelism.
+    """
+
+    def __init__(self, source: Dict, tables=None, rows: int = 100, formats: List[str] = None, output: str = 'output',
+                 sinks: List[Dict] = None, generation: Dict = None):
+        if source.get('type') not in SOURCES:
+            raise ValueError(f"Unsupported source type: {source.get('type')}")
+        self.source = source
+        if isinstance(tables, dict):
+            self.row_counts = {table: int(count if count is not None else rows) for table, count in tables.items()}
+            self.tables = list(tables)
+        else:
+            self.row_counts = {}
+            self.tables = list(tables or [])
+        self.rows = int(rows)
+        self.formats = [format.upper() for format in (formats or ['CSV'])]
+        for format in self.formats:
+            if format not in EXTENSIONS:
+                raise ValueError(f"Unsupported format: {format}")
+        self.output = output
+        self.sinks = sinks or []
+        for sink in self.sinks:
+            if sink.get('type') not in SINKS:
+                raise ValueError(f"Unsupported sink type: {sink.get('type')}")
+            if sink['type'] == 'postgres' and source['type'] != 'postgres':
+                raise ValueError("The postgres sink needs a postgres source")
+            if sink['type'] == 's3':
+                # Glue tables are uploaded to their own location, other sources need one
+                if sink.get('location'):
+                    split_location(sink['location'])
+                elif source['type'] != 'glue':
+                    raise ValueError("The s3 sink needs a location")
+        if sum(sink['type'] == 's3' for sink in self.sinks) > 1:
+            raise ValueError("Only one s3 sink is supported")
+        self.generation = generation or {}
+
+    @classmethod
+    def from_dict(cls, spec: Dict):
+        unknown = set(spec) - {'source', 'tables', 'rows', 'formats', 'output', 'sinks', 'generation'}
+        if unknown:
+            raise ValueError(f"Unknown job spec keys: {', '.join(sorted(unknown))}")
+        if 'source' not in spec:
+            raise ValueError("The job spec needs a source")
+        return cls(**spec)
+
+    @classmethod
+    def load(cls, path: str):
+        """Read a job spec from a .json, .yaml or .yml file."""
+        with open(path) as f:
+            if path.endswith(('.yaml', '.yml')):
+                if yaml is None:
+                    raise ImportError("PyYAML is required for YAML job specs, use a JSON spec or install pyyaml")
+                spec = yaml.safe_load(f)
+            else:
+                spec = json.load(f)
+        return cls.from_dict(spec)
+
+    def row_count(self, table):
+        return self.row_counts.get(table, self.rows)
+
+
+class JobRunner:
+    """Run a JobSpec with the same pipeline as the Streamlit app, without Streamlit.
+
+    Tables are generated by DataGenerator and converted by DataConverter into one file per table
+    and format in the output directory. Conversions run on ``export_workers`` processes, one per
+    core by default; in streaming mode rows are converted while they are generated instead. Errors are logged and collected
+    per table in ``run``'s result rather than raised, so one failing table doesn't stop the job.
+
+    ``progress`` gets ``start(row_counts)`` once the tables are known and ``rows(table, count)``
+    for every batch of generated rows. Setting ``cancel_event`` stops the generation, ``run``
+    then raises GenerationCancelled. ``metrics`` records the stage timings, tokens and rows of
+    the job unless the ``metrics`` generation option is false.
+
+    Requests go through ``scheduler``; pass the one shared by all jobs on the same account. Without
+    it the job gets its own, limited by the ``requests_per_minute`` and ``tokens_per_minute``
+    generation options or the OPENAI_REQUESTS_PER_MINUTE and OPENAI_TOKENS_PER_MINUTE variables.
+    The ``priority`` generation option ranks the job's requests against other jobs waiting for it.
+
+    Finished tables, shards and parent keys are checkpointed to the ``checkpoint`` generation
+    option, by default ``.checkpoint`` in the output directory, and removed once the job ran
+    without errors. With the ``resume`` option a failed or interrupted job continues from its
+    checkpoint instead of starting over; ``checkpoint: false`` turns checkpointing off.
+    """
+
+    def __init__(self, spec: JobSpec, api_key: str = None, cache: ResponseCache = None, progress=None,
+                 cancel_event: threading.Event = None, scheduler: LLMScheduler = None):
+        self.spec = spec
+        self.api_key = api_key
+        self.cache = cache
+        self.progress = progress
+        self.cancel_event = cancel_event or threading.Event()
+        self.generator = None
+        options = spec.generation
+        self.max_workers = int(options.get('max_workers', 4))
+        # Conversions are CPU-bound and run on worker processes, by default one per core
+        self.export_workers = int(options.get('export_workers') or os.cpu_count() or 1)
+        self.metrics = Metrics(enabled=options.get('metrics', True))
+        self.scheduler = scheduler or LLMScheduler.from_env(options.get('requests_per_minute'), options.get('tokens_per_minute'))
+        if cache is None and options.get('cache', True):
+            self.cache = ResponseCache(os.environ.get('RESPONSE_CACHE_DIR', DEFAULT_CACHE_DIR))
+        self.checkpoint = None
+        if options.get('checkpoint', True) is not False:
+            directory = options.get('checkpoint')
+            self.checkpoint = Checkpoint(directory if isinstance(directory, str) else os.path.join(spec.output, CHECKPOINT_DIR))
+        # S3 locations of the Glue tables, where the s3 sink uploads them
+        self.table_locations: Dict[str, str] = {}
+
+    def run(self) -> Dict:
+        """Run the job; returns the written files, loaded row counts, validity summaries, warnings and errors."""
+        options = self.spec.generation
+        generator = DataGenerator(
+            shard_size=options.get('shard_size', 500), shard_workers=options.get('shard_workers', 8),
+            generation_mode=options.get('mode', 'rows'), stream=options.get('stream', False), cache=self.cache,
+            refresh_cache=options.get('refresh_cache', False), fanout=options.get('fanout', 'uniform'),
+            sample_tokens=options.get('sample_tokens', 1000), api_key=self.api_key, cancel_event=self.cancel_event,
+            base_url=options.get('base_url'), metrics=self.metrics, scheduler=self.scheduler,
+            priority=int(options.get('priority', 0)), checkpoint=self.checkpoint,
+            sampling=options.get('sampling', 'tablesample'), sample_seed=int(options.get('sample_seed', 0)),
+            synth_dir=options.get('synth_dir'), schema_name=self.spec.source.get('schema', 'public'))
+        self.generator = generator
+        if self.checkpoint is not None and not options.get('resume', False):
+            self.checkpoint.reset()
+        result = {'files': [], 'loaded': {}, 'uploaded': [], 'warnings': {}, 'errors': {}, 'previews': {}, 'validation': {},
+                  'metrics': None}
+        os.makedirs(self.spec.output, exist_ok=True)
+
+        source = self.spec.source['type']
+        s3 = self._s3_spec()
+        # Uploaded files are named after the sample file without its extension
+        writer = _OutputWriter(self.spec.output, self.spec.formats, strip_extension=source == 'file', metrics=self.metrics,
+                               sink=self._s3_sink(s3) if s3 is not None else None,
+                               location=lambda table: self._upload_location(s3, table))
+        stream = options.get('stream', False)
+
+        def on_rows(table, header, rows):
+            if self.progress is not None:
+                self.progress.rows(table, len(rows))
+            if stream:
+                writer.write_rows(table, header, rows)
+
+        try:
+            if source == 'postgres':
+                data, levels, pool = self._run_postgres(generator, on_rows)
+            elif source == 'glue':
+                data, levels, pool = self._run_glue(generator, on_rows), None, None
+            else:
+                data, levels, pool = self._run_file(generator, on_rows), None, None
+        except BaseException:
+            # Streamed files and uploads of a failed job are dropped, no incomplete upload stays in the bucket
+            writer.discard()
+            raise
+        if self.cancel_event.is_set():
+            writer.discard()
+            raise GenerationCancelled("Generation cancelled")
+        result['warnings'].update(generator.warnings)
+        result['errors'].update(generator.errors)
+        result['validation'] = dict(generator.validation)
+        result['previews'] = {table: content[:1000] for table, content in data.items() if content}
+
+        result['files'] = writer.convert(data, self.export_workers, result['errors'])
+        result['uploaded'] = writer.uploaded
+
+        for sink in self.spec.sinks:
+            if sink['type'] == 'zip' and result['files']:
+                result['files'].append(self._write_zip(sink, result['files']))
+            elif sink['type'] == 'postgres' and pool is not None:
+                loader = DBLoader(pool, max_workers=self.max_workers, batch_rows=sink.get('batch_rows', 50000),
+                                  truncate=sink.get('truncate', False), rebuild_indexes=sink.get('rebuild_indexes', False),
+                                  schema_name=self.spec.source.get('schema', 'public'))
+                loaded, errors = loader.load_tables(data, levels)
+                result['loaded'].update(loaded)
+                result['errors'].update({table: f"Failed to load {table}: {error}" for table, error in errors.items()})
+
+        if self.cache is not None:
+            stats = self.cache.stats()
+            logger.info("Response cache: %s hits, %s misses", stats['hits'], stats['misses'])
+        if self.metrics.enabled:
+            result['metrics'] = self.metrics.report()
+        if self.checkpoint is not None and not result['errors']:
+            self.checkpoint.remove()
+        return result
+
+    def _run_postgres(self, generator, on_rows):
+        source = self.spec.source
+        dbobj = DBConnection()
+        pool = dbobj.get_connection_pool(source.get('dbname'), source.get('user'), self._secret(source, 'password'),
+                                         source.get('host', 'localhost'), source.get('port', 5432),
+                                         max_size=max(self.max_workers, 1) + 1)
+        if pool is None:
+            raise ConnectionError(dbobj.error)
+        schema_name = source.get('schema', 'public')
+        schema = TableSchema(schema_name)
+        with pool.connection() as conn:
+            tables = self.spec.tables or dbobj.get_tables(conn, schema_name)
+            relationships = dbobj.get_table_relationships(conn, schema_name)
+            schemas = schema.get_table_schemas(tables, conn)
+        if schemas is None:
+            raise RuntimeError(schema.error)
+        missing = [table for table in tables if schemas.get(table) is None]
+        if missing:
+            raise ValueError(f"Tables not found: {', '.join(missing)}")
+
+        counts = self._start(tables)
+        data = generator.generate_data_for_tables(pool, tables, schemas, relationships, counts,
+                                                  max_workers=self.max_workers, on_rows=on_rows)
+        return data, generator.sort_tables_into_levels(tables, relationships), pool
+
+    def _run_glue(self, generator, on_rows):
+        source = self.spec.source
+        if source.get('aws_access_key_id'):
+            # Same assumed role as the app
+            client = DBConnection().get_athena_client(source['aws_access_key_id'], self._secret(source, 'aws_secret_access_key'),
+                                                      source.get('region'))
+        else:
+            # The default credential chain, e.g. an instance role in CI
+            client = boto3.client('athena', region_name=source.get('region'))
+        catalog = GlueCatalog(client)
+        tables = self.spec.tables or catalog.list_tables(source['database'])
+        schemas = catalog.get_schemas(source['database'], tables)
+        if self._s3_spec() is not None:
+            self.table_locations = catalog.get_locations(source['database'], tables)
+        counts = self._start(tables)
+        return generator.generate_data_for_athena_tables(client, tables, schemas, counts, source['database'],
+                                                         max_workers=self.max_workers, on_rows=on_rows)
+
+    def _run_file(self, generator, on_rows):
+        path = self.spec.source['path']
+        name = os.path.basename(path)
+        sample = read_sample_file(path, name)
+        self._start([name])
+        return generator.generate_data_for_files(name, sample, self.spec.row_count(name), on_rows=on_rows)
+
+    def _start(self, tables):
+        counts = {table: self.spec.row_count(table) for table in tables}
+        if self.progress is not None:
+            self.progress.start(counts)
+        return counts
+
+    def _write_zip(self, sink, files):
+        path = sink.get('path') or os.path.join(self.spec.output, 'generated_data.zip')
+        with self.metrics.span('zip'):
+            exporter = ZipExporter(max_workers=self.max_workers)
+            for name in files:
+                with exporter.member(os.path.basename(name)) as content, open(name, 'rb') as f:
+                    shutil.copyfileobj(f, content, 1024 * 1024)
+            os.replace(exporter.finish(), path)
+        return path
+
+    def _s3_spec(self):
+        return next((sink for sink in self.spec.sinks if sink['type'] == 's3'), None)
+
+    def _s3_sink(self, sink):
+        source = self.spec.source
+        options = {'region_name': sink.get('region') or source.get('region'), 'endpoint_url': sink.get('endpoint_url')}
+        if sink.get('aws_access_key_id'):
+            # Keys of the bucket, e.g. of a MinIO server
+            client = boto3.client('s3', aws_access_key_id=sink['aws_access_key_id'],
+                                  aws_secret_access_key=self._secret(sink, 'aws_secret_access_key'), **options)
+        elif source['type'] == 'glue' and source.get('aws_access_key_id'):
+            # Same assumed role as the Athena client
+            client = DBConnection().get_s3_client(source['aws_access_key_id'], self._secret(source, 'aws_secret_access_key'),
+                                                  options['region_name'], options['endpoint_url'])
+        else:
+            client = boto3.client('s3', **options)
+        return S3Sink(client, part_size=int(sink.get('part_size_mb', 16)) * 1024 * 1024, max_workers=int(sink.get('max_workers', 8)),
+                      max_in_flight=int(sink.get('max_in_flight', 4)))
+
+    def _upload_location(self, sink, table):
+        """Return the S3 location a table is uploaded to: its Glue location unless ``table_locations`` is false, else the sink's."""
+        location = self.table_locations.get(table) if sink.get('table_locations', True) else None
+        location = location or sink.get('location')
+        if not location:
+            raise ValueError(f"No S3 location for {table}: the catalog has none and the s3 sink sets none")
+        return location
+
+    def _secret(self, source, key):
+        """Read a secret from the spec or, with ``<key>_env``, from the named environment variable."""
+        if source.get(f'{key}_env'):
+            return os.environ.get(source[f'{key}_env'])
+        return source.get(key)
+
+
+class _OutputWriter:
+    """Write every generated table in each output format to the output directory.
+
+    With ``sink`` every file is uploaded to S3 under ``location(table)`` too: streamed tables
+    while they are converted, the others once their files are written.
+    """
+
+    def __init__(self, directory, formats, strip_extension=False, metrics: Metrics = None, sink: S3Sink = None,
+                 location=None):
+        self.directory = directory
+        self.formats = formats
+        self.strip_extension = strip_extension
+        self.metrics = metrics or Metrics(enabled=False)
+        self.converters: Dict[str, List[StreamingConverter]] = {}
+        self.lock = threading.Lock()
+        self.sink = sink
+        self.location = location
+        self.uploaded: List[str] = []
+
+    def name(self, table):
+        return os.path.splitext(table)[0] if self.strip_extension else table
+
+    def path(self, table, format):
+        return os.path.join(self.directory, f"{self.name(table)}.{EXTENSIONS[format]}")
+
+    def write_rows(self, table, header, rows):
+        """``on_rows`` callback of streaming mode: convert rows while they are generated."""
+        with self.lock:
+            if table not in self.converters:
+                self.converters[table] = [StreamingConverter(format, self.name(table), self._open(table, format))
+                                          for format in self.formats]
+            converters = self.converters[table]
+        with self.metrics.span('convert', table):
+            for converter in converters:
+                converter.write_rows(header, rows)
+
+    def _open(self, table, format):
+        output = open(self.path(table, format), 'wb')
+        if self.sink is None:
+            return output
+        try:
+            return _TeeOutput(output, self.sink.open(self.location(table), os.path.basename(self.path(table, format))))
+        except Exception:
+            output.close()
+            raise
+
+    def discard(self):
+        """Close the files of streamed tables without finishing them and abort their uploads."""
+        for converters in self.converters.values():
+            for converter in converters:
+                getattr(converter.output, 'abort', converter.output.close)()
+        self.converters.clear()
+        if self.sink is not None:
+            self.sink.close()
+
+    def convert(self, data, max_workers, errors):
+        """Finish streamed tables and convert the others; returns the paths of the written files."""
+        files = []
+        for table, converters in self.converters.items():
+            if table in errors:
+                # The table's generation failed, its streamed rows are incomplete
+                for converter in converters:
+                    self._drop(converter)
+                continue
+            with self.metrics.span('convert', table):
+                for converter in converters:
+                    try:
+                        converter.close()
+                    except Exception as e:
+                        # E.g. a table that streamed no rows
+                        logger.error("Failed to convert %s to %s: %s", table, converter.format, e)
+                        errors[table] = f"Failed to convert {table} to {converter.format}: {e}"
+                        self._drop(converter)
+                        continue
+                    try:
+                        converter.output.close()
+                    except Exception as e:
+                        # Only completing the upload can fail here, the local file is written
+                        logger.error("Failed to upload %s of %s: %s", converter.filename, table, e)
+                        errors[table] = f"Failed to upload {converter.filename} of {table}: {e}"
+                    else:
+                        if isinstance(converter.output, _TeeOutput):
+                            self.uploaded.append(converter.output.upload.url)
+                    files.append(os.path.join(self.directory, converter.filename))
+
+        exporter = ParallelExporter(max_workers=max_workers, metrics=self.metrics)
+        pending = {table: content for table, content in data.items() if table not in self.converters}
+        written = []
+        for table, format, path, error in exporter.export(pending, self.formats, self.path, self.name):
+            if error is not None:
+                logger.error("Failed to convert %s to %s: %s", table, format, error)
+                errors[table] = f"Failed to convert {table} to {format}: {error}"
+            else:
+                files.append(path)
+                written.append((table, path))
+        if self.sink is not None:
+            with self.metrics.span('upload'):
+                self._upload(written, errors)
+            self.sink.close()
+        for table, content in data.items():
+            if not content and table not in errors:
+                errors[table] = f"No data generated for {table}."
+        return files
+
+    def _drop(self, converter):
+        """Abort a streamed file's upload and remove the unfinished file."""
+        getattr(converter.output, 'abort', converter.output.close)()
+        path = os.path.join(self.directory, converter.filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _upload(self, written, errors):
+        """Upload the converted files, ``(table, path)`` pairs, to their tables' locations."""
+        uploads = []
+        for table, path in written:
+            try:
+                uploads.append((table, path, self.location(table)))
+            except ValueError as e:
+                errors[table] = str(e)
+        results = self.sink.upload_files([(path, location) for _, path, location in uploads])
+        for (table, _, _), (path, url, error) in zip(uploads, results):
+            if error is not None:
+                logger.error("Failed to upload %s of %s: %s", os.path.basename(path), table, error)
+                errors[table] = f"Failed to upload {os.path.basename(path)} of {table}: {error}"
+            else:
+                self.uploaded.append(url)
+
+
+class _TeeOutput:
+    """Binary output writing a streamed file to disk and to an S3 upload at once."""
+
+    def __init__(self, file, upload):
+        self.file = file
+        self.upload = upload
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.upload.tell()
+
+    def write(self, data):
+        self.file.write(data)
+        return self.upload.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+        self.upload.close()
+
+    def abort(self):
+        self.file.close()
+        self.upload.abort()
@@ -0,0 +1,206 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from data_generator import GenerationCancelled
+from job_runner import JobRunner, JobSpec
+from llm_scheduler import LLMScheduler
+from response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class Job:
+    """One submitted generation job and its progress; JobRunner reports into it."""
+
+    def __init__(self, job_id, spec: JobSpec, api_key=None):
+        self.id = job_id
+        self.spec = spec
+        self.api_key = api_key
+        self.status = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.targets: Dict[str, int] = {}
+        self.rows: Dict[str, int] = {}
+        self.result = None
+        self.error = None
+        self.archive = None
+        self.cancel_event = threading.Event()
+        self.runner = None
+        self.lock = threading.Lock()
+
+    def start(self, counts):
+        with self.lock:
+            self.targets = dict(counts)
+            self.rows = {table: 0 for table in counts}
+
+    def rows_generated(self, table, count):
+        with self.lock:
+            self.rows[table] = self.rows.get(table, 0) + count
+
+    def snapshot(self) -> Dict:
+        """Return the state of the job as a plain dict, safe to read while it runs."""
+        with self.lock:
+            tables = {table: {'rows': self.rows.get(table, 0), 'target': target} for table, target in self.targets.items()}
+        done = sum(min(table['rows'], table['target']) for table in tables.values())
+        total = sum(table['target'] for table in tables.values())
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0
+        eta = None
+        if self.status == RUNNING and done:
+            # Assumes the rest is generated at the rate seen so far
+            eta = elapsed * (total - done) / done
+        generator = self.runner.generator if self.runner is not None else None
+        usage = dict(generator.usage) if generator is not None else {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        metrics = self.runner.metrics if self.runner is not None else None
+        return {
+            'id': self.id, 'status': self.status, 'tables': tables, 'rows': done, 'target': total,
+            'progress': done / total if total else 0, 'elapsed': elapsed, 'eta': eta, 'usage': usage,
+            'metrics': metrics.report() if metrics is not None and metrics.enabled else None,
+            'result': self.result, 'error': self.error, 'archive': self.archive,
+        }
+
+
+class _Progress:
+    """Progress interface of JobRunner, forwarding to the job."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def start(self, counts):
+        self.job.start(counts)
+
+    def rows(self, table, count):
+        self.job.rows_generated(table, count)
+
+
+class JobService:
+    """Run generation jobs in the background on a bounded pool of workers.
+
+    ``submit`` queues a job and returns its id right away; at most ``max_workers`` jobs run at a
+    time and the rest wait their turn, so concurrent users don't compete for one process
+    unboundedly. Every job writes into its own directory below ``directory`` and ends with a ZIP
+    of its output. Jobs keep running when the submitting session goes away; finished jobs are
+    dropped with their files ``retention`` seconds after they finished. All jobs share one
+    ``scheduler``, so together they stay within the account's rate limits. A failed, cancelled or
+    partly failed job can be ``resume``d in its directory, reusing the tables it finished.
+    """
+
+    def __init__(self, max_workers: int = 2, directory: str = None, retention: float = 3600, cache: ResponseCache = None,
+                 scheduler: LLMScheduler = None):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='generation-job')
+        self.directory = directory or tempfile.gettempdir()
+        self.retention = retention
+        self.cache = cache
+        self.scheduler = scheduler or LLMScheduler.from_env()
+        self.jobs: Dict[str, Job] = {}
+        self.lock = threading.Lock()
+
+    def submit(self, spec: JobSpec, api_key: str = None) -> str:
+        """Queue a job and return its id."""
+        self._prune()
+        job = Job(uuid.uuid4().hex, spec, api_key)
+        spec.output = tempfile.mkdtemp(prefix=f'job-{job.id[:8]}-', dir=self.directory)
+        # The archive is what gets downloaded
+        if not any(sink['type'] == 'zip' for sink in spec.sinks):
+            spec.sinks.append({'type': 'zip', 'path': os.path.join(spec.output, 'generated_data.zip')})
+        return self._queue(job)
+
+    def resume(self, job_id: str) -> str:
+        """Run a finished job again from its checkpoint; returns the id of the new job, None when it can't be resumed.
+
+        The new job replaces the old one and writes into the same directory, so only the tables
+        that didn't finish are generated again.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in FINISHED:
+                return None
+            del self.jobs[job_id]
+        job.spec.generation = {**job.spec.generation, 'resume': True}
+        return self._queue(Job(uuid.uuid4().hex, job.spec, job.api_key))
+
+    def _queue(self, job: Job) -> str:
+        with self.lock:
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job)
+        return job.id
+
+    def status(self, job_id: str) -> Dict:
+        """Return the snapshot of a job, None for unknown or pruned jobs."""
+        job = self.jobs.get(job_id)
+        return job.snapshot() if job is not None else None
+
+    def prometheus(self, job_id: str) -> str:
+        """Return the metrics of a job in the Prometheus text format, labelled with the job id."""
+        job = self.jobs.get(job_id)
+        if job is None or job.runner is None:
+            return None
+        return job.runner.metrics.prometheus(labels={'job': job.id})
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; returns False when it already finished."""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job.cancel_event.set()
+        runner = job.runner
+        if runner is not None and runner.generator is not None:
+            runner.generator.cancel()
+        return True
+
+    def remove(self, job_id: str):
+        """Forget a finished job and delete its files."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in FINISHED:
+                return
+            del self.jobs[job_id]
+        shutil.rmtree(job.spec.output, ignore_errors=True)
+
+    def shutdown(self, cancel: bool = True):
+        if cancel:
+            for job_id in list(self.jobs):
+                self.cancel(job_id)
+        self.executor.shutdown(wait=True)
+
+    def _run(self, job: Job):
+        if job.cancel_event.is_set():
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            return
+        job.started_at = time.time()
+        job.status = RUNNING
+        cache = self.cache if job.spec.generation.get('cache', True) else None
+        job.runner = JobRunner(job.spec, api_key=job.api_key, cache=cache, progress=_Progress(job),
+                               cancel_event=job.cancel_event, scheduler=self.scheduler)
+        try:
+            job.result = job.runner.run()
+            zip_sinks = [sink['path'] for sink in job.spec.sinks if sink['type'] == 'zip' and sink.get('path')]
+            job.archive = next((path for path in zip_sinks if os.path.exists(path)), None)
+            job.status = SUCCEEDED
+        except GenerationCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in list(self.jobs.items())
+                   if job.status in FINISHED and now - job.finished_at > self.retention]
+        for job_id in expired:
+            self.remove(job_id)
@@ -0,0 +1,228 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+from openai import APIConnectionError, APIStatusError
+
+from sample_profiler import TokenEstimator
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth another attempt: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Longest single wait, so cancellation is noticed while waiting for capacity or a retry
+WAIT_SLICE = 0.5
+
+
+class TokenBucket:
+    """Allow ``rate`` units per minute, in bursts of at most ``capacity`` units.
+
+    The level may go below zero: a request larger than the capacity is let through once the
+    bucket is full, and usage settled after the fact is charged as debt the next requests wait for.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate / 60.0
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        # updated lies ahead while the scheduler is paused, nothing refills until then
+        if now > self.updated:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until ``amount`` can be taken, 0 when it can be taken now."""
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class LLMScheduler:
+    """Admit chat completion requests within the account's requests and tokens per minute.
+
+    Every request reserves one request and its estimated tokens (prompt plus the average
+    completion seen so far) from two token buckets; ``settle`` corrects the reservation with the
+    usage the API reported. Requests waiting for capacity are admitted highest ``priority`` first,
+    in submission order within a priority. Rate limits, timeouts, connection errors and server
+    errors are retried up to ``max_retries`` times with jittered exponential backoff; a
+    ``retry-after`` from the server is honoured and pauses every request, not only the one that
+    hit the limit. Without limits requests are only retried.
+
+    One scheduler is meant to be shared by everything calling the same account, so that
+    concurrent jobs and tables add up to the limits together. ``headroom`` keeps the rates a bit
+    below the limits, since the server counts tokens slightly differently than the estimate.
+    """
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None, max_retries: int = 6,
+                 base_delay: float = 1.0, max_delay: float = 60.0, headroom: float = 0.9, burst_seconds: float = 10,
+                 estimator: TokenEstimator = None):
+        self.requests = self._bucket(requests_per_minute, headroom, burst_seconds)
+        self.tokens = self._bucket(tokens_per_minute, headroom, burst_seconds)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.estimator = estimator or TokenEstimator()
+        # Running average of completion tokens, the part of a request unknown up front
+        self.completion_tokens = 500.0
+        self.paused_until = 0.0
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls, requests_per_minute: float = None, tokens_per_minute: float = None):
+        """Create a scheduler with the given limits, or those of OPENAI_REQUESTS_PER_MINUTE and OPENAI_TOKENS_PER_MINUTE."""
+        requests_per_minute = requests_per_minute or os.environ.get('OPENAI_REQUESTS_PER_MINUTE')
+        tokens_per_minute = tokens_per_minute or os.environ.get('OPENAI_TOKENS_PER_MINUTE')
+        return cls(requests_per_minute=float(requests_per_minute) if requests_per_minute else None,
+                   tokens_per_minute=float(tokens_per_minute) if tokens_per_minute else None)
+
+    def _bucket(self, limit, headroom, burst_seconds):
+        if not limit:
+            return None
+        rate = limit * headroom
+        # Enough for one request even at low limits, the API enforces limits over short windows too
+        return TokenBucket(rate, max(1.0, rate * burst_seconds / 60.0))
+
+    def estimate(self, messages) -> int:
+        """Estimate the tokens a request will use: its prompt plus an average completion."""
+        prompt = sum(self.estimator.count(message['content']) for message in messages)
+        return prompt + int(self.completion_tokens)
+
+    def acquire(self, tokens: int, priority: int = 0, check_cancelled=None) -> float:
+        """Block until the request may be sent; returns the seconds it waited."""
+        started = time.monotonic()
+        ticket = (-priority, next(self.sequence))
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    if check_cancelled is not None:
+                        check_cancelled()
+                    now = time.monotonic()
+                    wait = self.paused_until - now
+                    if self.waiting[0] == ticket and wait <= 0:
+                        wait = self._wait_time(now, tokens)
+                        if wait <= 0:
+                            self._take(tokens)
+                            return time.monotonic() - started
+                    # Requests behind the first one wait to be notified, or for a slice to check cancellation
+                    self.condition.wait(min(max(wait, 0.01), WAIT_SLICE) if self.waiting[0] == ticket else WAIT_SLICE)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+
+    def _wait_time(self, now, tokens):
+        wait = 0.0
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+        return wait
+
+    def _take(self, tokens):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def settle(self, estimated: int, prompt_tokens: int, completion_tokens: int):
+        """Correct a reservation of ``estimated`` tokens with the usage the API reported."""
+        with self.condition:
+            self.completion_tokens = 0.9 * self.completion_tokens + 0.1 * completion_tokens
+            if self.tokens is not None:
+                self.tokens.take(prompt_tokens + completion_tokens - estimated)
+            self.condition.notify_all()
+
+    def refund(self, tokens: int):
+        """Give back the tokens reserved for a request that failed."""
+        with self.condition:
+            if self.tokens is not None:
+                self.tokens.refill(time.monotonic())
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level + tokens)
+            self.condition.notify_all()
+
+    def retry_delay(self, error, attempt: int):
+        """Seconds to wait before retrying after ``error``, None when it isn't retried."""
+        if attempt >= self.max_retries:
+            return None
+        if isinstance(error, APIStatusError):
+            if error.status_code not in RETRYABLE_STATUS or getattr(error, 'code', None) == 'insufficient_quota':
+                return None
+            retry_after = self._retry_after(error.response.headers)
+            if retry_after is not None:
+                return min(retry_after, self.max_delay)
+        elif not isinstance(error, APIConnectionError):
+            return None
+        # Full jitter, so retries of parallel requests spread out instead of arriving together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _retry_after(self, headers):
+        for name, scale in (('retry-after-ms', 0.001), ('retry-after', 1)):
+            value = headers.get(name)
+            if value is not None:
+                try:
+                    return float(value) * scale
+                except ValueError:
+                    # retry-after may also be an HTTP date, the backoff is used then
+                    return None
+        return None
+
+    def pause(self, seconds: float):
+        """Hold back every request for ``seconds``, after the server said the limit was hit."""
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            # The buckets were too optimistic, start them empty after the pause
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.level = min(bucket.level, 0)
+                    bucket.updated = self.paused_until
+
+    def call(self, request, tokens: int, priority: int = 0, check_cancelled=None, on_wait=None, on_retry=None):
+        """Run ``request()`` once admitted, retrying retryable errors; returns its result.
+
+        ``on_wait(seconds)`` gets the time spent waiting for capacity and ``on_retry(error, delay)``
+        every retry. ``check_cancelled()`` is called while waiting and should raise to give up.
+        """
+        for attempt in itertools.count():
+            waited = self.acquire(tokens, priority, check_cancelled)
+            if on_wait is not None:
+                on_wait(waited)
+            try:
+                return request()
+            except Exception as e:
+                # The next attempt reserves again; without the refund sustained 429s drain the bucket
+                self.refund(tokens)
+                if check_cancelled is not None:
+                    check_cancelled()
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                if isinstance(e, APIStatusError) and e.status_code == 429:
+                    self.pause(delay)
+                logger.warning("Request failed (%s), retry %s of %s in %.1fs", e, attempt + 1, self.max_retries, delay)
+                if on_retry is not None:
+                    on_retry(e, delay)
+                self._sleep(delay, check_cancelled)
+
+    def _sleep(self, seconds, check_cancelled):
+        until = time.monotonic() + seconds
+        while True:
+            if check_cancelled is not None:
+                check_cancelled()
+            left = until - time.monotonic()
+            if left <= 0:
+                return
+            time.sleep(min(left, WAIT_SLICE))
@@ -0,0 +1,138 @@
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List
+
+# sample fetch and profiling, prompt building, waiting for the rate limits, model requests (until
+# the response starts when streaming), receiving streamed responses, parsing non-streamed ones,
+# running spec mode specs, fitting and running synthesizers, foreign key assignment, validation,
+# format conversion, the ZIP archive and uploads to S3
+STAGES = ('sample', 'prompt', 'queue', 'llm', 'stream', 'parse', 'spec', 'synth', 'fk', 'validate', 'convert', 'zip', 'upload')
+# Upper bounds in seconds of the stage duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Spans and counters not tied to one table
+ALL_TABLES = ''
+
+_NOOP = nullcontext()
+
+
+class Metrics:
+    """Stage timings, token usage and row counts of one generation job, per table.
+
+    ``span(stage, table)`` times a block of work; spans of the same stage and table are
+    aggregated into a count, a sum, a maximum and histogram buckets rather than kept one by
+    one. ``add`` increments a counter. A disabled instance returns one shared no-op context
+    manager from ``span`` and ignores ``add``, so instrumented code costs a method call.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.spans: Dict[tuple, list] = {}
+        self.counters: Dict[tuple, float] = {}
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+
+    def span(self, stage, table=ALL_TABLES):
+        if not self.enabled:
+            return _NOOP
+        return self._span(stage, table or ALL_TABLES)
+
+    @contextmanager
+    def _span(self, stage, table):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, table, time.perf_counter() - started)
+
+    def observe(self, stage, table, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            entry = self.spans.get((stage, table))
+            if entry is None:
+                # count, sum, max, then one counter per bucket
+                entry = self.spans[(stage, table)] = [0, 0.0, 0.0] + [0] * len(BUCKETS)
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            for position, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[3 + position] += 1
+                    break
+
+    def add(self, name, value=1, table=ALL_TABLES):
+        if not self.enabled:
+            return
+        key = (name, table or ALL_TABLES)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def report(self) -> Dict:
+        """Return ``{'tables': {table: {...}}, 'total': {...}}`` with stage seconds and counters."""
+        with self.lock:
+            spans = {key: list(entry) for key, entry in self.spans.items()}
+            counters = dict(self.counters)
+        tables: Dict[str, Dict] = {}
+        for (stage, table), entry in spans.items():
+            stages = tables.setdefault(table, {'stages': {}})['stages']
+            stages[stage] = {'count': entry[0], 'seconds': entry[1], 'max': entry[2]}
+        for (name, table), value in counters.items():
+            tables.setdefault(table, {'stages': {}})[name] = value
+
+        total = {'stages': {}, 'elapsed': time.time() - self.started_at}
+        for table in tables.values():
+            for stage, entry in table['stages'].items():
+                summed = total['stages'].setdefault(stage, {'count': 0, 'seconds': 0.0, 'max': 0.0})
+                summed['count'] += entry['count']
+                summed['seconds'] += entry['seconds']
+                summed['max'] = max(summed['max'], entry['max'])
+            for name, value in table.items():
+                if name != 'stages':
+                    total[name] = total.get(name, 0) + value
+        return {'tables': tables, 'total': total}
+
+    def prometheus(self, prefix: str = 'testdata', labels: Dict[str, str] = None) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        with self.lock:
+            spans = {key: list(entry) for key, entry in self.spans.items()}
+            counters = dict(self.counters)
+        extra = labels or {}
+        lines = [f"# HELP {prefix}_stage_seconds Time spent per generation stage and table.",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+        for (stage, table), entry in sorted(spans.items()):
+            base = {**extra, 'stage': stage, 'table': table}
+            cumulative = 0
+            for position, bound in enumerate(BUCKETS):
+                cumulative += entry[3 + position]
+                lines.append(f"{prefix}_stage_seconds_bucket{self._labels({**base, 'le': str(bound)})} {cumulative}")
+            lines.append(f"{prefix}_stage_seconds_bucket{self._labels({**base, 'le': '+Inf'})} {entry[0]}")
+            lines.append(f"{prefix}_stage_seconds_sum{self._labels(base)} {entry[1]:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{self._labels(base)} {entry[0]}")
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for (counter, table), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"{prefix}_{name}_total{self._labels({**extra, 'table': table})} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _labels(self, labels):
+        escaped = (f'{key}="{self._escape(value)}"' for key, value in labels.items())
+        return "{" + ",".join(escaped) + "}"
+
+    def _escape(self, value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def report_rows(report: Dict) -> List[Dict]:
+    """Flatten a ``Metrics.report()`` into one row per table, with seconds per stage and the counters."""
+    rows = []
+    for table, entry in sorted(report['tables'].items()):
+        row = {'table': table or '(all tables)'}
+        for stage in STAGES:
+            if stage in entry['stages']:
+                row[f'{stage}_s'] = round(entry['stages'][stage]['seconds'], 3)
+        row.update({name: value for name, value in entry.items() if name != 'stages'})
+        rows.append(row)
+    return rows
@@ -0,0 +1,201 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from columnar_converter import ColumnarConverter, NoRecordsError
+from data_converter import DataConverter
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# Formats whose converted chunks are joined into one file without decoding them again
+CHUNKED_FORMATS = ('CSV', 'JSON')
+COPY_BUFFER = 1024 * 1024
+# Workers are never forked from the app's or the job service's threads, which may hold locks a
+# forked child would wait for forever. The fork server is a clean single-threaded process
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# Set once worker processes failed to start, later exports of the process go straight to threads
+_workers_failed = False
+
+
+def row_ranges(content: bytes, chunk_bytes: int):
+    """Split CSV bytes into the header's end and byte ranges of about ``chunk_bytes`` ending on row boundaries.
+
+    A newline ends a row when it follows an even number of quotes, escaped quotes come in pairs,
+    so quoted fields with newlines are never cut.
+    """
+    header_end = _row_end(content, 0, 0)
+    ranges = []
+    start = header_end
+    while start < len(content):
+        end = _row_end(content, start, min(start + chunk_bytes, len(content)))
+        ranges.append((start, end))
+        start = end
+    return header_end, ranges
+
+
+def _row_end(content, start, position):
+    """Position after the first row-ending newline at or after ``position``, counting quotes from ``start``."""
+    quotes = content.count(b'"', start, position)
+    while True:
+        newline = content.find(b'\n', position)
+        if newline < 0:
+            return len(content)
+        quotes += content.count(b'"', position, newline)
+        if quotes % 2 == 0:
+            return newline + 1
+        position = newline + 1
+
+
+def _convert_file(engine, source, format, table_name, output):
+    """Convert a spooled CSV file into ``output``; runs in a worker process. Returns the seconds taken."""
+    started = time.perf_counter()
+    with open(output, 'wb') as f:
+        DataConverter(engine).convert_to_file(Path(source), format, table_name, f)
+    return time.perf_counter() - started
+
+
+def _convert_chunk(source, header_end, start, end, format, table_name, output):
+    """Convert the rows between ``start`` and ``end`` of a spooled CSV file, below its header, into ``output``.
+
+    A chunk of only empty rows leaves ``output`` empty, it is skipped when the chunks are joined.
+    """
+    started = time.perf_counter()
+    with open(source, 'rb') as f:
+        header = f.read(header_end)
+        f.seek(start)
+        rows = f.read(end - start)
+    with open(output, 'wb') as f:
+        try:
+            ColumnarConverter().convert(header + rows, format, table_name, f)
+        except NoRecordsError:
+            f.seek(0)
+            f.truncate()
+    return time.perf_counter() - started
+
+
+class ParallelExporter:
+    """Convert generated tables into export files on a process pool, one task per table and format.
+
+    Tables are spooled to CSV files once and workers convert file to file, so neither the data
+    nor the converted output is pickled between processes. CSV and JSON outputs of tables
+    larger than ``chunk_bytes`` are converted in chunks of rows by several workers and joined
+    in order; Parquet and Excel files are encoded whole. Exports smaller than ``min_bytes`` run
+    on threads, where starting worker processes would take longer than the conversion.
+
+    Workers import the main module again. When that fails, e.g. under ``streamlit run``, where
+    app/streamlit.py shadows the package the entry point imports, the export and every later
+    one are converted on threads instead.
+    """
+
+    def __init__(self, max_workers: int = None, chunk_bytes: int = 64 * 1024 * 1024, min_bytes: int = 16 * 1024 * 1024,
+                 metrics: Metrics = None, engine: str = 'auto'):
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.chunk_bytes = chunk_bytes
+        self.min_bytes = min_bytes
+        self.metrics = metrics or Metrics(enabled=False)
+        self.engine = DataConverter(engine).engine
+
+    def export(self, data: Dict[str, str], formats: List[str], path: Callable, name: Callable = None):
+        """Write every table of ``data`` in each format to ``path(table, format)``.
+
+        ``name(table)`` is the table name passed to the converter. Returns ``(table, format, path,
+        error)`` for every file in table and format order, with either the path or the error set.
+        """
+        name = name or (lambda table: table)
+        tables = [table for table in data if data[table]]
+        if not tables:
+            return []
+        spool = tempfile.mkdtemp(prefix='.export-', dir=os.path.dirname(path(tables[0], formats[0])) or '.')
+        global _workers_failed
+        try:
+            if sum(len(data[table]) for table in tables) < self.min_bytes or self.max_workers == 1 or _workers_failed:
+                return self._export(ThreadPoolExecutor(max_workers=self.max_workers), data, tables, formats, path, name, spool)
+            logger.debug("Converting %s tables on %s worker processes", len(tables), self.max_workers)
+            try:
+                return self._export(ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context(START_METHOD)),
+                                    data, tables, formats, path, name, spool)
+            except BrokenProcessPool as e:
+                logger.warning("Worker processes failed to start, converting on threads from now on: %s", e)
+                _workers_failed = True
+                return self._export(ThreadPoolExecutor(max_workers=self.max_workers), data, tables, formats, path, name, spool)
+        finally:
+            shutil.rmtree(spool, ignore_errors=True)
+
+    def _export(self, executor, data, tables, formats, path, name, spool):
+        """Submit every table and format to ``executor`` and collect the results in order."""
+        with executor:
+            tasks = []
+            for position, table in enumerate(tables):
+                source = os.path.join(spool, f"{position}.csv")
+                content = data[table].encode('utf-8')
+                with open(source, 'wb') as f:
+                    f.write(content)
+                chunked = self.engine == 'columnar' and len(content) > self.chunk_bytes
+                # Ranges are found on the bytes already in memory, workers read their rows from the spool
+                header_end, ranges = row_ranges(content, self.chunk_bytes) if chunked else (0, [])
+                del content
+                for format in formats:
+                    if chunked and format in CHUNKED_FORMATS and len(ranges) > 1:
+                        parts = [os.path.join(spool, f"{position}.{format}.{part}") for part in range(len(ranges))]
+                        futures = [executor.submit(_convert_chunk, source, header_end, start, end, format, name(table), part)
+                                   for (start, end), part in zip(ranges, parts)]
+                    else:
+                        parts = None
+                        futures = [executor.submit(_convert_file, self.engine, source, format, name(table), path(table, format))]
+                    tasks.append((table, format, parts, futures))
+            results = [self._finish(table, format, path(table, format), parts, futures) for table, format, parts, futures in tasks]
+        broken = next((error for _, _, _, error in results if isinstance(error, BrokenProcessPool)), None)
+        if broken is not None:
+            raise broken
+        return results
+
+    def _finish(self, table, format, output, parts, futures):
+        try:
+            seconds = sum(future.result() for future in futures)
+            if parts:
+                started = time.perf_counter()
+                self._join(format, parts, output)
+                seconds += time.perf_counter() - started
+        except Exception as e:
+            return table, format, None, e
+        self.metrics.observe('convert', table, seconds)
+        return table, format, output, None
+
+    def _join(self, format, parts, output):
+        """Join converted chunks: CSV parts after the first lose their header, JSON parts their brackets.
+
+        Empty parts, of chunks without rows, are skipped; a table without any rows fails as it
+        would unchunked.
+        """
+        parts = [part for part in parts if os.path.getsize(part)]
+        if not parts:
+            raise NoRecordsError("No records found in the provided data")
+        with open(output, 'wb') as out:
+            if format == 'JSON':
+                out.write(b"[")
+            for position, part in enumerate(parts):
+                with open(part, 'rb') as f:
+                    if format == 'CSV':
+                        if position:
+                            f.readline()
+                        shutil.copyfileobj(f, out, COPY_BUFFER)
+                    else:
+                        remaining = os.path.getsize(part) - 2
+                        f.seek(1)
+                        if position:
+                            out.write(b",")
+                        while remaining > 0:
+                            block = f.read(min(COPY_BUFFER, remaining))
+                            out.write(block)
+                            remaining -= len(block)
+                os.remove(part)
+            if format == 'JSON':
+                out.write(b"]")
@@ -0,0 +1,183 @@
+import logging
+from typing import Dict, List
+
+import pandas as pd
+from psycopg2 import sql
+
+from validator import FLOAT_TYPES, INTEGER_RANGES
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_MODES = ('tablesample', 'limit')
+# Rows sampled per row kept, TABLESAMPLE returns a varying number of rows around the expected count
+OVERSAMPLE = 2
+# Relation kinds TABLESAMPLE works on: ordinary and partitioned tables and materialized views
+SAMPLEABLE_KINDS = ('r', 'p', 'm')
+TEXT_TYPES = ('text', 'character', 'varchar', 'char', 'bpchar', 'json', 'jsonb', 'xml', 'bytea')
+
+
+class PostgresSampler:
+    """Sample and profile a Postgres table on the server instead of reading its first rows.
+
+    ``sample`` reads ``rows`` random rows with ``TABLESAMPLE ... REPEATABLE(seed)``: BERNOULLI picks
+    single rows, SYSTEM whole pages, which only reads a few pages of tables larger than
+    ``system_above`` rows. Only the schema's columns are read and text values are cut to
+    ``max_length`` characters on the server. Views and tables never analyzed are read with LIMIT.
+
+    ``profile`` takes the null rate, distinct count, most common values and value range of every
+    column from ``pg_stats``, which ANALYZE keeps for the whole table, in one catalog query.
+    Columns without statistics are profiled by one aggregate query over a sample of
+    ``profile_rows`` rows. Both cost the same on a table of 500M rows as on one of 500.
+
+    Tables are looked up in ``schema_name``, not along the connection's search path.
+    """
+
+    def __init__(self, rows: int = 100, seed: int = 0, system_above: int = 1000000, profile_rows: int = 10000,
+                 top_values: int = 5, min_share: float = 0.01, max_length: int = 1000, schema_name: str = 'public'):
+        self.schema_name = schema_name
+        self.rows = rows
+        self.seed = seed
+        self.system_above = system_above
+        self.profile_rows = profile_rows
+        self.top_values = top_values
+        self.min_share = min_share
+        self.max_length = max_length
+
+    def relation(self, conn, table):
+        """Return the schema, name, kind and estimated row count of a table; the count is None when unknown."""
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT n.nspname, c.relname, c.relkind, c.reltuples::bigint
+                FROM pg_catalog.pg_class c
+                JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+                WHERE c.oid = to_regclass(%s)
+            """, (sql.Identifier(self.schema_name, table).as_string(conn),))
+            row = cur.fetchone()
+        if row is None:
+            raise ValueError(f"Table not found: {self.schema_name}.{table}")
+        schema_name, name, kind, estimate = row
+        # reltuples is -1 (0 before Postgres 14) until the table is analyzed
+        return {'schema': schema_name, 'name': name, 'kind': kind, 'rows': estimate if estimate > 0 else None}
+
+    def sample(self, conn, table, schema: List[tuple], relation: Dict = None) -> pd.DataFrame:
+        """Return about ``rows`` random rows of the schema's columns."""
+        relation = relation or self.relation(conn, table)
+        columns = sql.SQL(', ').join(self._select(column) for column in schema)
+        query = sql.SQL("SELECT {columns} FROM {table}").format(columns=columns, table=sql.Identifier(relation['schema'], relation['name']))
+        sampled = self._tablesample(relation, self.rows)
+        with conn.cursor() as cur:
+            if sampled is not None:
+                cur.execute(query + sampled + sql.SQL(" LIMIT %s"), (self.rows,))
+                data = cur.fetchall()
+            if sampled is None or not data:
+                # Views can't be sampled, and an outdated estimate can make the sample come back empty
+                logger.debug("Reading the first %s rows of %s as its sample", self.rows, table)
+                cur.execute(query + sql.SQL(" LIMIT %s"), (self.rows,))
+                data = cur.fetchall()
+            column_names = [desc[0] for desc in cur.description]
+        return pd.DataFrame(data, columns=column_names)
+
+    def profile(self, conn, table, schema: List[tuple], relation: Dict = None) -> Dict:
+        """Return the estimated row count and statistics per column, for ``SampleProfiler.describe``."""
+        relation = relation or self.relation(conn, table)
+        types = {column[0]: (column[1] or '').lower() for column in schema}
+        statistics = []
+        with conn.cursor() as cur:
+            # ANALYZE sets the statistics and the estimate together, without one there are none
+            if relation['rows'] is not None:
+                # Partitioned and inheritance parents have statistics over their children, preferred
+                cur.execute("""
+                    SELECT DISTINCT ON (attname) attname, null_frac, n_distinct,
+                           array_to_json(most_common_vals::text::text[]), array_to_json(most_common_freqs),
+                           array_to_json(histogram_bounds::text::text[])
+                    FROM pg_catalog.pg_stats
+                    WHERE schemaname = %s AND tablename = %s AND attname = ANY(%s)
+                    ORDER BY attname, inherited DESC
+                """, (relation['schema'], relation['name'], list(types)))
+                statistics = cur.fetchall()
+
+        rows = relation['rows']
+        columns = {}
+        for name, null_frac, n_distinct, values, freqs, bounds in statistics:
+            present = rows * (1 - null_frac)
+            stats = {'null_rate': null_frac, 'count': int(present),
+                     # Negative n_distinct is the distinct count as a fraction of the rows
+                     'distinct': int(-n_distinct * rows if n_distinct < 0 else n_distinct)}
+            if null_frac < 1:
+                # Frequencies are of all rows, the profile's shares of the present values. Values
+                # below min_share are only the most common of many and don't describe the column
+                shares = [(value, freq / (1 - null_frac)) for value, freq in zip(values or [], freqs or [])]
+                stats['top'] = [(value, share) for value, share in shares if share >= self.min_share][:self.top_values]
+            if self._ranged(types[name]):
+                # The histogram leaves out the most common values, either may hold the extremes
+                candidates = (bounds or []) + (values or [])
+                if candidates:
+                    stats['range'] = self._range(candidates)
+            columns[name] = stats
+
+        missing = [column for column in schema if column[0] not in columns]
+        if missing:
+            columns.update(self._aggregate(conn, relation, missing))
+        return {'rows': rows, 'columns': columns}
+
+    def _aggregate(self, conn, relation, schema):
+        """Profile columns without statistics with one aggregate query over a sample."""
+        items = [sql.SQL("count(*)")]
+        for column in schema:
+            identifier = sql.Identifier(column[0])
+            items += [sql.SQL("count({0})").format(identifier), sql.SQL("count(DISTINCT {0}::text)").format(identifier)]
+            if self._ranged((column[1] or '').lower()):
+                items += [sql.SQL("min({0})::text").format(identifier), sql.SQL("max({0})::text").format(identifier)]
+        table = sql.Identifier(relation['schema'], relation['name'])
+        sampled = self._tablesample(relation, self.profile_rows)
+        if sampled is not None:
+            source = table + sampled
+        else:
+            # Without an estimate the aggregate runs over the first profile_rows rows
+            source = sql.SQL("(SELECT * FROM {table} LIMIT {limit}) s").format(table=table, limit=sql.Literal(self.profile_rows))
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("SELECT {items} FROM {source}").format(items=sql.SQL(', ').join(items), source=source))
+            row = cur.fetchone()
+
+        total, position, columns = row[0], 1, {}
+        for column in schema:
+            present, distinct = row[position], row[position + 1]
+            position += 2
+            stats = {'null_rate': 1 - present / total if total else 0}
+            if present and distinct == present and relation['rows']:
+                # Unique in the sample, taken as unique in the table
+                stats['count'] = stats['distinct'] = int(relation['rows'] * present / total)
+            if self._ranged((column[1] or '').lower()):
+                if row[position] is not None:
+                    stats['range'] = (row[position], row[position + 1])
+                position += 2
+            columns[column[0]] = stats
+        return columns
+
+    def _tablesample(self, relation, rows):
+        """Return the TABLESAMPLE clause reading about ``rows`` rows, None when the table can't be sampled."""
+        if relation['kind'] not in SAMPLEABLE_KINDS or relation['rows'] is None:
+            return None
+        percent = min(100.0, 100.0 * rows * OVERSAMPLE / relation['rows'])
+        method = 'SYSTEM' if relation['rows'] > self.system_above else 'BERNOULLI'
+        return sql.SQL(" TABLESAMPLE {method} ({percent}) REPEATABLE ({seed})").format(
+            method=sql.SQL(method), percent=sql.Literal(percent), seed=sql.Literal(int(self.seed)))
+
+    def _select(self, column):
+        name, data_type = column[0], (column[1] or '').lower()
+        if data_type.startswith(TEXT_TYPES):
+            return sql.SQL("left({0}::text, {1}) AS {0}").format(sql.Identifier(name), sql.Literal(self.max_length))
+        return sql.Identifier(name)
+
+    def _ranged(self, data_type):
+        """Whether the profiler shows a value range for the type: numbers, dates and timestamps."""
+        return (data_type in INTEGER_RANGES or data_type in FLOAT_TYPES or data_type.startswith(('numeric', 'decimal'))
+                or data_type == 'date' or data_type.startswith('timestamp'))
+
+    def _range(self, values):
+        try:
+            numbers = [float(value) for value in values]
+        except ValueError:
+            # Dates and timestamps in ISO format order as text
+            return min(values), max(values)
+        return values[numbers.index(min(numbers))], values[numbers.index(max(numbers))]
@@ -0,0 +1,146 @@
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+FANOUTS = ('uniform', 'round_robin', 'zipf')
+
+
+class KeyRegistry:
+    """Compact key arrays of generated parent tables.
+
+    Only columns some selected child table references are kept. The referenced columns of a
+    table are stored row-aligned, so the columns of a composite key can be sampled together.
+    Integer keys are stored as int64 arrays, other keys as fixed-width string arrays.
+    """
+
+    def __init__(self, relationships: List[Dict], selected_tables: List[str]):
+        self.referenced: Dict[str, List[str]] = {}
+        for rel in relationships:
+            if rel['child_table'] in selected_tables and rel['parent_table'] in selected_tables:
+                columns = self.referenced.setdefault(rel['parent_table'], [])
+                if rel['parent_column'] not in columns:
+                    columns.append(rel['parent_column'])
+        self.pending: Dict[str, Dict[str, list]] = {}
+        self.keys: Dict[str, Dict[str, np.ndarray]] = {}
+        self.lock = threading.Lock()
+
+    def collect(self, table, header, rows):
+        """Keep the referenced columns of a batch of generated rows; raises ValueError if one is missing."""
+        columns = self.referenced.get(table)
+        if not columns:
+            return
+        missing = [column for column in columns if column not in header]
+        if missing:
+            # Children would get empty foreign keys otherwise
+            raise ValueError(f"Generated rows of {table} lack the column(s) {', '.join(missing)} referenced by child tables")
+        positions = [(column, header.index(column)) for column in columns]
+        with self.lock:
+            pending = self.pending.setdefault(table, {column: [] for column in columns})
+        for column, position in positions:
+            pending[column].extend(row[position] if position < len(row) else '' for row in rows)
+
+    def finalize(self, table):
+        """Turn the collected keys of a finished table into arrays."""
+        with self.lock:
+            pending = self.pending.pop(table, None)
+        if pending is None:
+            return
+        arrays = {}
+        for column, values in pending.items():
+            try:
+                arrays[column] = np.array(values, dtype=np.int64)
+            except (ValueError, OverflowError):
+                # Non-integer keys, or integers beyond int64 like numeric(30) keys
+                arrays[column] = np.array(values, dtype=str)
+        with self.lock:
+            self.keys[table] = arrays
+
+    def has_keys(self, table, column):
+        return column in self.keys.get(table, {})
+
+    def get(self, table, column) -> np.ndarray:
+        return self.keys[table][column]
+
+    def row_count(self, table):
+        arrays = self.keys.get(table, {})
+        return len(next(iter(arrays.values()))) if arrays else 0
+
+    def restore(self, table, arrays: Dict[str, np.ndarray]):
+        with self.lock:
+            self.keys[table] = arrays
+
+
+class ForeignKeyAssigner:
+    """Fill foreign key columns of generated rows by sampling parent keys locally.
+
+    Relationships sharing a ``constraint_name`` form one composite key and are filled from the
+    same parent row. ``fanout`` controls how children spread over parents: ``uniform`` picks
+    parents at random, ``round_robin`` gives every parent the same number of children and
+    ``zipf`` gives a few parents most of the children, with exponent ``zipf_exponent``.
+    """
+
+    def __init__(self, registry: KeyRegistry, relationships: List[Dict], fanout: str = 'uniform',
+                 zipf_exponent: float = 1.2, seed: int = None):
+        if fanout not in FANOUTS:
+            raise ValueError(f"Unsupported fan-out distribution: {fanout}")
+        self.registry = registry
+        self.relationships = relationships
+        self.fanout = fanout
+        self.zipf_exponent = zipf_exponent
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        # Rows assigned so far per constraint, round_robin continues where the last batch stopped
+        self.assigned: Dict[tuple, int] = {}
+        self.weights: Dict[str, np.ndarray] = {}
+
+    def foreign_keys(self, table):
+        """Group the resolvable relationships of a child table by constraint."""
+        constraints: Dict[tuple, List[Dict]] = {}
+        for rel in self.relationships:
+            if rel['child_table'] == table and self.registry.has_keys(rel['parent_table'], rel['parent_column']):
+                key = (rel['parent_table'], rel.get('constraint_name') or rel['child_column'])
+                constraints.setdefault(key, []).append(rel)
+        return constraints
+
+    def fill(self, table, header, rows):
+        """Overwrite the foreign key columns of a batch of rows in place."""
+        if not rows:
+            return rows
+        for key, rels in self.foreign_keys(table).items():
+            parent_table = rels[0]['parent_table']
+            parent_rows = self._sample(key, parent_table, len(rows))
+            for rel in rels:
+                if rel['child_column'] not in header:
+                    continue
+                position = header.index(rel['child_column'])
+                values = self.registry.get(parent_table, rel['parent_column'])[parent_rows].astype(str)
+                for row, value in zip(rows, values):
+                    if position >= len(row):
+                        row.extend([''] * (position + 1 - len(row)))
+                    row[position] = value
+        return rows
+
+    def _sample(self, key, parent_table, n):
+        parents = self.registry.row_count(parent_table)
+        if parents == 0:
+            raise ValueError(f"No keys generated for parent table {parent_table}")
+        if self.fanout == 'round_robin':
+            with self.lock:
+                start = self.assigned.get(key, 0)
+                self.assigned[key] = start + n
+            return (start + np.arange(n)) % parents
+        if self.fanout == 'zipf':
+            weights = self._zipf_weights(parent_table, parents)
+            return self.rng.choice(parents, n, p=weights)
+        return self.rng.integers(0, parents, n)
+
+    def _zipf_weights(self, parent_table, parents):
+        with self.lock:
+            weights = self.weights.get(parent_table)
+            if weights is None or len(weights) != parents:
+                weights = 1.0 / np.arange(1, parents + 1) ** self.zipf_exponent
+                # Shuffle so the most popular parents aren't simply the first ones generated
+                weights = self.rng.permutation(weights / weights.sum())
+                self.weights[parent_table] = weights
+        return weights
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ai-test-data-generator', 'responses')
+
+
+class ResponseCache:
+    """On-disk cache of model responses, keyed by a hash of the model and the normalized prompt.
+
+    Entries older than ``max_age`` seconds are treated as misses, and the oldest entries are
+    evicted once the cache grows beyond ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = 512 * 1024 * 1024, max_age: float = 7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(size for _, _, size in self._entries())
+
+    def key(self, model: str, messages) -> str:
+        """Hash the model name and the messages with whitespace differences normalized away."""
+        normalized = [
+            {'role': message['role'],
+             'content': '\n'.join(re.sub(r'[ \t]+', ' ', line).strip() for line in message['content'].strip().splitlines())}
+            for message in messages
+        ]
+        payload = json.dumps({'model': model, 'messages': normalized}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """Return the cached response for ``key``, or None on a miss."""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                self._remove(path)
+                raise FileNotFoundError(path)
+            with open(path, encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return content
+
+    def put(self, key: str, content: str):
+        """Store a response and evict the oldest entries if the cache is over its size limit."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = content.encode('utf-8')
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.size += len(data)
+            self.counters['writes'] += 1
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove expired entries, then the oldest ones until the cache fits into ``max_bytes``."""
+        with self.lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            now = time.time()
+            self.size = sum(size for _, _, size in entries)
+            for path, mtime, size in entries:
+                if self.size <= self.max_bytes and now - mtime <= self.max_age:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.size -= size
+                self.counters['evictions'] += 1
+
+    def clear(self):
+        for path, _, _ in list(self._entries()):
+            self._remove(path)
+        with self.lock:
+            self.size = 0
+
+    def stats(self):
+        """Return the hit/miss/write/eviction counters and the current cache size."""
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return dict(self.counters, size_bytes=self.size,
+                        hit_rate=self.counters['hits'] / lookups if lookups else 0.0)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.txt'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
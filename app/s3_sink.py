@@ -0,0 +1,180 @@
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# S3 takes parts of at least 5 MiB, except for the last one, and at most 10000 parts per object
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+def split_location(location: str) -> Tuple[str, str]:
+    """Return the bucket and the key prefix, empty or ending in a slash, of an s3:// location."""
+    parsed = urlparse(location)
+    if parsed.scheme not in ('s3', 's3a', 's3n') or not parsed.netloc:
+        raise ValueError(f"Not an S3 location: {location}")
+    prefix = parsed.path.strip('/')
+    return parsed.netloc, f"{prefix}/" if prefix else ''
+
+
+class S3Sink:
+    """Write export files to S3-compatible storage with concurrent multipart uploads.
+
+    ``open(location, name)`` returns a file to write one object to, e.g. from a converter, and
+    ``upload_files`` copies written files ``max_uploads`` at a time. Data is cut into parts of
+    ``part_size`` bytes that are uploaded on ``max_workers`` threads shared by all uploads; an
+    upload holds at most ``max_in_flight`` parts and writes wait for a free slot, so memory stays
+    bounded however large the files are. A failed upload is aborted, which removes its parts.
+
+    ``client`` is a boto3 S3 client; create it with ``endpoint_url`` for MinIO and other
+    S3-compatible stores.
+    """
+
+    def __init__(self, client, part_size: int = 16 * 1024 * 1024, max_workers: int = 8, max_in_flight: int = 4,
+                 max_uploads: int = 4):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"Parts must be at least {MIN_PART_SIZE} bytes")
+        self.client = client
+        self.part_size = part_size
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_uploads = max(1, max_uploads)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='s3-upload')
+
+    def open(self, location: str, name: str) -> 'S3Upload':
+        """Start writing the object ``name`` under ``location``; close the upload to finish it."""
+        bucket, prefix = split_location(location)
+        return S3Upload(self, bucket, prefix + name)
+
+    def upload_file(self, path: str, location: str, name: str = None) -> str:
+        """Upload a file under ``location``, by default with its own name; returns the object's URL."""
+        with self.open(location, name or os.path.basename(path)) as upload, open(path, 'rb') as f:
+            shutil.copyfileobj(f, upload, self.part_size)
+        return upload.url
+
+    def upload_files(self, files: List[Tuple[str, str]]) -> List[Tuple[str, str, Exception]]:
+        """Upload ``(path, location)`` pairs; returns ``(path, url, error)`` per file, with the URL or the error set."""
+        def upload(path, location):
+            try:
+                return path, self.upload_file(path, location), None
+            except Exception as e:
+                return path, None, e
+
+        with ThreadPoolExecutor(max_workers=self.max_uploads) as executor:
+            return list(executor.map(lambda item: upload(*item), files))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class S3Upload:
+    """A writable file uploading one object in parts, completed on ``close`` and aborted on errors.
+
+    Objects smaller than one part are written with a single PutObject instead.
+    """
+
+    def __init__(self, sink: S3Sink, bucket: str, key: str):
+        self.sink = sink
+        self.bucket = bucket
+        self.key = key
+        self.buffer = bytearray()
+        self.position = 0
+        self.upload_id = None
+        self.futures = []
+        self.slots = threading.BoundedSemaphore(sink.max_in_flight)
+        # The first failed part, which fails the upload at the next write rather than at close
+        self.error = None
+        self.closed = False
+
+    @property
+    def url(self):
+        return f"s3://{self.bucket}/{self.key}"
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError(f"Upload of {self.url} is closed")
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.sink.part_size:
+            part = bytes(self.buffer[:self.sink.part_size])
+            del self.buffer[:self.sink.part_size]
+            self._submit(part)
+        return len(data)
+
+    def close(self):
+        """Upload the rest and complete the object."""
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.sink.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            else:
+                if self.buffer:
+                    self._submit(bytes(self.buffer))
+                parts = [future.result() for future in self.futures]
+                self.sink.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                           MultipartUpload={'Parts': parts})
+        except Exception:
+            self.abort()
+            raise
+        self.closed = True
+        self.buffer = bytearray()
+
+    def abort(self):
+        """Drop the object: parts not sent yet are cancelled and uploaded ones are deleted."""
+        self.closed = True
+        self.buffer = bytearray()
+        for future in self.futures:
+            future.cancel()
+        # Parts still being sent would otherwise land after the abort and stay in the bucket
+        wait(self.futures)
+        if self.upload_id is not None:
+            try:
+                self.sink.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            except Exception as e:
+                logger.warning("Failed to abort the upload of %s: %s", self.url, e)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def _submit(self, part):
+        if self.error is not None:
+            raise self.error
+        if len(self.futures) >= MAX_PARTS:
+            raise ValueError(f"{self.url} needs more than {MAX_PARTS} parts, raise the part size")
+        if self.upload_id is None:
+            self.upload_id = self.sink.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+        self.slots.acquire()
+        future = self.sink.executor.submit(self._upload_part, len(self.futures) + 1, part)
+        future.add_done_callback(self._part_done)
+        self.futures.append(future)
+
+    def _part_done(self, future):
+        self.slots.release()
+        if not future.cancelled() and future.exception() is not None and self.error is None:
+            self.error = future.exception()
+
+    def _upload_part(self, number, part):
+        response = self.sink.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                PartNumber=number, Body=part)
+        return {'PartNumber': number, 'ETag': response['ETag']}
@@ -0,0 +1,213 @@
+import math
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - the character heuristic is used instead
+    tiktoken = None
+
+# Rough number of characters per token of English text and CSV
+CHARS_PER_TOKEN = 4
+# Values longer than this are cut in profiles and example rows
+MAX_VALUE_LENGTH = 40
+DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?'
+
+
+class TokenEstimator:
+    """Count prompt tokens with tiktoken when it is installed, otherwise estimate them from the length."""
+
+    def __init__(self, encoding: str = 'o200k_base'):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding)
+            except Exception:
+                # The encoding files are downloaded on first use, which fails offline
+                self.encoding = None
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class SampleProfiler:
+    """Describe a sample as a compact per-column profile plus a few example rows.
+
+    Every column gets its type, null rate and distinct count, plus top values, value ranges,
+    string lengths or the dominant character pattern, whichever applies. All statistics are
+    computed column-wise with pandas. The description is shrunk step by step (fewer example
+    rows, fewer top values, then fewer columns) until it fits in ``max_tokens``, so a prompt
+    has the same size however wide the table or large the upload is. Samples longer than
+    ``max_rows`` are profiled from a random subset.
+
+    ``describe`` also takes statistics of the whole table, like ``PostgresSampler.profile``
+    returns them; they replace the ones computed from the sample.
+    """
+
+    def __init__(self, max_tokens: int = 1000, example_rows: int = 5, top_values: int = 5, max_rows: int = 10000,
+                 estimator: TokenEstimator = None):
+        self.max_tokens = max_tokens
+        self.example_rows = example_rows
+        self.top_values = top_values
+        self.max_rows = max_rows
+        self.estimator = estimator or TokenEstimator()
+
+    def describe(self, sample, stats: Dict = None) -> str:
+        """Return the profile text of a DataFrame that fits the token budget.
+
+        ``stats`` holds the table's estimated ``rows`` and per column any of ``null_rate``,
+        ``distinct``, ``count``, ``range`` and ``top``.
+        """
+        if sample is None or len(sample.columns) == 0:
+            return "No sample records available."
+        df = sample
+        if len(df) > self.max_rows:
+            df = df.sample(self.max_rows, random_state=0)
+        profiles = [self.profile_column(df[column]) for column in df.columns]
+        table_rows = None
+        if stats:
+            table_rows = stats.get('rows')
+            for profile in profiles:
+                profile.update(stats.get('columns', {}).get(profile['name'], {}))
+
+        text = ""
+        for examples in sorted({self.example_rows, min(self.example_rows, 2), 1, 0}, reverse=True):
+            for top in sorted({self.top_values, min(self.top_values, 3), 1}, reverse=True):
+                text = self.render(df, profiles, len(sample), examples, top, table_rows)
+                if self.estimator.count(text) <= self.max_tokens:
+                    return text
+        return self._drop_columns(df, profiles, len(sample), table_rows)
+
+    def profile_column(self, series: pd.Series) -> Dict:
+        """Return the statistics of one column."""
+        rows = len(series)
+        values = series.dropna()
+        if self._is_text(values):
+            values = values.astype(str)
+            values = values[values.str.strip() != '']
+        profile = {'name': str(series.name), 'null_rate': 1 - len(values) / rows if rows else 0,
+                   'distinct': int(values.nunique()), 'count': len(values)}
+        if values.empty:
+            profile['type'] = 'empty'
+            return profile
+
+        kind = self._infer_type(values)
+        profile['type'] = kind
+        if kind in ('integer', 'float'):
+            numbers = pd.to_numeric(values, errors='coerce')
+            profile['range'] = (numbers.min(), numbers.max())
+            profile['mean'] = numbers.mean()
+        elif kind in ('date', 'timestamp'):
+            dates = values.astype(str).str.slice(0, 10 if kind == 'date' else 19)
+            profile['range'] = (dates.min(), dates.max())
+        elif kind == 'string':
+            lengths = values.str.len()
+            profile['length'] = (int(lengths.min()), int(lengths.max()))
+            shapes = values.str.slice(0, MAX_VALUE_LENGTH).str.replace(r'[A-Z]', 'A', regex=True) \
+                .str.replace(r'[a-z]', 'a', regex=True).str.replace(r'\d', '9', regex=True)
+            shape_counts = shapes.value_counts()
+            # A pattern is only worth sending when most values share it, like codes or phone numbers
+            if shape_counts.iloc[0] / len(values) >= 0.5 and profile['distinct'] > 1:
+                profile['pattern'] = shape_counts.index[0]
+
+        # Top values describe categorical columns; unique or near-unique columns get none
+        if profile['distinct'] < len(values) and (profile['distinct'] <= 20 or profile['distinct'] <= len(values) / 2):
+            counts = values.astype(str).value_counts()
+            profile['top'] = [(value, count / len(values)) for value, count in counts.items()]
+        return profile
+
+    def render(self, df, profiles: List[Dict], sample_rows: int, examples: int, top: int, table_rows: int = None) -> str:
+        if table_rows:
+            lines = [f"Profile of a table of about {table_rows:,} records, with {sample_rows} sample records:"]
+        else:
+            lines = [f"Profile of {sample_rows} sample records:"]
+        lines += [self._render_column(profile, top) for profile in profiles]
+        if examples:
+            lines.append("Example records:")
+            lines.append(self._examples(df, examples).to_csv(index=False).strip())
+        return "\n".join(lines)
+
+    def _render_column(self, profile, top):
+        parts = [profile['type'], f"nulls {profile['null_rate']:.0%}"]
+        if profile['count'] and profile['distinct'] == profile['count'] and profile['count'] > 1:
+            parts.append("unique")
+        else:
+            parts.append(f"{profile['distinct']} distinct")
+        if 'range' in profile:
+            low, high = profile['range']
+            parts.append(f"range {self._format(low)}..{self._format(high)}")
+        if 'mean' in profile and profile['type'] == 'float':
+            parts.append(f"mean {self._format(profile['mean'])}")
+        if 'length' in profile:
+            parts.append(f"length {profile['length'][0]}..{profile['length'][1]}")
+        if 'pattern' in profile:
+            parts.append(f"pattern {profile['pattern']}")
+        if profile.get('top') and top:
+            values = ", ".join(f"{self._cut(value)} {share:.0%}" for value, share in profile['top'][:top])
+            parts.append(f"top {values}")
+        return f"- {profile['name']}: {', '.join(parts)}"
+
+    def _examples(self, df, count):
+        """Pick rows with the most filled fields, spread evenly over the sample."""
+        filled = df.notna().sum(axis=1).to_numpy()
+        candidates = np.flatnonzero(filled >= np.median(filled)) if len(df) else np.array([], dtype=int)
+        if len(candidates) > count:
+            candidates = candidates[np.linspace(0, len(candidates) - 1, count).astype(int)]
+        examples = df.iloc[candidates]
+        return examples.apply(lambda column: column.map(self._cut) if self._is_text(column) else column)
+
+    def _drop_columns(self, df, profiles, sample_rows, table_rows=None):
+        """Keep as many column profiles as fit the budget and only name the rest."""
+        def text(kept):
+            rendered = self.render(df, profiles[:kept], sample_rows, 0, 1, table_rows)
+            rest = [profile['name'] for profile in profiles[kept:]]
+            return rendered + (f"\nOther columns: {', '.join(rest)}" if rest else "")
+
+        # Binary search for the largest number of profiles that fits
+        low, high = 0, len(profiles)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.estimator.count(text(middle)) <= self.max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        result = text(low)
+        if self.estimator.count(result) > self.max_tokens:
+            # Even the column names alone are too long
+            result = result[:self.max_tokens * CHARS_PER_TOKEN]
+        return result
+
+    def _infer_type(self, values):
+        if values.dtype == bool or set(values.astype(str).str.lower().unique()) <= {'true', 'false'}:
+            return 'boolean'
+        if pd.api.types.is_integer_dtype(values):
+            return 'integer'
+        if pd.api.types.is_float_dtype(values):
+            return 'integer' if (values == values.round()).all() and values.abs().max() < 2 ** 53 else 'float'
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return 'timestamp'
+        text = values.astype(str)
+        numbers = pd.to_numeric(text, errors='coerce')
+        if numbers.notna().all():
+            return 'integer' if text.str.fullmatch(r'-?\d+').all() else 'float'
+        if text.str.match(DATE_PATTERN).all():
+            return 'date' if (text.str.len() == 10).all() else 'timestamp'
+        return 'string'
+
+    def _is_text(self, values):
+        return not (pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values)
+                    or pd.api.types.is_datetime64_any_dtype(values))
+
+    def _format(self, value):
+        if isinstance(value, (float, np.floating)):
+            return f"{value:.6g}"
+        return self._cut(str(value))
+
+    def _cut(self, value):
+        if isinstance(value, str) and len(value) > MAX_VALUE_LENGTH:
+            return value[:MAX_VALUE_LENGTH] + "..."
+        return value
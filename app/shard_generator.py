@@ -0,0 +1,145 @@
+import csv
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Tuple
+
+from csv_stream import CsvRowStream
+
+logger = logging.getLogger(__name__)
+
+INTEGER_TYPES = {'smallint', 'integer', 'bigint', 'int', 'int2', 'int4', 'int8', 'serial', 'bigserial'}
+
+
+class ShardedGenerator:
+    """Generate large tables as many small completions run in parallel.
+
+    The requested row count is split into shards of ``shard_size`` rows. Every shard is its own
+    completion; finished shards are merged into the output as soon as they arrive, so the number
+    of rows is no longer capped by what fits into a single response.
+
+    With a ``store``, e.g. ``Checkpoint.shards(table)``, every shard response is saved once it
+    arrives and shards saved by an earlier, interrupted run are read back instead of requested.
+
+    Shards are submitted a few at a time per worker. A shard that fails is logged and counted in
+    ``failed_shards`` and its rows are left missing, unless every shard failed; errors of the
+    ``abort_on`` types, e.g. a cancellation, stop the shards not started yet and are raised.
+    """
+
+    def __init__(self, complete: Callable[[str], str], shard_size: int = 500, max_workers: int = 8, store=None,
+                 abort_on: Tuple[type, ...] = ()):
+        if shard_size < 1:
+            raise ValueError("shard_size must be at least 1")
+        self.complete = complete
+        self.shard_size = shard_size
+        self.max_workers = max(1, max_workers)
+        self.store = store
+        self.abort_on = abort_on
+        self.failed_shards = 0
+
+    def split_rows(self, no_of_records: int) -> List[Tuple[int, int]]:
+        """Split a row count into (offset, count) shards."""
+        return [(offset, min(self.shard_size, no_of_records - offset))
+                for offset in range(0, no_of_records, self.shard_size)]
+
+    def generate(self, build_prompt: Callable[[int, int], str], no_of_records: int, out, primary_keys: Dict[str, str] = None,
+                 on_rows: Callable = None, offset: int = 0):
+        """Generate ``no_of_records`` rows and write them to ``out``, if given, as one CSV; returns the row count.
+
+        ``build_prompt(count, offset)`` returns the prompt of a single shard. ``primary_keys`` maps
+        primary key columns to their data types: integer keys are renumbered from the shard offset
+        and any other key value already written by an earlier shard is dropped, so keys stay unique
+        across shards. ``on_rows(header, rows)`` receives the rows of every merged shard. ``offset``
+        shifts the shards and their keys, for rows added to a table generated before.
+        """
+        primary_keys = primary_keys or {}
+        shards = iter([(offset + start, count) for start, count in self.split_rows(no_of_records)])
+        writer = csv.writer(out, lineterminator='\n') if out is not None else None
+        header = None
+        seen_keys = {column: set() for column, data_type in primary_keys.items() if not self._is_integer(data_type)}
+        rows_written = 0
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+
+            def submit():
+                # A bounded window of shards: an abort leaves nothing queued to wait for
+                for offset, count in shards:
+                    futures[executor.submit(self._complete_shard, build_prompt, offset, count)] = (offset, count)
+                    if len(futures) >= 2 * self.max_workers:
+                        break
+
+            submit()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    offset, count = futures.pop(future)
+                    try:
+                        text = future.result()
+                    except self.abort_on:
+                        for pending in futures:
+                            pending.cancel()
+                        raise
+                    except Exception as e:
+                        logger.warning("Shard of %s rows at offset %s failed: %s", count, offset, e)
+                        self.failed_shards += 1
+                        error = e
+                        continue
+                    parser = CsvRowStream()
+                    rows = parser.feed(text) + parser.close()
+                    if not rows:
+                        continue
+                    shard_header, shard_rows = rows[0], rows[1:count + 1]
+                    if header is None:
+                        header = shard_header
+                        if writer:
+                            writer.writerow(header)
+                    shard_rows = self._align(header, shard_header, shard_rows)
+
+                    merged = [row for position, row in enumerate(shard_rows)
+                              if self._assign_keys(header, row, offset + position + 1, primary_keys, seen_keys)]
+                    if writer:
+                        writer.writerows(merged)
+                    rows_written += len(merged)
+                    if on_rows:
+                        on_rows(header, merged)
+                submit()
+
+        if error is not None and header is None:
+            # Nothing arrived at all, which is a failure of the table rather than of some shards
+            raise error
+        return rows_written
+
+    def _complete_shard(self, build_prompt, offset, count):
+        if self.store is not None:
+            text = self.store.load(offset, count)
+            if text is not None:
+                return text
+        text = self.complete(build_prompt(count, offset))
+        if self.store is not None:
+            self.store.save(offset, count, text)
+        return text
+
+    def _is_integer(self, data_type):
+        return (data_type or '').lower() in INTEGER_TYPES
+
+    def _align(self, header, shard_header, rows):
+        """Reorder a shard's columns to the merged header when the model shuffled them."""
+        if shard_header == header or sorted(shard_header) != sorted(header):
+            return [row[:len(header)] + [''] * (len(header) - len(row)) for row in rows]
+        index = [shard_header.index(column) for column in header]
+        return [[row[i] if i < len(row) else '' for i in index] for row in rows]
+
+    def _assign_keys(self, header, row, row_number, primary_keys, seen_keys):
+        """Make the row's primary key unique; returns False when the row must be dropped."""
+        for column, data_type in primary_keys.items():
+            if column not in header:
+                continue
+            position = header.index(column)
+            if self._is_integer(data_type):
+                row[position] = str(row_number)
+            else:
+                if row[position] in seen_keys[column]:
+                    return False
+                seen_keys[column].add(row[position])
+        return True
@@ -0,0 +1,216 @@
+import json
+import re
+import string
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Characters produced by the escapes and classes allowed in "pattern" columns
+PATTERN_ESCAPES = {
+    'd': string.digits,
+    'w': string.ascii_letters + string.digits + '_',
+    's': ' ',
+}
+# Upper bound of repetitions for the open-ended quantifiers + and *
+MAX_REPEAT = 8
+
+SPEC_KINDS = ['sequence', 'integer', 'float', 'categorical', 'boolean', 'date', 'timestamp',
+              'pattern', 'uuid', 'constant', 'foreign_key']
+
+
+class SpecEngine:
+    """Generate table rows locally from a declarative per-column generator spec.
+
+    A spec is a dict ``{"columns": [...]}`` in which every column names a ``kind`` and its
+    parameters, for example::
+
+        {"name": "id", "kind": "sequence", "start": 1}
+        {"name": "age", "kind": "integer", "distribution": "normal", "mean": 40, "std": 12, "min": 18, "max": 90}
+        {"name": "price", "kind": "float", "distribution": "lognormal", "mean": 3, "std": 0.5, "decimals": 2}
+        {"name": "status", "kind": "categorical", "values": ["new", "paid"], "weights": [0.3, 0.7]}
+        {"name": "created_at", "kind": "timestamp", "start": "2020-01-01", "end": "2024-12-31"}
+        {"name": "email", "kind": "pattern", "pattern": "[a-z]{6,10}@example\\\\.com"}
+
+    Every column also accepts ``null_rate``. All columns are generated with vectorized NumPy
+    operations, so the cost is a few seconds of CPU for millions of rows.
+    """
+
+    def __init__(self, seed: int = None):
+        self.rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def parse_spec(text: str) -> Dict:
+        """Parse a spec returned by the model, tolerating code fences around the JSON."""
+        text = text.strip()
+        text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text)
+        spec = json.loads(text)
+        if isinstance(spec, list):
+            spec = {'columns': spec}
+        if not isinstance(spec.get('columns'), list):
+            raise ValueError("Generator spec must contain a list of columns")
+        for column in spec['columns']:
+            if 'name' not in column or column.get('kind') not in SPEC_KINDS:
+                raise ValueError(f"Invalid column spec: {column}")
+        return spec
+
+    def generate(self, spec: Dict, no_of_records: int, foreign_keys: Dict[str, List] = None) -> pd.DataFrame:
+        """Generate ``no_of_records`` rows; ``foreign_keys`` maps FK columns to their parent key values."""
+        foreign_keys = foreign_keys or {}
+        columns = {}
+        for column in spec['columns']:
+            name = column['name']
+            if name in foreign_keys or column['kind'] == 'foreign_key':
+                values = self._foreign_key(foreign_keys.get(name, column.get('values', [])), no_of_records)
+            else:
+                values = getattr(self, f"_{column['kind']}")(column, no_of_records)
+            columns[name] = self._apply_nulls(values, column.get('null_rate', 0) or 0, no_of_records)
+        return pd.DataFrame(columns)
+
+    def _apply_nulls(self, values, null_rate, n):
+        series = pd.Series(values)
+        if null_rate <= 0:
+            return series
+        if pd.api.types.is_integer_dtype(series.dtype):
+            series = series.astype('Int64')
+        elif not pd.api.types.is_float_dtype(series.dtype):
+            series = series.astype(object)
+        return series.mask(self.rng.random(n) < null_rate)
+
+    def _sequence(self, column, n):
+        start = int(column.get('start', 1))
+        return np.arange(start, start + n * int(column.get('step', 1)), int(column.get('step', 1)))[:n]
+
+    def _numbers(self, column, n):
+        distribution = column.get('distribution', 'uniform')
+        low, high = column.get('min'), column.get('max')
+        if distribution == 'normal':
+            values = self.rng.normal(column.get('mean', 0), column.get('std', 1), n)
+        elif distribution == 'lognormal':
+            values = self.rng.lognormal(column.get('mean', 0), column.get('std', 1), n)
+        elif distribution == 'exponential':
+            values = self.rng.exponential(column.get('scale', column.get('mean', 1)), n)
+        elif distribution == 'poisson':
+            values = self.rng.poisson(column.get('lam', column.get('mean', 1)), n).astype(float)
+        else:
+            values = self.rng.uniform(0 if low is None else low, 100 if high is None else high, n)
+        if low is not None or high is not None:
+            values = np.clip(values, low, high)
+        return values
+
+    def _integer(self, column, n):
+        if column.get('distribution', 'uniform') == 'uniform':
+            return self.rng.integers(int(column.get('min', 0)), int(column.get('max', 100)), n, endpoint=True)
+        return np.rint(self._numbers(column, n)).astype(np.int64)
+
+    def _float(self, column, n):
+        return np.round(self._numbers(column, n), int(column.get('decimals', 2)))
+
+    def _categorical(self, column, n):
+        values = np.asarray(column['values'], dtype=object)
+        weights = column.get('weights')
+        if weights:
+            weights = np.asarray(weights, dtype=float)
+            weights = weights / weights.sum()
+        return self.rng.choice(values, n, p=weights)
+
+    def _boolean(self, column, n):
+        return self.rng.random(n) < column.get('true_rate', 0.5)
+
+    def _date(self, column, n):
+        return self._timestamps(column, n, 'D').strftime('%Y-%m-%d')
+
+    def _timestamp(self, column, n):
+        return self._timestamps(column, n, 's').strftime('%Y-%m-%d %H:%M:%S')
+
+    def _timestamps(self, column, n, unit):
+        start = np.datetime64(pd.Timestamp(column.get('start', '2020-01-01')), unit)
+        end = np.datetime64(pd.Timestamp(column.get('end', '2024-12-31')), unit)
+        offsets = self.rng.integers(0, max(1, int((end - start).astype(np.int64))), n, endpoint=True)
+        return pd.DatetimeIndex(start + offsets.astype(f'timedelta64[{unit}]'))
+
+    def _uuid(self, column, n):
+        raw = self.rng.integers(0, 256, (n, 16), dtype=np.uint8)
+        raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+        raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+        hexed = np.frombuffer(raw.tobytes().hex().encode('ascii'), dtype='S1').reshape(n, 32)
+        dashed = np.full((n, 36), b'-', dtype='S1')
+        dashed[:, [i for i in range(36) if i not in (8, 13, 18, 23)]] = hexed
+        return np.ascontiguousarray(dashed).view('S36').reshape(n).astype('<U36')
+
+    def _constant(self, column, n):
+        return np.full(n, column.get('value'), dtype=object)
+
+    def _foreign_key(self, values, n):
+        if len(values) == 0:
+            return np.full(n, None, dtype=object)
+        return self.rng.choice(np.asarray(values, dtype=object), n)
+
+    def _pattern(self, column, n):
+        result = np.full(n, '', dtype='<U1')
+        for alphabet, low, high in self._parse_pattern(column['pattern']):
+            result = np.char.add(result, self._chars(alphabet, low, high, n))
+        return result
+
+    def _chars(self, alphabet, low, high, n):
+        """Draw between ``low`` and ``high`` characters of ``alphabet`` for every row."""
+        if high == 0:
+            return np.full(n, '', dtype='<U1')
+        chars = np.asarray(list(alphabet), dtype='<U1')
+        drawn = chars[self.rng.integers(0, len(chars), (n, high))]
+        if low != high:
+            lengths = self.rng.integers(low, high, n, endpoint=True)
+            drawn[np.arange(high) >= lengths[:, None]] = ''
+        return np.ascontiguousarray(drawn).view(f'<U{high}').reshape(n)
+
+    def _parse_pattern(self, pattern):
+        """Split a simple regex into (alphabet, min repeat, max repeat) tokens.
+
+        Supported are literals, escapes (\\d, \\w, \\s and escaped literals), character classes
+        with ranges and the quantifiers ?, *, +, {n} and {m,n}.
+        """
+        tokens = []
+        i = 0
+        while i < len(pattern):
+            char = pattern[i]
+            if char == '\\' and i + 1 < len(pattern):
+                alphabet = PATTERN_ESCAPES.get(pattern[i + 1], pattern[i + 1])
+                i += 2
+            elif char == '[':
+                end = pattern.index(']', i + 1)
+                alphabet = self._expand_class(pattern[i + 1:end])
+                i = end + 1
+            elif char in '^$':
+                i += 1
+                continue
+            else:
+                alphabet = char
+                i += 1
+
+            low = high = 1
+            if i < len(pattern) and pattern[i] in '?*+':
+                low, high = {'?': (0, 1), '*': (0, MAX_REPEAT), '+': (1, MAX_REPEAT)}[pattern[i]]
+                i += 1
+            elif i < len(pattern) and pattern[i] == '{':
+                end = pattern.index('}', i)
+                bounds = pattern[i + 1:end].split(',')
+                low = int(bounds[0] or 0)
+                high = int(bounds[-1]) if bounds[-1] else low + MAX_REPEAT
+                i = end + 1
+            tokens.append((alphabet, low, high))
+        return tokens
+
+    def _expand_class(self, body):
+        chars = []
+        i = 0
+        while i < len(body):
+            if body[i] == '\\' and i + 1 < len(body):
+                chars.extend(PATTERN_ESCAPES.get(body[i + 1], body[i + 1]))
+                i += 2
+            elif i + 2 < len(body) and body[i + 1] == '-':
+                chars.extend(chr(c) for c in range(ord(body[i]), ord(body[i + 2]) + 1))
+                i += 3
+            else:
+                chars.append(body[i])
+                i += 1
+        return ''.join(dict.fromkeys(chars))
@@ -0,0 +1,416 @@
+"""Gaussian copula synthesizer fitted on sampled rows, generating rows without the model.
+
+A model fitted by DataGenerator in synth mode, or by ``CopulaSynthesizer.fit``, can be saved as
+JSON and generate any number of rows offline:
+
+    cd app
+    python synthesizer.py orders.json --rows 1000000 --output orders.csv
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from sample_profiler import DATE_PATTERN
+from validator import FLOAT_TYPES, INTEGER_RANGES, UUID_PATTERN
+
+MODEL_VERSION = 1
+# Column models: integer keys, numbers and datetimes by quantiles, categories by their weights,
+# free text from a pool of values or random characters in the sampled shapes, random UUIDs and
+# columns without values
+KINDS = ('sequence', 'numeric', 'datetime', 'category', 'text', 'uuid', 'empty')
+# Kinds whose dependencies on each other are kept by the copula
+COPULA_KINDS = ('numeric', 'datetime', 'category')
+# Rows generated and written at a time by the command line
+CHUNK_ROWS = 1000000
+# Code points of the two hex digits of every byte
+HEX_PAIRS = np.array([[ord(char) for char in f'{byte:02x}'] for byte in range(256)], dtype=np.uint32)
+# Hex digits of a UUID between its dashes, as (start in the UUID, start in the digits, length)
+UUID_GROUPS = ((0, 0, 8), (9, 8, 4), (14, 12, 4), (19, 16, 4), (24, 20, 12))
+# Characters redrawn in the shapes of free text
+SHAPE_ALPHABETS = {'A': 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'a': 'abcdefghijklmnopqrstuvwxyz', '9': '0123456789'}
+
+# Coefficients of Acklam's rational approximation of the normal quantile function
+ACKLAM_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+            1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+ACKLAM_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+            6.680131188771972e+01, -1.328068155288572e+01)
+ACKLAM_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+            -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+ACKLAM_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00)
+ACKLAM_LOW = 0.02425
+# Chebyshev coefficients of erfc, fractional error below 1.2e-7
+ERFC_COEFFICIENTS = (-1.26551223, 1.00002368, 0.37409196, 0.09678418, -0.18628806,
+                     0.27886807, -1.13520398, 1.48851587, -0.82215223, 0.17087277)
+
+
+def _polynomial(coefficients, x):
+    """Evaluate a polynomial, highest coefficient first, in place on one array."""
+    result = np.full_like(x, coefficients[0])
+    for coefficient in coefficients[1:]:
+        result *= x
+        result += coefficient
+    return result
+
+
+def norm_ppf(p):
+    """Quantiles of the standard normal distribution, with a relative error below 1.2e-9."""
+    p = np.asarray(p, dtype=float)
+    x = np.empty_like(p)
+    low, high = p < ACKLAM_LOW, p > 1 - ACKLAM_LOW
+    central = ~(low | high)
+    q = p[central] - 0.5
+    r = q * q
+    x[central] = _polynomial(ACKLAM_A, r) * q / (_polynomial(ACKLAM_B, r) * r + 1)
+    for mask, tail, sign in ((low, p[low], 1), (high, 1 - p[high], -1)):
+        q = np.sqrt(-2 * np.log(tail))
+        x[mask] = sign * _polynomial(ACKLAM_C, q) / (_polynomial(ACKLAM_D, q) * q + 1)
+    return x
+
+
+def norm_cdf(x):
+    """Distribution function of the standard normal distribution."""
+    x = np.asarray(x, dtype=float)
+    z = np.abs(x) / np.sqrt(2)
+    t = 1 / (1 + 0.5 * z)
+    exponent = _polynomial(ERFC_COEFFICIENTS[::-1], t)
+    exponent -= z * z
+    half_erfc = np.exp(exponent, out=exponent)
+    half_erfc *= 0.5 * t
+    return np.where(x >= 0, 1 - half_erfc, half_erfc)
+
+
+class CopulaSynthesizer:
+    """Fit the marginals and correlations of a sample and generate rows with vectorized NumPy.
+
+    Every column gets a marginal model by its type: numbers and datetimes keep ``quantiles``
+    points of their distribution, low-cardinality columns their values and weights, integer
+    primary keys become sequences and UUIDs are drawn at random. Free text is drawn from a pool
+    of values set with ``set_pool``, e.g. written by the model, or else as random characters in
+    the shapes seen in the sample, so sampled values are never copied into the output.
+
+    A Gaussian copula keeps the rank correlations between number, datetime and category columns:
+    rows are drawn as correlated normal vectors and mapped through each column's marginal. Null
+    rates are kept per column. ``to_dict`` and ``from_dict`` turn a fitted model into JSON and back.
+    """
+
+    def __init__(self, quantiles: int = 101, max_categories: int = 20, max_shapes: int = 50, seed: int = None):
+        self.quantiles = quantiles
+        self.max_categories = max_categories
+        self.max_shapes = max_shapes
+        self.rng = np.random.default_rng(seed)
+        self.columns: List[Dict] = []
+        self.copula: List[str] = []
+        self.correlation = np.eye(0)
+
+    @property
+    def text_columns(self):
+        """Names of the free text columns, which a pool of values would make realistic."""
+        return [column['name'] for column in self.columns if column['kind'] == 'text']
+
+    def fit(self, sample: pd.DataFrame, schema: List[tuple] = None):
+        """Fit the model on a sample; ``schema`` rows ``(name, data_type, ..., constraint_type)`` refine the column kinds."""
+        types = {column[0]: (column[1] or '').lower() for column in schema or []}
+        primary_keys = {column[0] for column in schema or [] if column[4] == 'PRIMARY KEY'}
+        self.columns = []
+        present = {}
+        for name in sample.columns:
+            series = sample[name]
+            values = series.dropna()
+            if not (pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values)
+                    or pd.api.types.is_datetime64_any_dtype(values)):
+                values = values.astype(str)
+                values = values[values.str.strip() != '']
+            column = {'name': str(name), 'null_rate': 1 - len(values) / len(series) if len(series) else 0}
+            column.update(self._fit_column(values, types.get(name, ''), name in primary_keys))
+            present[column['name']] = values
+            self.columns.append(column)
+
+        scores = {column['name']: self._normal_scores(column, sample.index, present[column['name']])
+                  for column in self.columns if column['kind'] in ('numeric', 'datetime')}
+        if scores:
+            component = pd.Series(self._principal_component(np.column_stack(list(scores.values()))), index=sample.index)
+        for column in self.columns:
+            if column['kind'] == 'category':
+                if scores:
+                    self._order_categories(column, present[column['name']], component)
+                scores[column['name']] = self._normal_scores(column, sample.index, present[column['name']])
+        self.copula = [column['name'] for column in self.columns if column['name'] in scores]
+        self.correlation = self._correlation(np.column_stack([scores[name] for name in self.copula]) if scores else np.empty((0, 0)))
+        return self
+
+    def set_pool(self, name, values: List[str]):
+        """Draw the free text column ``name`` from ``values``."""
+        values = [str(value) for value in values if value is not None and str(value).strip()]
+        if not values:
+            return
+        for column in self.columns:
+            if column['name'] == name:
+                column['pool'] = values
+
+    def sample(self, no_of_records: int, offset: int = 0) -> pd.DataFrame:
+        """Generate rows; ``offset`` continues sequences after rows generated before."""
+        uniforms = {}
+        if self.copula:
+            normal = self.rng.standard_normal((no_of_records, len(self.copula))) @ np.linalg.cholesky(self.correlation).T
+            drawn = norm_cdf(normal)
+            uniforms = {name: drawn[:, position] for position, name in enumerate(self.copula)}
+        columns = {}
+        for column in self.columns:
+            values = getattr(self, f"_{column['kind']}")(column, no_of_records, uniforms.get(column['name']), offset)
+            columns[column['name']] = self._apply_nulls(values, column['null_rate'], no_of_records)
+        return pd.DataFrame(columns)
+
+    def _fit_column(self, values, data_type, primary_key):
+        if values.empty:
+            return {'kind': 'empty'}
+        kind = self._infer_kind(values, data_type)
+        if kind == 'numeric' and primary_key and self._integral(values):
+            return {'kind': 'sequence', 'start': 1, 'step': 1}
+        if kind == 'text' and values.str.fullmatch(UUID_PATTERN).all():
+            return {'kind': 'uuid'}
+        distinct = values.astype(str).nunique()
+        if not primary_key and kind != 'datetime' and distinct <= self.max_categories and distinct <= len(values) / 2:
+            kind = 'category'
+        if kind == 'category':
+            counts = values.astype(str).value_counts().iloc[:self.max_categories]
+            return {'kind': 'category', 'values': counts.index.tolist(), 'weights': (counts / counts.sum()).tolist()}
+        if kind == 'numeric':
+            numbers = pd.to_numeric(values, errors='coerce').dropna().to_numpy(dtype=float)
+            integer = self._integral(values)
+            return {'kind': 'numeric', 'quantiles': self._quantiles(numbers), 'integer': integer,
+                    'decimals': 0 if integer else self._decimals(numbers)}
+        if kind == 'datetime':
+            dates = self._parse_datetimes(values)
+            seconds = ((dates - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).to_numpy(dtype=float)
+            date_only = data_type == 'date' or (not data_type.startswith('timestamp') and (dates == dates.dt.normalize()).all())
+            return {'kind': 'datetime', 'quantiles': self._quantiles(seconds), 'date': bool(date_only)}
+        shapes = self._shapes(values).value_counts().iloc[:self.max_shapes]
+        return {'kind': 'text', 'shapes': shapes.index.tolist(), 'weights': (shapes / shapes.sum()).tolist()}
+
+    def _infer_kind(self, values, data_type):
+        if data_type in ('boolean', 'bool') or pd.api.types.is_bool_dtype(values):
+            return 'category'
+        if data_type == 'date' or data_type.startswith('timestamp') or pd.api.types.is_datetime64_any_dtype(values):
+            return 'datetime'
+        if data_type == 'uuid':
+            return 'text'
+        if (data_type in INTEGER_RANGES or data_type in FLOAT_TYPES or data_type.startswith(('numeric', 'decimal'))
+                or pd.api.types.is_numeric_dtype(values)):
+            return 'numeric'
+        text = values.astype(str)
+        if pd.to_numeric(text, errors='coerce').notna().all():
+            return 'numeric'
+        if text.str.match(DATE_PATTERN).all():
+            return 'datetime'
+        return 'text'
+
+    def _integral(self, values):
+        numbers = pd.to_numeric(values, errors='coerce')
+        return bool(numbers.notna().all() and (numbers == numbers.round()).all())
+
+    def _quantiles(self, numbers):
+        return np.quantile(numbers, np.linspace(0, 1, self.quantiles)).tolist()
+
+    def _decimals(self, numbers):
+        for decimals in range(6):
+            # Absolute tolerance only, a relative one hides the cents of large amounts
+            if np.allclose(numbers, np.round(numbers, decimals), rtol=0, atol=1e-9):
+                return decimals
+        return 6
+
+    def _parse_datetimes(self, values):
+        if pd.api.types.is_datetime64_any_dtype(values):
+            dates = values
+        else:
+            dates = pd.to_datetime(values.astype(str), errors='coerce', utc=True)
+        if getattr(dates.dt, 'tz', None) is not None:
+            dates = dates.dt.tz_convert('UTC').dt.tz_localize(None)
+        return dates.dropna()
+
+    def _shapes(self, values):
+        """Values with letters and digits replaced by their class: A, a and 9."""
+        return values.str.slice(0, 200).str.replace(r'[A-Z]', 'A', regex=True) \
+            .str.replace(r'[a-z]', 'a', regex=True).str.replace(r'\d', '9', regex=True)
+
+    def _normal_scores(self, column, index, values):
+        """Normal scores of a column's sampled values, 0 for nulls, to estimate the correlations."""
+        scores = pd.Series(0.0, index=index)
+        if values.empty:
+            return scores.to_numpy()
+        if column['kind'] == 'category':
+            weights = np.asarray(column['weights'])
+            # The middle of every category's share of the unit interval
+            middles = dict(zip(column['values'], np.cumsum(weights) - weights / 2))
+            uniforms = values.astype(str).map(middles).fillna(0.5)
+        else:
+            if column['kind'] == 'numeric':
+                numbers = pd.to_numeric(values, errors='coerce').dropna()
+            else:
+                numbers = self._parse_datetimes(values).astype('int64')
+            uniforms = (numbers.rank(method='average') - 0.5) / len(numbers)
+        scores[uniforms.index] = norm_ppf(uniforms.to_numpy(dtype=float))
+        return scores.to_numpy()
+
+    def _principal_component(self, scores):
+        """Projection of the rows on the direction the number and datetime columns vary most along."""
+        if scores.shape[1] == 1:
+            return scores[:, 0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlation = np.nan_to_num(np.corrcoef(scores, rowvar=False))
+        return scores @ np.linalg.eigh(correlation)[1][:, -1]
+
+    def _order_categories(self, column, values, component):
+        """Order categories by the average principal component of their rows.
+
+        The copula places categories on the unit interval in order. Ordered like this, a category
+        going with high numbers, like a 'gold' tier with high incomes, keeps that dependency.
+        """
+        means = component[values.index].groupby(values.astype(str).to_numpy()).mean()
+        order = sorted(range(len(column['values'])), key=lambda position: means.get(column['values'][position], 0))
+        column['values'] = [column['values'][position] for position in order]
+        column['weights'] = [column['weights'][position] for position in order]
+
+    def _correlation(self, scores):
+        size = scores.shape[1]
+        if size < 2 or len(scores) < 3:
+            return np.eye(size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlation = np.nan_to_num(np.corrcoef(scores, rowvar=False))
+        np.fill_diagonal(correlation, 1.0)
+        # Rank correlations of a small sample needn't form a valid correlation matrix, clip its eigenvalues
+        eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+        correlation = eigenvectors @ np.diag(np.clip(eigenvalues, 1e-6, None)) @ eigenvectors.T
+        scale = np.sqrt(np.diag(correlation))
+        return correlation / np.outer(scale, scale)
+
+    def _apply_nulls(self, values, null_rate, n):
+        """Blank out ``null_rate`` of freshly generated values, in place where the dtype allows."""
+        if null_rate <= 0:
+            return values
+        nulls = self.rng.random(n) < null_rate
+        if values.dtype.kind in 'iu':
+            return pd.arrays.IntegerArray(values.astype(np.int64), nulls)
+        if values.dtype.kind == 'f':
+            values[nulls] = np.nan
+        elif values.dtype.kind == 'M':
+            values[nulls] = np.datetime64('NaT')
+        else:
+            values = values.astype(object)
+            values[nulls] = None
+        return values
+
+    def _uniforms(self, uniforms, n):
+        return uniforms if uniforms is not None else self.rng.random(n)
+
+    def _empty(self, column, n, uniforms, offset):
+        return np.full(n, None, dtype=object)
+
+    def _sequence(self, column, n, uniforms, offset):
+        return column['start'] + (offset + np.arange(n, dtype=np.int64)) * column['step']
+
+    def _uuid(self, column, n, uniforms, offset):
+        """Random version 4 UUIDs, spelled out on byte arrays."""
+        raw = self.rng.integers(0, 256, (n, 16), dtype=np.uint8)
+        raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+        raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+        digits = HEX_PAIRS[raw].reshape(n, 32)
+        text = np.full((n, 36), ord('-'), dtype=np.uint32)
+        for start, digit, length in UUID_GROUPS:
+            text[:, start:start + length] = digits[:, digit:digit + length]
+        return text.view('<U36').reshape(n)
+
+    def _numeric(self, column, n, uniforms, offset):
+        quantiles = column['quantiles']
+        values = np.interp(self._uniforms(uniforms, n), np.linspace(0, 1, len(quantiles)), quantiles)
+        if column['integer']:
+            return np.rint(values).astype(np.int64)
+        return np.round(values, column['decimals'])
+
+    def _datetime(self, column, n, uniforms, offset):
+        quantiles = column['quantiles']
+        seconds = np.interp(self._uniforms(uniforms, n), np.linspace(0, 1, len(quantiles)), quantiles)
+        # Left as datetimes, pandas writes them to CSV much faster than NumPy formats them
+        dates = seconds.astype(np.int64).astype('datetime64[s]')
+        return dates.astype('datetime64[D]').astype('datetime64[s]') if column['date'] else dates
+
+    def _category(self, column, n, uniforms, offset):
+        bounds = np.cumsum(column['weights'])
+        positions = np.minimum(np.searchsorted(bounds, self._uniforms(uniforms, n) * bounds[-1], side='right'), len(bounds) - 1)
+        return np.asarray(column['values'], dtype=object)[positions]
+
+    def _text(self, column, n, uniforms, offset):
+        if column.get('pool'):
+            return np.asarray(column['pool'], dtype=object)[self.rng.integers(0, len(column['pool']), n)]
+        shapes = self.rng.choice(len(column['shapes']), n, p=np.asarray(column['weights']) / np.sum(column['weights']))
+        result = np.empty(n, dtype=f"<U{max(1, max(len(shape) for shape in column['shapes']))}")
+        for position, shape in enumerate(column['shapes']):
+            rows = np.flatnonzero(shapes == position)
+            if len(rows):
+                result[rows] = self._fill_shape(shape, len(rows))
+        return result
+
+    def _fill_shape(self, shape, n):
+        """Random strings with the shape's letters and digits redrawn and its other characters kept."""
+        if not shape:
+            return np.full(n, '')
+        # Code points, which view as fixed-width strings without a copy
+        template = np.array([ord(char) for char in shape], dtype=np.uint32)
+        chars = np.broadcast_to(template, (n, len(template))).copy()
+        for symbol, alphabet in SHAPE_ALPHABETS.items():
+            positions = np.flatnonzero(template == ord(symbol))
+            if len(positions):
+                letters = np.array([ord(char) for char in alphabet], dtype=np.uint32)
+                chars[:, positions] = letters[self.rng.integers(0, len(letters), (n, len(positions)))]
+        return chars.view(f'<U{len(template)}').reshape(n)
+
+    def to_dict(self) -> Dict:
+        return {'version': MODEL_VERSION, 'columns': self.columns, 'copula': self.copula,
+                'correlation': self.correlation.tolist()}
+
+    @classmethod
+    def from_dict(cls, model: Dict, seed: int = None):
+        if model.get('version') != MODEL_VERSION:
+            raise ValueError(f"Unsupported synthesizer model version: {model.get('version')}")
+        synthesizer = cls(seed=seed)
+        synthesizer.columns = model['columns']
+        synthesizer.copula = model['copula']
+        synthesizer.correlation = np.asarray(model['correlation'], dtype=float).reshape(len(model['copula']), len(model['copula']))
+        return synthesizer
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str, seed: int = None):
+        with open(path) as f:
+            return cls.from_dict(json.load(f), seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate rows from a saved synthesizer model.")
+    parser.add_argument("model", help="path of the model's .json file")
+    parser.add_argument("--rows", type=int, default=1000, help="number of rows to generate")
+    parser.add_argument("--output", help="CSV file to write, standard output by default")
+    parser.add_argument("--offset", type=int, default=0, help="rows generated before, sequences continue after them")
+    parser.add_argument("--seed", type=int, help="seed of the random generator, for reproducible output")
+    args = parser.parse_args(argv)
+
+    synthesizer = CopulaSynthesizer.load(args.model, args.seed)
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        for start in range(0, args.rows, CHUNK_ROWS):
+            count = min(CHUNK_ROWS, args.rows - start)
+            synthesizer.sample(count, args.offset + start).to_csv(output, index=False, header=start == 0)
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
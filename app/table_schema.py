@@ -1,33 +1,33 @@
+import logging
+
 import psycopg2
-import streamlit as st
+
+from catalog import CatalogIntrospector
+
+logger = logging.getLogger(__name__)
 
 class TableSchema:
 
+    def __init__(self, schema_name='public'):
+        self.introspector = CatalogIntrospector(schema_name)
+        # Error of the last failed lookup, for callers that show it
+        self.error = None
+
     # Function to get the schema of the selected table
     def get_table_schema(self, table_name, conn):
+        schemas = self.get_table_schemas([table_name], conn)
+        return schemas.get(table_name) if schemas is not None else None
+
+    # Function to get the schemas of several tables from the cached catalog
+    def get_table_schemas(self, table_names, conn):
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT 
-                        col.column_name,
-                        col.data_type, 
-                        col.is_nullable, 
-                        col.column_default, 
-                        tc.constraint_type
-                    FROM information_schema.columns col
-                    LEFT JOIN information_schema.key_column_usage kcu 
-                        ON col.table_name = kcu.table_name 
-                        AND col.column_name = kcu.column_name 
-                        AND col.table_schema = kcu.table_schema
-                    LEFT JOIN information_schema.table_constraints tc 
-                        ON kcu.constraint_name = tc.constraint_name
-                        AND tc.constraint_type = 'PRIMARY KEY'
-                    WHERE col.table_name = %s 
-                    AND col.table_schema = 'public'
-                """, (table_name,))
-                schema = cur.fetchall()
-            return schema
+            catalog = self.introspector.get_catalog(conn)
+            return {table_name: catalog.get_table_schema(table_name) for table_name in table_names}
         except psycopg2.Error as e:
-            st.error(f"Failed to retrieve schema for table {table_name}: {e}")
+            self.error = f"Failed to retrieve schema for tables {', '.join(table_names)}: {e}"
+            logger.error(self.error)
             return None
-    
\ No newline at end of file
+
+    # Function to reload the catalog after the database schema changed
+    def refresh(self, conn):
+        self.introspector.invalidate(conn)
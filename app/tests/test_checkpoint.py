@@ -0,0 +1,126 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkpoint import Checkpoint
+from shard_generator import ShardedGenerator
+
+
+class Cancelled(Exception):
+    pass
+
+
+def shard_csv(prompt):
+    offset, count = map(int, prompt.split(':'))
+    return "id,name\n" + "".join(f"{offset + i + 1},row {offset + i}\n" for i in range(count))
+
+
+def generate(checkpoint, complete, rows=10):
+    out = io.StringIO()
+    generator = ShardedGenerator(complete, shard_size=2, max_workers=1, store=checkpoint.shards('t'), abort_on=(Cancelled,))
+    generator.generate(lambda count, offset: f"{offset}:{count}", rows, out, primary_keys={'id': 'integer'})
+    return out.getvalue()
+
+
+def test_resume_requests_only_the_missing_shards(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path))
+    checkpoint.start('inputs')
+    requested = []
+
+    def interrupted(prompt):
+        if prompt.startswith('6:'):
+            raise Cancelled()
+        requested.append(prompt)
+        return shard_csv(prompt)
+
+    with pytest.raises(Cancelled):
+        generate(checkpoint, interrupted)
+    saved = set(requested)
+    assert saved >= {'0:2', '2:2', '4:2'}
+
+    # A new process reads the shards back from the manifest
+    resumed = Checkpoint(str(tmp_path))
+    resumed.start('inputs')
+    requested.clear()
+
+    def complete(prompt):
+        requested.append(prompt)
+        return shard_csv(prompt)
+
+    data = generate(resumed, complete)
+    assert not saved & set(requested)
+    assert '6:2' in requested
+    lines = data.splitlines()
+    assert lines[0] == 'id,name'
+    assert sorted(int(line.split(',')[0]) for line in lines[1:]) == list(range(1, 11))
+
+
+def test_saved_table_reloads_with_its_keys(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path))
+    checkpoint.start('inputs')
+    checkpoint.save_shard('orders', 0, 2, "id\n1\n2\n")
+    keys = {'id': np.arange(1, 4, dtype=np.int64), 'code': np.array(['a', 'b', 'ü'])}
+    checkpoint.save_table('orders', "id,code\n1,a\n2,b\n3,ü\n", keys, {'valid': True})
+
+    resumed = Checkpoint(str(tmp_path))
+    resumed.start('inputs')
+    assert resumed.has_table('orders')
+    data, loaded, validation = resumed.load_table('orders')
+    assert data == "id,code\n1,a\n2,b\n3,ü\n"
+    assert validation == {'valid': True}
+    assert loaded['id'].dtype == np.int64 and loaded['id'].tolist() == [1, 2, 3]
+    assert loaded['code'].tolist() == ['a', 'b', 'ü']
+    # The shards of a saved table are dropped
+    assert resumed.load_shard('orders', 0, 2) is None
+    assert not os.listdir(tmp_path / 'shards')
+
+
+def test_table_without_keys(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path))
+    checkpoint.start('inputs')
+    checkpoint.save_table('names', "name\nx\n")
+    assert Checkpoint(str(tmp_path)).load_table('names') == ("name\nx\n", {}, None)
+
+
+def test_other_fingerprint_starts_over(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path))
+    checkpoint.start(Checkpoint.fingerprint({'tables': ['a']}, 10))
+    checkpoint.save_shard('a', 0, 5, "id\n1\n")
+    checkpoint.save_table('b', "id\n1\n")
+
+    same = Checkpoint(str(tmp_path))
+    same.start(Checkpoint.fingerprint({'tables': ['a']}, 10))
+    assert same.has_table('b') and same.load_shard('a', 0, 5) == "id\n1\n"
+
+    other = Checkpoint(str(tmp_path))
+    other.start(Checkpoint.fingerprint({'tables': ['a']}, 20))
+    assert not other.has_table('b') and other.load_shard('a', 0, 5) is None
+    assert not Checkpoint(str(tmp_path)).has_table('b')
+
+
+def test_reset_and_remove(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / 'job'))
+    checkpoint.start('inputs')
+    checkpoint.save_table('a', "id\n1\n")
+    checkpoint.reset()
+    assert not checkpoint.has_table('a')
+
+    checkpoint.start('inputs')
+    checkpoint.save_table('a', "id\n1\n")
+    checkpoint.remove()
+    assert not (tmp_path / 'job').exists()
+    assert not Checkpoint(str(tmp_path / 'job')).has_table('a')
+
+
+def test_unreadable_manifest_is_a_fresh_checkpoint(tmp_path):
+    (tmp_path / 'manifest.json').write_text('{"tables": {"a"')
+    checkpoint = Checkpoint(str(tmp_path))
+    assert not checkpoint.has_table('a')
+    checkpoint.start('inputs')
+    checkpoint.save_table('a', "id\n1\n")
+    assert Checkpoint(str(tmp_path)).has_table('a')
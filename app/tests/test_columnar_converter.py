@@ -0,0 +1,49 @@
+import json
+import os
+import sys
+from io import BytesIO
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('pyarrow')
+
+from columnar_converter import ColumnarConverter
+from data_converter import DataConverter
+
+
+def convert(data, format, block_size=1 << 20):
+    output = BytesIO()
+    ColumnarConverter(block_size=block_size).convert(data, format, 't', output)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('format', ['CSV', 'JSON', 'PARQUET', 'EXCEL'])
+def test_spaced_header_with_leading_zeros_and_empty_fields(format):
+    assert convert('name, id\nalice,007\nbob,\n', format)
+
+
+def test_values_stay_strings_under_stripped_names():
+    records = json.loads(convert('name, id\nalice,007\nbob,\n', 'JSON'))
+    assert records == [{'name': 'alice', 'id': '007'}, {'name': 'bob', 'id': ''}]
+
+
+def test_ragged_rows_are_padded_or_cut_in_place():
+    data = 'a,b,c\n1,2,3\n4,5\n6,7,8,9\n"x\ny",7,8\n10\n\n11,12,13\n'
+    records = json.loads(convert(data, 'JSON'))
+    expected = json.loads(DataConverter('records').convert_data_to_format(data, 'JSON', 't')[0])
+    assert records == expected
+    assert [record['a'] for record in records] == ['1', '4', '6', 'x\ny', '10', '11']
+
+
+def test_ragged_rows_across_blocks_keep_their_order():
+    lines = ['a,b,c'] + [f"{i},x" if i % 3 == 0 else f"{i},x,y" for i in range(300)]
+    records = json.loads(convert('\n'.join(lines) + '\n', 'JSON', block_size=256))
+    assert [record['a'] for record in records] == [str(i) for i in range(300)]
+    assert records[0]['c'] is None
+
+
+def test_header_only_raises():
+    with pytest.raises(ValueError):
+        convert('a,b\n', 'CSV')
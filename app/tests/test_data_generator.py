@@ -0,0 +1,42 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_generator import DataGenerator
+
+
+class CountingGenerator(DataGenerator):
+    """DataGenerator answering every request locally and recording the most requests in flight."""
+
+    def __init__(self, **options):
+        super().__init__(api_key='test', **options)
+        self.lock = threading.Lock()
+        self.in_flight = self.most_in_flight = 0
+
+    def _create(self, prompt, table=None, **options):
+        with self.lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        time.sleep(0.02)
+        with self.lock:
+            self.in_flight -= 1
+        message = SimpleNamespace(content="id,name\n1,a\n")
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=message, finish_reason='stop')]), 0
+
+
+def test_shards_of_parallel_tables_share_the_request_slots():
+    generator = CountingGenerator(shard_size=1, shard_workers=3)
+    generator.request_slots = threading.BoundedSemaphore(3)
+
+    def generate(table):
+        return generator._generate_rows(lambda count, offset: f"{table} {offset}", 12, table=table)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(generate, ['a', 'b', 'c', 'd']))
+    assert all(result.count('\n') == 13 for result in results)
+    assert generator.most_in_flight == 3
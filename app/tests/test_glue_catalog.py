@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from glue_catalog import GlueCatalog
+
+
+class FakeAthena:
+    """Athena client listing one page of tables."""
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, **kwargs):
+        return [{'TableMetadataList': [{'Name': table} for table in self.tables]}]
+
+
+def test_callers_with_other_credentials_dont_share_the_cache():
+    GlueCatalog.invalidate(GlueCatalog(FakeAthena([])))
+    first = GlueCatalog(FakeAthena(['orders']), identity='AKIA-ONE')
+    second = GlueCatalog(FakeAthena(['invoices']), identity='AKIA-TWO')
+    assert first.list_tables('shop') == ['orders']
+    assert second.list_tables('shop') == ['invoices']
+    assert GlueCatalog(FakeAthena([]), identity='AKIA-ONE').list_tables('shop') == ['orders']
+
+
+def test_clients_without_credentials_get_their_own_cache():
+    assert GlueCatalog(FakeAthena(['orders'])).list_tables('shop') == ['orders']
+    assert GlueCatalog(FakeAthena(['invoices'])).list_tables('shop') == ['invoices']
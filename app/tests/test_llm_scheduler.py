@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+from openai import APIConnectionError, OpenAI, RateLimitError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from llm_scheduler import LLMScheduler
+from mock_llm_server import MockLLMServer
+
+
+def rate_limited(headers):
+    response = SimpleNamespace(status_code=429, headers=headers, request=None)
+    return RateLimitError('Rate limit reached', response=response, body=None)
+
+
+def test_requests_are_paced_by_the_bucket():
+    # Ten requests per second, bursts of one request
+    scheduler = LLMScheduler(requests_per_minute=600, headroom=1.0, burst_seconds=0.1)
+    started = time.monotonic()
+    waits = [scheduler.acquire(10) for _ in range(4)]
+    assert waits[0] < 0.05
+    assert time.monotonic() - started == pytest.approx(0.3, abs=0.1)
+
+
+def test_settled_usage_is_charged_to_the_next_requests():
+    scheduler = LLMScheduler(tokens_per_minute=6000, headroom=1.0, burst_seconds=1)
+    scheduler.acquire(50)
+    scheduler.settle(50, 40, 110)
+    # 150 tokens used of a 100 token burst, the next request waits for the debt at 100 tokens a second
+    assert scheduler.acquire(10) == pytest.approx(0.6, abs=0.15)
+
+
+@pytest.mark.parametrize('headers, delay', [
+    ({'retry-after-ms': '1500'}, 1.5),
+    ({'retry-after': '2'}, 2.0),
+    ({'retry-after-ms': '250', 'retry-after': '2'}, 0.25),
+    ({'retry-after': '120'}, 60.0),
+])
+def test_retry_after_headers(headers, delay):
+    scheduler = LLMScheduler()
+    assert scheduler.retry_delay(rate_limited(headers), 0) == pytest.approx(delay)
+
+
+def test_backoff_without_retry_after():
+    scheduler = LLMScheduler(base_delay=1.0, max_retries=3)
+    error = rate_limited({'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+    assert 0 <= scheduler.retry_delay(error, 2) <= 4.0
+    assert scheduler.retry_delay(error, 3) is None
+    assert scheduler.retry_delay(ValueError('not retried'), 0) is None
+
+
+def test_failed_attempts_refund_their_tokens():
+    scheduler = LLMScheduler(tokens_per_minute=6000, headroom=1.0, burst_seconds=1, base_delay=0.01)
+    attempts = []
+
+    def request():
+        attempts.append(scheduler.tokens.level)
+        if len(attempts) < 4:
+            raise APIConnectionError(request=None)
+        return 'ok'
+
+    assert scheduler.call(request, 60) == 'ok'
+    # Every attempt sees the full bucket less its own reservation
+    assert len(attempts) == 4
+    assert min(attempts) >= 40 - 1e-6
+
+
+def test_rate_limit_pauses_every_request():
+    scheduler = LLMScheduler(max_retries=1)
+    scheduler.pause(0.3)
+    started = time.monotonic()
+    assert scheduler.acquire(10) == pytest.approx(0.3, abs=0.1)
+    assert time.monotonic() - started >= 0.25
+
+
+@pytest.fixture
+def server():
+    server = MockLLMServer(latency=0, tokens_per_sec=100000, requests_per_minute=2)
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_requests_per_minute_of_the_mock_server(server):
+    client = OpenAI(api_key='mock', base_url=server.base_url, max_retries=0)
+    scheduler = LLMScheduler(tokens_per_minute=60000, headroom=1.0, burst_seconds=1, max_retries=2, max_delay=0.05)
+    retries = []
+
+    def request():
+        return client.chat.completions.create(model='mock', messages=[{'role': 'user', 'content': 'Say hello'}])
+
+    for _ in range(2):
+        scheduler.call(request, 100)
+    with pytest.raises(RateLimitError):
+        scheduler.call(request, 100, on_retry=lambda error, delay: retries.append(delay))
+
+    # retry-after-ms of nearly a minute, capped by max_delay, paused everyone
+    assert retries == [0.05, 0.05]
+    assert server.rejected == 3
+    assert scheduler.paused_until > 0
+    # The rejected attempts gave their reservations back instead of running the bucket into debt
+    assert scheduler.tokens.level >= 0
@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('pyarrow')
+
+from data_converter import DataConverter
+from parallel_export import ParallelExporter, row_ranges
+
+DATA = 'id,name\n' + ''.join(f'{i},"name {i}\nsecond line"\n' if i % 7 == 0 else f'{i},name {i}\n' for i in range(2000))
+
+
+def export(tmp_path, data, formats, **options):
+    exporter = ParallelExporter(**options)
+    return exporter.export(data, formats, lambda table, format: str(tmp_path / f"{table}.{format.lower()}"))
+
+
+def test_row_ranges_end_on_row_boundaries():
+    content = DATA.encode()
+    header_end, ranges = row_ranges(content, 1000)
+    assert content[:header_end] == b'id,name\n'
+    assert ranges[0][0] == header_end and ranges[-1][1] == len(content)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert all(content[end - 1:end] == b'\n' and content.count(b'"', header_end, end) % 2 == 0 for _, end in ranges)
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_chunked_output_matches_the_whole_conversion(tmp_path, max_workers):
+    results = export(tmp_path, {'t': DATA}, ['CSV', 'JSON'], max_workers=max_workers, chunk_bytes=4096, min_bytes=0)
+    assert [error for _, _, _, error in results] == [None, None]
+    for format in ('CSV', 'JSON'):
+        expected, _ = DataConverter('columnar').convert_data_to_format(DATA, format, 't')
+        assert (tmp_path / f"t.{format.lower()}").read_bytes() == expected
+
+
+def test_chunks_without_rows_are_skipped(tmp_path):
+    data = 'id,name\n1,a\n' + ',\n' * 3000 + '2,b\n'
+    results = export(tmp_path, {'t': data}, ['CSV', 'JSON'], max_workers=1, chunk_bytes=1024)
+    assert [error for _, _, _, error in results] == [None, None]
+    assert json.loads((tmp_path / 't.json').read_text()) == [{'id': '1', 'name': 'a'}, {'id': '2', 'name': 'b'}]
+    assert (tmp_path / 't.csv').read_text().splitlines() == ['"id","name"', '"1","a"', '"2","b"']
+
+
+def test_table_without_rows_fails_alone(tmp_path):
+    results = export(tmp_path, {'empty': 'id,name\n' + ',\n' * 3000, 't': 'id\n1\n'}, ['JSON'], max_workers=1, chunk_bytes=1024)
+    assert isinstance(results[0][3], ValueError)
+    assert results[1][3] is None
@@ -0,0 +1,86 @@
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from referential_integrity import ForeignKeyAssigner, KeyRegistry
+
+COMPOSITE = [
+    {'child_table': 'line', 'child_column': 'order_region', 'parent_table': 'orders', 'parent_column': 'region',
+     'constraint_name': 'line_order_fk'},
+    {'child_table': 'line', 'child_column': 'order_no', 'parent_table': 'orders', 'parent_column': 'no',
+     'constraint_name': 'line_order_fk'},
+]
+
+
+def registry_of(relationships, table, header, rows):
+    tables = {rel[side] for rel in relationships for side in ('parent_table', 'child_table')}
+    registry = KeyRegistry(relationships, list(tables))
+    registry.collect(table, header, rows)
+    registry.finalize(table)
+    return registry
+
+
+def test_composite_keys_come_from_one_parent_row():
+    parents = [['eu', str(n), f'order {n}'] for n in range(1, 6)] + [['us', str(n), f'order {n}'] for n in range(6, 11)]
+    registry = registry_of(COMPOSITE, 'orders', ['region', 'no', 'name'], parents)
+    assert registry.row_count('orders') == 10
+    assert registry.get('orders', 'no').dtype == np.int64
+
+    header = ['id', 'order_region', 'order_no']
+    rows = [[str(n), '', ''] for n in range(200)]
+    ForeignKeyAssigner(registry, COMPOSITE, seed=1).fill('line', header, rows)
+    # Orders 1 to 5 are in eu and 6 to 10 in us, mixing the columns of two parents would break that
+    pairs = {(region, no) for region, no, _ in parents}
+    assert all((region, no) in pairs for _, region, no in rows)
+    assert {region for _, region, _ in rows} == {'eu', 'us'}
+
+
+def test_integers_beyond_int64_are_kept_as_strings():
+    rels = [{'child_table': 'c', 'child_column': 'p_id', 'parent_table': 'p', 'parent_column': 'id'}]
+    big = '123456789012345678901234567890'
+    registry = registry_of(rels, 'p', ['id'], [[big], ['5']])
+    keys = registry.get('p', 'id')
+    assert keys.dtype.kind == 'U'
+    assert keys.tolist() == [big, '5']
+
+    rows = [['', 'x'] for _ in range(20)]
+    ForeignKeyAssigner(registry, rels, seed=0).fill('c', ['p_id', 'name'], rows)
+    assert {row[0] for row in rows} <= {big, '5'}
+
+
+def test_missing_parent_column_raises():
+    with pytest.raises(ValueError, match="region"):
+        registry_of(COMPOSITE, 'orders', ['no', 'name'], [['1', 'a']])
+
+
+def test_round_robin_continues_across_batches():
+    rels = [{'child_table': 'c', 'child_column': 'p_id', 'parent_table': 'p', 'parent_column': 'id'}]
+    registry = registry_of(rels, 'p', ['id'], [[str(n)] for n in range(1, 4)])
+    assigner = ForeignKeyAssigner(registry, rels, fanout='round_robin')
+    batches = [[[''] for _ in range(4)], [[''] for _ in range(5)]]
+    for rows in batches:
+        assigner.fill('c', ['p_id'], rows)
+    assert Counter(row[0] for rows in batches for row in rows) == {'1': 3, '2': 3, '3': 3}
+
+
+def test_zipf_skews_children_to_few_parents():
+    rels = [{'child_table': 'c', 'child_column': 'p_id', 'parent_table': 'p', 'parent_column': 'id'}]
+    registry = registry_of(rels, 'p', ['id'], [[str(n)] for n in range(100)])
+    rows = [[''] for _ in range(5000)]
+    ForeignKeyAssigner(registry, rels, fanout='zipf', seed=3).fill('c', ['p_id'], rows)
+    counts = sorted(Counter(row[0] for row in rows).values(), reverse=True)
+    assert sum(counts[:10]) > 0.5 * len(rows)
+
+
+def test_parent_without_keys_raises():
+    rels = [{'child_table': 'c', 'child_column': 'p_id', 'parent_table': 'p', 'parent_column': 'id'}]
+    registry = registry_of(rels, 'p', ['id'], [])
+    with pytest.raises(ValueError, match="No keys generated"):
+        ForeignKeyAssigner(registry, rels).fill('c', ['p_id'], [['']])
+    with pytest.raises(ValueError):
+        ForeignKeyAssigner(registry, rels, fanout='pareto')
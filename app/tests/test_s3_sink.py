@@ -0,0 +1,102 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+from s3_sink import MIN_PART_SIZE, S3Sink, split_location
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def client():
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+        client.create_bucket(Bucket='test-data')
+        yield client
+
+
+@pytest.fixture
+def sink(client):
+    sink = S3Sink(client, part_size=MIN_PART_SIZE, max_workers=4, max_in_flight=2)
+    yield sink
+    sink.close()
+
+
+def read(client, key):
+    return client.get_object(Bucket='test-data', Key=key)['Body'].read()
+
+
+def test_split_location():
+    assert split_location('s3://bucket/a/b/') == ('bucket', 'a/b/')
+    assert split_location('s3a://bucket') == ('bucket', '')
+    with pytest.raises(ValueError):
+        split_location('/local/path')
+
+
+def test_large_objects_are_uploaded_in_parts(client, sink):
+    data = os.urandom(12 * MB + 123)
+    with sink.open('s3://test-data/run/', 'big.bin') as upload:
+        for start in range(0, len(data), 777777):
+            upload.write(data[start:start + 777777])
+        assert upload.upload_id is not None
+    assert read(client, 'run/big.bin') == data
+    # Multipart ETags end in the number of parts
+    assert client.head_object(Bucket='test-data', Key='run/big.bin')['ETag'].strip('"').endswith('-3')
+
+
+def test_small_objects_are_put_at_once(client, sink):
+    with sink.open('s3://test-data', 'small.csv') as upload:
+        upload.write(b'id\n1\n')
+        assert upload.upload_id is None
+    assert read(client, 'small.csv') == b'id\n1\n'
+    assert upload.url == 's3://test-data/small.csv'
+
+
+def test_upload_files(client, sink, tmp_path):
+    path = tmp_path / 'orders.csv'
+    path.write_bytes(b'id\n1\n')
+    missing = str(tmp_path / 'missing.csv')
+    results = sink.upload_files([(str(path), 's3://test-data/out/'), (missing, 's3://test-data/out/')])
+    assert results[0] == (str(path), 's3://test-data/out/orders.csv', None)
+    assert isinstance(results[1][2], FileNotFoundError)
+    assert read(client, 'out/orders.csv') == b'id\n1\n'
+
+
+def test_errors_abort_the_upload(client, sink):
+    with pytest.raises(RuntimeError):
+        with sink.open('s3://test-data/run/', 'failed.bin') as upload:
+            upload.write(os.urandom(11 * MB))
+            raise RuntimeError("conversion failed")
+    assert not client.list_multipart_uploads(Bucket='test-data').get('Uploads')
+    assert 'Contents' not in client.list_objects_v2(Bucket='test-data')
+
+
+def test_failed_part_fails_and_aborts_the_upload(client, sink, monkeypatch):
+    upload_part = client.upload_part
+    calls = []
+
+    def failing_upload_part(**options):
+        calls.append(options['PartNumber'])
+        if options['PartNumber'] == 2:
+            raise IOError("connection reset")
+        return upload_part(**options)
+
+    monkeypatch.setattr(client, 'upload_part', failing_upload_part)
+    data = os.urandom(16 * MB)
+    with pytest.raises(IOError):
+        with sink.open('s3://test-data/run/', 'failed.bin') as upload:
+            for start in range(0, len(data), MB):
+                upload.write(data[start:start + MB])
+    assert not client.list_multipart_uploads(Bucket='test-data').get('Uploads')
+    assert 'Contents' not in client.list_objects_v2(Bucket='test-data')
+
+
+def test_parts_smaller_than_the_minimum_are_refused(client):
+    with pytest.raises(ValueError):
+        S3Sink(client, part_size=MB)
@@ -0,0 +1,136 @@
+import io
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shard_generator import ShardedGenerator
+
+
+class Cancelled(Exception):
+    pass
+
+
+def prompt(count, offset):
+    return f"{offset}:{count}"
+
+
+def rows_of(out):
+    lines = out.getvalue().splitlines()
+    return lines[0], sorted(lines[1:])
+
+
+def test_split_rows():
+    assert ShardedGenerator(None, shard_size=4).split_rows(10) == [(0, 4), (4, 4), (8, 2)]
+    with pytest.raises(ValueError):
+        ShardedGenerator(None, shard_size=0)
+
+
+def test_integer_keys_are_renumbered_from_the_shard_offset():
+    # Every shard numbers its rows from 1, as a model would
+    def complete(prompt):
+        offset, count = map(int, prompt.split(':'))
+        return "id,name\n" + "".join(f"{i + 1},n{offset + i}\n" for i in range(count))
+
+    out = io.StringIO()
+    generator = ShardedGenerator(complete, shard_size=3)
+    assert generator.generate(prompt, 7, out, primary_keys={'id': 'INTEGER'}, offset=100) == 7
+    header, rows = rows_of(out)
+    assert header == 'id,name'
+    assert sorted(rows, key=lambda row: int(row.split(',')[0])) == [f"{101 + i},n{100 + i}" for i in range(7)]
+
+
+def test_other_keys_are_deduplicated_across_shards():
+    def complete(prompt):
+        offset, count = map(int, prompt.split(':'))
+        # The second shard repeats a code of the first
+        return {0: "code,name\nA,x\nB,y\n", 2: "code,name\nB,z\nC,w\n"}[offset]
+
+    out = io.StringIO()
+    merged = []
+    generator = ShardedGenerator(complete, shard_size=2, max_workers=1)
+    written = generator.generate(prompt, 4, out, primary_keys={'code': 'varchar'},
+                                 on_rows=lambda header, rows: merged.extend(rows))
+    assert written == 3
+    assert sorted(row[0] for row in merged) == ['A', 'B', 'C']
+    assert len(rows_of(out)[1]) == 3
+
+
+def test_shuffled_columns_and_extra_rows_are_aligned():
+    def complete(prompt):
+        offset, count = map(int, prompt.split(':'))
+        if offset == 0:
+            return "id,name\n1,a\n2,b\n"
+        return "name,id\nc,1\nd,2\ne,3\n"
+
+    out = io.StringIO()
+    ShardedGenerator(complete, shard_size=2, max_workers=1).generate(prompt, 4, out, primary_keys={'id': 'int'})
+    assert rows_of(out) == ('id,name', ['1,a', '2,b', '3,c', '4,d'])
+
+
+def test_failed_shards_are_counted_and_left_out():
+    def complete(prompt):
+        offset, count = map(int, prompt.split(':'))
+        if offset in (2, 6):
+            raise RuntimeError("bad response")
+        return "id\n" + "1\n" * count
+
+    out = io.StringIO()
+    generator = ShardedGenerator(complete, shard_size=2)
+    assert generator.generate(prompt, 8, out, primary_keys={'id': 'bigint'}) == 4
+    assert generator.failed_shards == 2
+    assert rows_of(out) == ('id', ['1', '2', '5', '6'])
+
+
+def test_every_shard_failing_raises():
+    def complete(prompt):
+        raise RuntimeError("unavailable")
+
+    generator = ShardedGenerator(complete, shard_size=2)
+    with pytest.raises(RuntimeError, match="unavailable"):
+        generator.generate(prompt, 6, io.StringIO())
+    assert generator.failed_shards == 3
+
+
+def test_abort_stops_the_shards_not_started():
+    started = []
+    lock = threading.Lock()
+
+    def complete(prompt):
+        with lock:
+            started.append(prompt)
+        if prompt == '2:1':
+            raise Cancelled()
+        return "id\n1\n"
+
+    generator = ShardedGenerator(complete, shard_size=1, max_workers=1, abort_on=(Cancelled,))
+    with pytest.raises(Cancelled):
+        generator.generate(prompt, 100, io.StringIO())
+    # Only the bounded window of shards was ever submitted
+    assert len(started) <= 2 + 2 * generator.max_workers
+    assert generator.failed_shards == 0
+
+
+def test_saved_shards_are_not_requested_again():
+    class Store(dict):
+        def load(self, offset, count):
+            return self.get((offset, count))
+
+        def save(self, offset, count, text):
+            self[(offset, count)] = text
+
+    store = Store({(0, 2): "id\n1\n2\n"})
+    requested = []
+
+    def complete(prompt):
+        requested.append(prompt)
+        return "id\n1\n2\n"
+
+    out = io.StringIO()
+    ShardedGenerator(complete, shard_size=2, store=store).generate(prompt, 4, out, primary_keys={'id': 'integer'})
+    assert requested == ['2:2']
+    assert set(store) == {(0, 2), (2, 2)}
+    assert rows_of(out) == ('id', ['1', '2', '3', '4'])
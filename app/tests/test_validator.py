@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validator import TableValidator
+
+SCHEMA = [('id', 'integer', 'NO', None, 'PRIMARY KEY'), ('created_at', 'timestamp with time zone', 'YES', None, None)]
+
+
+def test_timestamps_with_mixed_offsets_are_valid():
+    validator = TableValidator('events', SCHEMA, target=4)
+    rows = [['1', '2024-01-01 10:00+01'], ['2', '2024-06-01 10:00+02'], ['3', '2024-03-31 01:30:00-05:00'], ['4', '']]
+    assert validator.check(['id', 'created_at'], rows) == rows
+    assert validator.summary()['rejected'] == {}
+
+
+def test_unparseable_timestamps_are_rejected_with_mixed_offsets():
+    validator = TableValidator('events', SCHEMA, target=3)
+    rows = [['1', '2024-01-01 10:00+01'], ['2', 'not a date'], ['3', '2024-06-01 10:00+02']]
+    assert validator.check(['id', 'created_at'], rows) == [rows[0], rows[2]]
+    assert validator.summary()['rejected'] == {'type': 1}
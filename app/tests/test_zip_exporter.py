@@ -0,0 +1,64 @@
+import os
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zip_exporter import ZipExporter
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    exporter = ZipExporter(max_workers=4, spool_size=1024, directory=str(tmp_path))
+    yield exporter
+    exporter.cleanup()
+
+
+def test_members_round_trip(exporter):
+    members = {
+        'orders.csv': b'id,amount\n' + b''.join(b'%d,%d.50\n' % (i, i) for i in range(50000)),
+        'empty.csv': b'',
+        'kunden_übersicht_日本.json': '[{"name": "Jürgen"}]'.encode('utf-8'),
+    }
+    for name, data in members.items():
+        exporter.add(name, data)
+    with zipfile.ZipFile(exporter.finish()) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == list(members)
+        for name, data in members.items():
+            assert archive.read(name) == data
+        assert archive.getinfo('orders.csv').compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_member_written_in_parts(exporter):
+    with exporter.member('streamed.csv') as content:
+        for i in range(1000):
+            content.write(b'%d\n' % i)
+    with zipfile.ZipFile(exporter.finish()) as archive:
+        assert archive.read('streamed.csv') == b''.join(b'%d\n' % i for i in range(1000))
+
+
+def test_failed_member_is_left_out(exporter):
+    with pytest.raises(RuntimeError):
+        with exporter.member('failed.csv') as content:
+            content.write(b'partial')
+            raise RuntimeError("conversion failed")
+    exporter.add('ok.csv', b'id\n1\n')
+    with zipfile.ZipFile(exporter.finish()) as archive:
+        assert archive.namelist() == ['ok.csv']
+
+
+def test_more_than_65535_members_use_the_zip64_end_record(exporter):
+    count = 0xFFFF + 100
+    for i in range(count):
+        exporter.add(f'part_{i}.csv', b'%d\n' % i)
+    path = exporter.finish()
+    with open(path, 'rb') as f:
+        assert b'PK\x06\x06' in f.read()[-200:]
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        names = archive.namelist()
+        assert len(names) == count and names[-1] == f'part_{count - 1}.csv'
+        assert archive.read(f'part_{count - 1}.csv') == b'%d\n' % (count - 1)
@@ -0,0 +1,186 @@
+import re
+import threading
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Reasons a row is rejected, in the order they are checked
+CHECKS = ('not_null', 'type', 'primary_key', 'foreign_key', 'excess')
+INTEGER_RANGES = {
+    'smallint': 2 ** 15, 'integer': 2 ** 31, 'bigint': 2 ** 63,
+    'int2': 2 ** 15, 'int4': 2 ** 31, 'int8': 2 ** 63, 'int': 2 ** 31,
+    'serial': 2 ** 31, 'bigserial': 2 ** 63, 'smallserial': 2 ** 15,
+}
+FLOAT_TYPES = ('real', 'double precision', 'float4', 'float8', 'money')
+BOOLEAN_VALUES = {'t', 'f', 'true', 'false', 'y', 'n', 'yes', 'no', 'on', 'off', '1', '0'}
+INTEGER_PATTERN = r'[+-]?\d+'
+UUID_PATTERN = r'\{?[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}\}?'
+TIME_PATTERN = r'\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?\s*([+-]\d{2}(:?\d{2})?|Z)?'
+# numeric(precision, scale), character varying(length), character(length)
+NUMERIC_TYPE = re.compile(r'^(?:numeric|decimal)\((\d+)(?:,\s*(\d+))?\)$')
+LENGTH_TYPE = re.compile(r'^(?:character varying|varchar|character|char|bpchar)\((\d+)\)$')
+
+
+def align_rows(header, row_header, rows):
+    """Reorder rows written with ``row_header`` to ``header``, padding or cutting them to its length."""
+    if row_header == header or sorted(row_header) != sorted(header):
+        return [row[:len(header)] + [''] * (len(header) - len(row)) for row in rows]
+    index = [row_header.index(column) for column in header]
+    return [[row[i] if i < len(row) else '' for i in index] for row in rows]
+
+
+class TableValidator:
+    """Check batches of generated rows of one table against its introspected schema.
+
+    A batch is turned into a DataFrame of strings and checked column by column: values of NOT NULL
+    columns must be present, values must parse as the column's type (integer ranges, numeric
+    precision, booleans, dates, times, UUIDs and character lengths), primary keys must be unique
+    within the batch and against every earlier batch, and foreign keys to generated parent tables
+    must exist in ``key_registry``. Rows beyond ``target`` are dropped too. ``check`` returns the
+    valid rows; ``missing`` is the number of rows still needed and ``summary`` counts the rejected
+    rows by their first failed check.
+    """
+
+    def __init__(self, table: str, schema: List[tuple], target: int, relationships: List[Dict] = None, key_registry=None):
+        self.table = table
+        self.schema = schema
+        self.target = target
+        self.required = [column[0] for column in schema if column[2] == 'NO']
+        self.types = {column[0]: (column[1] or '').lower() for column in schema}
+        self.primary_keys = [column[0] for column in schema if column[4] == 'PRIMARY KEY']
+        self.foreign_keys = [rel for rel in relationships or [] if rel['child_table'] == table]
+        self.key_registry = key_registry
+        self.seen_keys = set()
+        self.valid = 0
+        self.checked = 0
+        self.rejected = {check: 0 for check in CHECKS}
+        self.lock = threading.Lock()
+
+    @property
+    def missing(self):
+        return max(0, self.target - self.valid)
+
+    def check(self, header: List[str], rows: List[List[str]]) -> List[List[str]]:
+        """Return the valid rows of a batch, in their order."""
+        if not rows:
+            return rows
+        width = len(header)
+        columns = zip(*(row[:width] + [''] * (width - len(row)) for row in rows))
+        df = pd.DataFrame({column: pd.Series(values, dtype=object).str.strip() for column, values in zip(header, columns)})
+        # Index into CHECKS + 1 of the first check a row failed, 0 for valid rows
+        reasons = np.zeros(len(rows), dtype=np.int8)
+
+        def reject(mask, check):
+            reasons[(reasons == 0) & mask] = CHECKS.index(check) + 1
+
+        for column in self.required:
+            # A missing column is NULL for every row
+            reject((df[column] == '').to_numpy() if column in df else np.ones(len(rows), dtype=bool), 'not_null')
+        for column in header:
+            if column in self.types:
+                reject(self._type_errors(df[column], self.types[column]), 'type')
+        for rel in self.foreign_keys:
+            if rel['child_column'] in df and self.key_registry is not None \
+                    and self.key_registry.has_keys(rel['parent_table'], rel['parent_column']):
+                reject(self._unknown_keys(df[rel['child_column']], self.key_registry.get(rel['parent_table'], rel['parent_column'])),
+                       'foreign_key')
+
+        keys = self._keys(df) if self.primary_keys and all(column in df for column in self.primary_keys) else None
+        with self.lock:
+            # Keys and the row count are shared state of the table, batches may arrive from several shards
+            if keys is not None:
+                # Set lookups per key, converting the set of all earlier keys per batch would be quadratic
+                seen = np.fromiter((key in self.seen_keys for key in keys), dtype=bool, count=len(keys))
+                reject(pd.Series(keys).duplicated().to_numpy() | seen, 'primary_key')
+            valid = reasons == 0
+            room = self.target - self.valid
+            if valid.sum() > room:
+                excess = np.flatnonzero(valid)[max(room, 0):]
+                reasons[excess] = CHECKS.index('excess') + 1
+                valid[excess] = False
+            if keys is not None:
+                self.seen_keys.update(keys[valid])
+            self.valid += int(valid.sum())
+            self.checked += len(rows)
+            for code, count in zip(*np.unique(reasons[~valid], return_counts=True)):
+                self.rejected[CHECKS[code - 1]] += int(count)
+        return [row for row, ok in zip(rows, valid) if ok]
+
+    def _keys(self, df):
+        values = df[self.primary_keys[0]]
+        for column in self.primary_keys[1:]:
+            values = values.str.cat(df[column], sep='\x1f')
+        return values.to_numpy(dtype=object)
+
+    def _unknown_keys(self, values, parent_keys):
+        """Mask of present values that aren't among the parent's keys."""
+        present = (values != '').to_numpy()
+        if parent_keys.dtype.kind in 'iu':
+            numbers = pd.to_numeric(values.where(values.str.fullmatch(INTEGER_PATTERN)), errors='coerce')
+            known = np.isin(numbers.to_numpy(dtype=float, na_value=np.nan), parent_keys)
+        else:
+            known = np.isin(values.to_numpy(dtype=str), parent_keys)
+        return present & ~known
+
+    def _type_errors(self, values, data_type):
+        """Mask of present values that don't parse as ``data_type``; unknown types always pass."""
+        present = values != ''
+        if data_type.endswith('[]') or not present.any():
+            return np.zeros(len(values), dtype=bool)
+        if data_type in INTEGER_RANGES:
+            numbers = pd.to_numeric(values.where(values.str.fullmatch(INTEGER_PATTERN)), errors='coerce')
+            limit = INTEGER_RANGES[data_type]
+            ok = numbers.notna() & (numbers >= -limit) & (numbers < limit)
+        elif data_type.startswith(('numeric', 'decimal')) or data_type in FLOAT_TYPES:
+            numbers = pd.to_numeric(values.str.replace(r'^\$', '', regex=True), errors='coerce')
+            ok = numbers.notna()
+            precision = NUMERIC_TYPE.match(data_type)
+            if precision:
+                digits = int(precision.group(1)) - int(precision.group(2) or 0)
+                ok &= numbers.abs() < 10.0 ** digits
+        elif data_type in ('boolean', 'bool'):
+            ok = values.str.lower().isin(BOOLEAN_VALUES)
+        elif data_type == 'date' or data_type.startswith('timestamp'):
+            ok = self._parse_datetimes(values).notna()
+        elif data_type.startswith('time'):
+            ok = values.str.fullmatch(TIME_PATTERN).fillna(False)
+        elif data_type == 'uuid':
+            ok = values.str.fullmatch(UUID_PATTERN).fillna(False)
+        else:
+            length = LENGTH_TYPE.match(data_type)
+            if not length:
+                return np.zeros(len(values), dtype=bool)
+            ok = values.str.len() <= int(length.group(1))
+        return (present & ~ok.astype(bool)).to_numpy()
+
+    def _parse_datetimes(self, values):
+        # Only whether a value parses matters, so every value is read as UTC: batches of
+        # timestamptz values crossing DST have different offsets, which pandas can't mix otherwise
+        try:
+            parsed = pd.to_datetime(values, errors='coerce', format='ISO8601', utc=True)
+            failed = parsed.isna() & (values != '')
+            if failed.any():
+                # Postgres also reads dates like 'Jan 5 2024' or '05/01/2024'
+                parsed[failed] = pd.to_datetime(values[failed], errors='coerce', format='mixed', utc=True)
+            return parsed
+        except (TypeError, ValueError):
+            pass
+        try:
+            # pandas before 2.0 has neither format, it infers the format per value
+            return pd.to_datetime(values, errors='coerce', utc=True)
+        except (TypeError, ValueError, OverflowError):
+            # A value that can't be parsed at all is invalid rather than failing the whole batch
+            return pd.Series([self._parse_datetime(value) for value in values], index=values.index)
+
+    def _parse_datetime(self, value):
+        try:
+            return pd.to_datetime(value, utc=True)
+        except (TypeError, ValueError, OverflowError):
+            return pd.NaT
+
+    def summary(self) -> Dict:
+        """Target and valid row count, rows checked and rejected rows per check."""
+        with self.lock:
+            return {'target': self.target, 'valid': self.valid, 'checked': self.checked,
+                    'rejected': {check: count for check, count in self.rejected.items() if count}}
@@ -0,0 +1,157 @@
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+CHUNK_SIZE = 1024 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+# UTF-8 file names
+FLAG_UTF8 = 0x0800
+
+
+class _Member:
+    def __init__(self, name):
+        self.name = name
+        self.crc = 0
+        self.size = 0
+        self.compressed_size = 0
+        self.compressed = None
+        self.offset = 0
+
+
+class ZipExporter:
+    """Build a ZIP archive on disk from members compressed in parallel.
+
+    Every member is written to a spooled temporary file, which only moves to disk once it grows
+    beyond ``spool_size``. When a member is closed it is deflated on a worker thread (zlib
+    releases the GIL, so members really compress in parallel) into another temporary file.
+    ``finish`` then writes the archive, ZIP64 included, by copying the compressed members in
+    chunks, so memory stays bounded by the spool size and worker count, not the dataset size.
+    """
+
+    def __init__(self, max_workers: int = 4, spool_size: int = 8 * 1024 * 1024, compresslevel: int = 6, directory: str = None):
+        self.spool_size = spool_size
+        self.compresslevel = compresslevel
+        self.directory = directory
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self.futures = []
+        self.lock = threading.Lock()
+        self.path = None
+
+    def open_member(self):
+        """Return a binary file to write one member's content into."""
+        return tempfile.SpooledTemporaryFile(max_size=self.spool_size, dir=self.directory)
+
+    def close_member(self, content, name):
+        """Schedule compression of a member written to a file from ``open_member``."""
+        with self.lock:
+            self.futures.append(self.executor.submit(self._compress, content, name))
+
+    @contextmanager
+    def member(self, name):
+        content = self.open_member()
+        try:
+            yield content
+        except BaseException:
+            content.close()
+            raise
+        self.close_member(content, name)
+
+    def add(self, name, data: bytes):
+        with self.member(name) as content:
+            content.write(data)
+
+    def finish(self):
+        """Wait for all members and write the archive; returns its path on disk."""
+        with self.lock:
+            futures, self.futures = self.futures, []
+        members = [future.result() for future in futures]
+        self.executor.shutdown()
+
+        fd, self.path = tempfile.mkstemp(suffix='.zip', dir=self.directory)
+        dos_time, dos_date = self._dos_datetime()
+        with os.fdopen(fd, 'wb') as archive:
+            for member in members:
+                member.offset = archive.tell()
+                archive.write(self._local_header(member, dos_time, dos_date))
+                member.compressed.seek(0)
+                shutil.copyfileobj(member.compressed, archive, CHUNK_SIZE)
+                member.compressed.close()
+
+            directory_offset = archive.tell()
+            for member in members:
+                archive.write(self._central_header(member, dos_time, dos_date))
+            directory_size = archive.tell() - directory_offset
+            archive.write(self._end_records(len(members), directory_offset, directory_size, archive.tell()))
+        return self.path
+
+    def cleanup(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _compress(self, content, name):
+        member = _Member(name)
+        member.compressed = tempfile.SpooledTemporaryFile(max_size=self.spool_size, dir=self.directory)
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15)
+        try:
+            content.seek(0)
+            while True:
+                chunk = content.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                member.crc = zlib.crc32(chunk, member.crc)
+                member.size += len(chunk)
+                member.compressed.write(compressor.compress(chunk))
+            member.compressed.write(compressor.flush())
+            member.compressed_size = member.compressed.tell()
+        finally:
+            content.close()
+        return member
+
+    def _dos_datetime(self):
+        now = time.localtime()
+        dos_time = (now.tm_hour << 11) | (now.tm_min << 5) | (now.tm_sec // 2)
+        dos_date = ((now.tm_year - 1980) << 9) | (now.tm_mon << 5) | now.tm_mday
+        return dos_time, dos_date
+
+    def _local_header(self, member, dos_time, dos_date):
+        name = member.name.encode('utf-8')
+        zip64 = member.size >= ZIP64_LIMIT or member.compressed_size >= ZIP64_LIMIT
+        extra = struct.pack('<HHQQ', 0x0001, 16, member.size, member.compressed_size) if zip64 else b''
+        return struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, 45 if zip64 else 20, FLAG_UTF8, zlib.DEFLATED, dos_time, dos_date,
+            member.crc, ZIP64_LIMIT if zip64 else member.compressed_size, ZIP64_LIMIT if zip64 else member.size,
+            len(name), len(extra)
+        ) + name + extra
+
+    def _central_header(self, member, dos_time, dos_date):
+        name = member.name.encode('utf-8')
+        zip64_fields = []
+        size, compressed_size, offset = member.size, member.compressed_size, member.offset
+        if size >= ZIP64_LIMIT or compressed_size >= ZIP64_LIMIT:
+            zip64_fields += [size, compressed_size]
+            size = compressed_size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            zip64_fields.append(offset)
+            offset = ZIP64_LIMIT
+        extra = struct.pack(f'<HH{len(zip64_fields)}Q', 0x0001, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b''
+        version = 45 if zip64_fields else 20
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version, FLAG_UTF8, zlib.DEFLATED, dos_time, dos_date,
+            member.crc, compressed_size, size, len(name), len(extra), 0, 0, 0, 0o100644 << 16, offset
+        ) + name + extra
+
+    def _end_records(self, count, directory_offset, directory_size, position):
+        records = b''
+        if count > 0xFFFF or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+            records += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, directory_size, directory_offset)
+            records += struct.pack('<IIQI', 0x07064b50, 0, position, 1)
+            count = min(count, 0xFFFF)
+            directory_offset = min(directory_offset, ZIP64_LIMIT)
+            directory_size = min(directory_size, ZIP64_LIMIT)
+        return records + struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, directory_size, directory_offset, 0)